@@ -1,5 +1,15 @@
+#
+# Converts every image of a directory to the size of the kitti images (see GtaView.transformImageForKittiDataset).
+# The images are converted in parallel by a pool of threads (opencv releases the GIL while it decodes, resizes and encodes).
+#
+# Usage: python ConvertImageToKittiSize.py [images directory] [output directory] [number of threads]
+#
 from GtaView import GtaView
+from concurrent.futures import ThreadPoolExecutor
+import os
 import os.path
+import sys
+import time
 
 # path to directory only containng image files
 imagesDir = "/home/jota/Documents/UA/TAA/images_t2/"
@@ -7,14 +17,50 @@ imagesDir = "/home/jota/Documents/UA/TAA/images_t2/"
 # dont use the same directory as the input!
 outputpath = '/home/jota/Documents/UA/TAA/logs_t2/v11/'
 
-for subdir, dirs, files in os.walk(imagesDir):
-    for filename in files:
-        view = GtaView(imagesDir, filename)
+def convertImage(imagesDir, filename, outputDir):
+    '''
+    Converts an image and saves it in outputDir with the same name.
+    Returns:
+        - None, or the error message if the image could not be converted
+    '''
+    try:
+        with GtaView(imagesDir, filename) as view:
+            view.transformImageForKittiDataset(kittiImageOutputDir = outputDir)
+    except Exception as e:
+        return str(e)
+    return None
 
-        view.transformImageForKittiDataset(kittiImageOutputDir = outputpath)
+def convertImages(imagesDir, outputDir, nThreads = None):
+    '''
+    Converts every file of imagesDir (not its subdirectories).
+    Arguments:
+        - nThreads: number of images converted at the same time (None = number of CPUs)
+    Returns:
+        - number of converted images
+    '''
+    if os.path.exists(outputDir) and os.path.samefile(imagesDir, outputDir):
+        raise ValueError("the output directory must not be the images directory: " + outputDir)
+    os.makedirs(outputDir, exist_ok=True)
 
+    filenames = sorted(fn for fn in os.listdir(imagesDir) if os.path.isfile(os.path.join(imagesDir, fn)))
 
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=nThreads) as executor:
+        errors = list(executor.map(lambda fn: convertImage(imagesDir, fn, outputDir), filenames))
+    elapsed = time.perf_counter() - start
 
+    for filename, error in zip(filenames, errors):
+        if error is not None:
+            print("Could not convert " + filename + ": " + error)
 
+    nConverted = sum(1 for error in errors if error is None)
+    print("Converted " + str(nConverted) + " of " + str(len(filenames)) + " images in " + "%.2f" % elapsed + " s ("
+        + "%.1f" % (nConverted / max(elapsed, 1e-9)) + " images/s)")
+    return nConverted
 
+if __name__ == "__main__":
+    imagesDir = sys.argv[1] if len(sys.argv) > 1 else imagesDir
+    outputpath = sys.argv[2] if len(sys.argv) > 2 else outputpath
+    nThreads = int(sys.argv[3]) if len(sys.argv) > 3 else None
 
+    convertImages(imagesDir, outputpath, nThreads)
@@ -0,0 +1,144 @@
+import os
+import os.path
+import json
+import time
+import hashlib
+
+class ExportManifest:
+    '''
+    Record of the kitti export, stored as a json file in the kitti output directory.
+    For each sample directory it keeps the hash of its source files, the kitti id assigned to it and the status of its export:
+        - "pending": the export started but did not finish (ex: the run was interrupted), so its output files may be incomplete
+        - "exported": the kitti files of the sample were written
+        - "no vehicles": the sample has no vehicles in the front view, so no kitti files were written
+        - "failed": the export raised an error; its output files were removed
+    A sample directory keeps its kitti id while it exists, so the next runs only export the new or changed samples.
+    '''
+
+    # name of the manifest file in the kitti output directory
+    manifestFn = "export_manifest.json"
+    # statuses of the samples that don't need to be exported again while their source files don't change
+    doneStatuses = ("exported", "no vehicles")
+    # minimum number of seconds between two saves of the manifest while the samples are exported
+    saveInterval = 2.0
+
+    def __init__(self, outputRootDir):
+        '''
+        Loads the manifest of an output directory, or creates an empty one.
+        '''
+        self.manifestPath = os.path.join(outputRootDir, self.manifestFn)
+
+        # dict with an entry {"id", "hash", "sources", "status"} per sample directory name
+        self.entries = {}
+        # kitti id of the next new sample
+        self.nextId = 0
+        self.lastSaveTime = 0
+
+        try:
+            with open(self.manifestPath) as f:
+                manifest = json.load(f)
+            self.entries = manifest["samples"]
+            self.nextId = manifest["next_id"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self, force = True):
+        '''
+        Writes the manifest into a temporary file that replaces the previous one, so a crash never leaves a broken manifest.
+        Arguments:
+            - force: if False, the manifest is only written if saveInterval seconds have passed since the last save
+        '''
+        if not force and time.time() - self.lastSaveTime < self.saveInterval:
+            return
+
+        os.makedirs(os.path.dirname(self.manifestPath) or '.', exist_ok=True)
+        tmpPath = self.manifestPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump({"next_id": self.nextId, "samples": self.entries}, f, indent=1)
+        os.replace(tmpPath, self.manifestPath)
+        self.lastSaveTime = time.time()
+
+    def hashFile(self, filePath, chunkSize = 4 * 1024**2):
+        sha1 = hashlib.sha1()
+        with open(filePath, "rb") as f:
+            for chunk in iter(lambda: f.read(chunkSize), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def getSourcesInfo(self, dirName, sampleDirPath, sourceFns):
+        '''
+        Size, modification time and hash of the source files of a sample. Files with the same size and
+        modification time as recorded in the manifest are not read again.
+        Returns:
+            - list of dicts {"name", "size", "mtime_ns", "sha1"}, and the hash of all the source files
+        '''
+        cachedSources = {}
+        if dirName in self.entries:
+            cachedSources = {source["name"]: source for source in self.entries[dirName]["sources"]}
+
+        sources = []
+        sampleHash = hashlib.sha1()
+        for fn in sourceFns:
+            filePath = os.path.join(sampleDirPath, fn)
+            if not os.path.exists(filePath):
+                # a missing file is part of the content too; the export reports the error
+                sources.append({"name": fn, "size": -1, "mtime_ns": 0, "sha1": ""})
+                continue
+
+            stat = os.stat(filePath)
+            cached = cachedSources.get(fn)
+            if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+                sha1 = cached["sha1"]
+            else:
+                sha1 = self.hashFile(filePath)
+            sources.append({"name": fn, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": sha1})
+
+        for source in sources:
+            sampleHash.update((source["name"] + ":" + source["sha1"] + "\n").encode("utf-8"))
+
+        return sources, sampleHash.hexdigest()
+
+    def isUpToDate(self, dirName, sampleHash):
+        '''
+        Checks if a sample was already exported from the same source files.
+        '''
+        entry = self.entries.get(dirName)
+        return entry is not None and entry["hash"] == sampleHash and entry["status"] in self.doneStatuses
+
+    def getId(self, dirName):
+        '''
+        Returns:
+            - kitti id of the sample directory, a new one if the directory is not in the manifest
+        '''
+        if dirName in self.entries:
+            return self.entries[dirName]["id"]
+
+        sampleId = self.nextId
+        self.nextId += 1
+        self.entries[dirName] = {"id": sampleId, "hash": "", "sources": [], "status": "pending"}
+        return sampleId
+
+    def setStatus(self, dirName, status, sampleHash = None, sources = None):
+        entry = self.entries[dirName]
+        entry["status"] = status
+        if sampleHash is not None:
+            entry["hash"] = sampleHash
+        if sources is not None:
+            entry["sources"] = sources
+
+    def getRemovedDirs(self, sampleDirs):
+        '''
+        Returns:
+            - names of the sample directories in the manifest that no longer exist
+        '''
+        sampleDirs = set(sampleDirs)
+        return [dirName for dirName in self.entries if dirName not in sampleDirs]
+
+    def removeEntry(self, dirName):
+        return self.entries.pop(dirName)
+
+    def getStatusCounts(self):
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
@@ -0,0 +1,175 @@
+import time
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+class SamplePrefetcher:
+    '''
+    Reader stage of the export: a thread that loads the next samples while the current one is processed.
+    At most depth loaded samples wait in the queue; the thread blocks when it's full (backpressure).
+    Usage:
+        for job, sampleArrays, error in SamplePrefetcher(jobs, loadFn, depth):
+            ...
+    '''
+
+    def __init__(self, jobs, loadFn, depth = 2):
+        '''
+        Arguments:
+            - jobs: list of jobs (ex: (sample directory name, kitti id))
+            - loadFn: function that receives a job and returns its loaded data; it runs in the reader thread
+            - depth: maximum number of loaded samples waiting to be processed
+        '''
+        self.jobs = jobs
+        self.loadFn = loadFn
+        self.queue = queue.Queue(maxsize=max(1, depth))
+
+        # seconds spent loading, seconds the reader waited for space in the queue and seconds the consumer waited for a sample
+        self.busySeconds = 0.0
+        self.blockedSeconds = 0.0
+        self.starvedSeconds = 0.0
+
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="SamplePrefetcher", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for job in self.jobs:
+            start = time.perf_counter()
+            try:
+                item = (job, self.loadFn(job), None)
+            except Exception:
+                # the error is reported by the consumer, as part of the sample
+                item = (job, None, traceback.format_exc())
+            loaded = time.perf_counter()
+            self.busySeconds += loaded - start
+
+            if not self.put(item):
+                return
+            self.blockedSeconds += time.perf_counter() - loaded
+
+        self.put(None)
+
+    def put(self, item):
+        '''
+        Waits for space in the queue, unless the consumer stopped.
+        '''
+        while not self.stopEvent.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self.queue.get()
+                self.starvedSeconds += time.perf_counter() - start
+                if item is None:
+                    return
+                yield item
+        finally:
+            self.stopEvent.set()
+
+class WriterPool:
+    '''
+    Writer stage of the export: a pool of threads that encode and write the output files.
+    At most maxPending writes wait or run at a time; submitting blocks when that limit is reached (backpressure).
+    '''
+
+    def __init__(self, nThreads = 4, maxPending = 32):
+        self.nThreads = nThreads
+        self.executor = ThreadPoolExecutor(max_workers=nThreads, thread_name_prefix="WriterPool")
+        self.slots = threading.BoundedSemaphore(maxPending)
+        self.lock = threading.Lock()
+
+        # seconds spent writing (summed over the threads), and seconds the submitters waited for a free slot
+        self.busySeconds = 0.0
+        self.blockedSeconds = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        '''
+        Runs fn(*args, **kwargs) in a writer thread.
+        Returns:
+            - Future of the call
+        '''
+        start = time.perf_counter()
+        self.slots.acquire()
+        self.blockedSeconds += time.perf_counter() - start
+
+        try:
+            return self.executor.submit(self.runWrite, fn, args, kwargs)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def runWrite(self, fn, args, kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.busySeconds += time.perf_counter() - start
+            self.slots.release()
+
+    def createBatch(self):
+        return WriteBatch(self)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+class WriteBatch:
+    '''
+    Writes of a single sample, submitted to a WriterPool. It is called like the write function itself:
+        writes(saveFn, arg1, arg2, ...)
+    '''
+
+    def __init__(self, writerPool):
+        self.writerPool = writerPool
+        self.futures = []
+
+    def __call__(self, fn, *args, **kwargs):
+        self.futures.append(self.writerPool.submit(fn, *args, **kwargs))
+
+    def isDone(self):
+        return all(future.done() for future in self.futures)
+
+    def getError(self):
+        '''
+        Waits for the writes to finish.
+        Returns:
+            - traceback of the first write that failed, or None
+        '''
+        for future in self.futures:
+            error = future.exception()
+            if error is not None:
+                return "".join(traceback.format_exception(type(error), error, error.__traceback__))
+        return None
+
+def writeNow(fn, *args, **kwargs):
+    '''
+    Write function that runs the write in the calling thread.
+    '''
+    return fn(*args, **kwargs)
+
+def getUtilizationReport(wallSeconds, prefetcher, computeSeconds, writerPool):
+    '''
+    Arguments:
+        - computeSeconds: seconds spent processing the samples in the compute stage
+    Returns:
+        - text with the fraction of the wall time that each stage was busy, and how long the stages waited for each other
+    '''
+    def percentage(seconds, n = 1):
+        return "%.0f%%" % (100.0 * seconds / max(wallSeconds * n, 1e-9))
+
+    # computeSeconds includes the time that the compute stage waited to submit writes
+    computeSeconds = max(computeSeconds - writerPool.blockedSeconds, 0.0)
+
+    return ("Pipeline utilization (" + "%.2f" % wallSeconds + " s):\n"
+        + "    load:    " + percentage(prefetcher.busySeconds) + " busy, " + "%.2f" % prefetcher.blockedSeconds + " s waiting for compute\n"
+        + "    compute: " + percentage(computeSeconds) + " busy, " + "%.2f" % prefetcher.starvedSeconds + " s waiting for load, "
+            + "%.2f" % writerPool.blockedSeconds + " s waiting for write\n"
+        + "    write:   " + percentage(writerPool.busySeconds, writerPool.nThreads) + " busy (" + str(writerPool.nThreads) + " threads)")
@@ -4,10 +4,17 @@ import numpy as np
 import random
 import cv2
 import os.path
+import logging
 import numpy as np
 from GtaView import GtaView
 from PcRaw import PcRaw
 from PcLabeledObject import PcLabeledObject
+from PcColumns import PcColumns
+from PlyFile import createVertexArray, writePly
+from VehicleRecords import loadVehicleRecords
+from Instrumentation import stageTimers
+
+log = logging.getLogger(__name__)
 
 class GtaSample:
     '''
@@ -37,26 +44,47 @@ class GtaSample:
 
     ##### Data structures for holding point cloud information ######
 
-    # PcRaw instance containing all the raw point cloud information
-    pcData = None
-    # PcRaw instance containing all the points that are projected onto the front view image
-    pcFvData = None
-    # GtaView instance
-    imageView = None
-
-    def __init__(self, sampleDirPath):
+    # every other attribute is per instance; __slots__ keeps the instances compact and prevents state shared between samples
+    __slots__ = (
+        'directory_path',
+        # camera (character) rotation around the z axis as stored in the rotation file, the rotation used to align the point cloud, and the camera forward vector
+        'rawCamRotation',
+        'camRotation',
+        'camForwardDir',
+
+        # PcColumns instance with the per-point arrays (xyz, proj_x, proj_y, view_id, label, detailed_label) loaded from the sample files
+        'pcColumns',
+        # PcRaw instance containing all the raw point cloud information
+        'pcData',
+        # PcRaw instance containing all the points that are projected onto the front view image
+        'pcFvData',
+        # GtaView instance
+        'imageView',
+        # structured array with the records of the vehicles file, parsed the first time it's needed (see getVehicleRecords)
+        'vehicleRecords',
+    )
+
+    def __init__(self, sampleDirPath, sampleCache = None, sampleArrays = None):
         '''
         Constructor
         Arguments:
         - sample_directory_path: path to the directory where the ppoint cloud sample files are located
-        - character_rotation: rotation (in degrees) of the in-game character when the lidar scanner happened
+        - sampleCache: optional SampleCache instance; if given, the sample files are only parsed the first time and
+          memory-mapped from the binary cache in the next runs
+        - sampleArrays: optional arrays of the sample files already loaded by loadSampleArrays (ex: by a prefetch thread)
         '''
 
         self.directory_path = sampleDirPath
+        self.vehicleRecords = None
+
+        # arrays with the content of the sample files
+        if sampleArrays is None:
+            sampleArrays = GtaSample.loadSampleArrays(sampleDirPath, sampleCache)
 
-        rotationFIleLine = self.loadTxtFileIntoStrList(self.rotationFn)
-        self.rawCamRotation = float(rotationFIleLine[0].split(' ')[2])
-        self.camForwardDir = np.array([float(rotationFIleLine[0].split(' ')[3]), float(rotationFIleLine[0].split(' ')[4]), float(rotationFIleLine[0].split(' ')[5])])
+        # rotation file values: ? ? camRotZ camForwardX camForwardY camForwardZ
+        rotationValues = sampleArrays["rotation"]
+        self.rawCamRotation = float(rotationValues[2])
+        self.camForwardDir = np.array([float(rotationValues[3]), float(rotationValues[4]), float(rotationValues[5])])
 
         if self.rawCamRotation < 0:
             self.rawCamRotation = 180 + (180 + self.rawCamRotation)
@@ -65,30 +93,109 @@ class GtaSample:
         # get Z rotation of the camera (character) stored in file
         self.camRotation = - (self.rawCamRotation) - 90
 
-        self.imageView = GtaView(sampleDirPath, self.fvImgFn)
+        # the front view is projected onto the kitti camera image
+        with stageTimers.stage("project"):
+            self.imageView = GtaView(sampleDirPath, self.fvImgFn, image = sampleArrays["fv_image"])
 
         #### Core calculations over the point cloud ####
 
-        # tuple list with all the points of the point cloud, each point is a tuple (x, y, z)
-        originalPc = self.loadPlyFileIntoTupleList(self.pcPlyFn)
+        # positions, projected coords + view index, labels and detailed labels of every point.
+        # The positions are taken from the projected points file, so the .ply file with the same coordinates is not parsed
+        self.pcColumns = PcColumns(sampleArrays["xyz"], sampleArrays["projected"], sampleArrays["label"], sampleArrays["detailed_label"])
 
-        # load list of integers with the labels (background (0), pedestrian (1), vehicle (2), game props (3))
-        pointLabels = self.loadTxtFileIntoIntList(self.pcLabelsFn)
+        originalPc = self.pcColumns.xyz
+        pointLabels = self.pcColumns.label
+        pointLabelsDetailed = self.pcColumns.detailed_label
+        # (N, 3) array of (projx, projy, view_index)
+        pointProjections = self.pcColumns.projected
 
-        # load list of integers with detailed labels, i.e., each point is associated to the id of the correspondent object
-        pointLabelsDetailed = self.loadTxtFileIntoIntList(self.pcLabelsDetailedFn)
+        self.pcData = PcRaw(originalPc, pointLabels, pointLabelsDetailed, pointProjections, camRot=self.camRotation, pcName="Original")
 
-        # load file with the points + projected coords and view index
-        pointProjections = self.loadTxtFileIntoTupleFloatList(self.pcProjectedPointsFn, [3, 4, 5], [0, 1, 2])   # 3, 4, 5 correspond to integer values of projx, projy, view_index
+        # point cloud with only the points that are projected onto the first view (index 0), sharing the arrays of pcData
+        self.pcFvData = self.pcData.createSubset(self.createViewMask(0, orientedToXdirection=True), pcName="Front view")
 
-        self.pcData = PcRaw(originalPc, pointLabels, pointLabelsDetailed, pointProjections, camRot=self.camRotation, debugMode=True, pcName="Original")
 
-        # eliminate all points that are not projected onto the first view (index 0) and store the remaining points in a list of tuples
-        frontviewPc, fvPcLabels, fvPcLabelsDetailed, fvPcProjected = \
-            self.createFrontviewPc(self.pcData.list_rotated_raw_pc, self.pcData.list_raw_labels, self.pcData.list_raw_detailed_labels, self.pcData.list_raw_projected_points, orientedToXdirection=True)
+    def release(self):
+        '''
+        Drops the point clouds and images of the sample, so their memory can be freed before the next sample is loaded.
+        '''
+        if self.pcFvData is not None:
+            self.pcFvData.release()
+        if self.pcData is not None:
+            self.pcData.release()
+        if self.imageView is not None:
+            self.imageView.release()
+
+        self.pcColumns = None
+        self.vehicleRecords = None
+        self.pcData = None
+        self.pcFvData = None
+        self.imageView = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @classmethod
+    def getSourceFns(cls):
+        '''
+        Names of the sample files read by the constructor.
+        '''
+        return cls.getPointCloudFns() + [cls.fvImgFn]
 
-        self.pcFvData = PcRaw(frontviewPc, fvPcLabels, fvPcLabelsDetailed, fvPcProjected, camRot=0, debugMode=True, pcName="Front view")
+    @classmethod
+    def getPointCloudFns(cls):
+        '''
+        Names of the sample files parsed by loadSourceArrays (the ones stored in the sample cache).
+        '''
+        return [cls.rotationFn, cls.pcProjectedPointsFn, cls.pcLabelsFn, cls.pcLabelsDetailedFn]
+
+    @classmethod
+    def loadSampleArrays(cls, sampleDirPath, sampleCache = None):
+        '''
+        Loads the sample files read by the constructor, from the sample cache if given. It does not depend on
+        an instance, so the next sample can be loaded while the current one is processed.
+        The front view image is not cached: it is memory-mapped from its .bmp file (see GtaView.loadImage).
+        Returns:
+            - dict of arrays, see loadSourceArrays, and fv_image (front view image)
+        '''
+        with stageTimers.stage("load") as loadStage:
+            if sampleCache is not None:
+                sampleArrays = sampleCache.load(sampleDirPath, cls.getPointCloudFns(), lambda: cls.loadSourceArrays(sampleDirPath))
+            else:
+                sampleArrays = cls.loadSourceArrays(sampleDirPath)
+            sampleArrays = dict(sampleArrays)
+            sampleArrays["fv_image"] = GtaView.loadImage(os.path.join(sampleDirPath, cls.fvImgFn))
+            loadStage["points"] = len(sampleArrays["xyz"])
+        return sampleArrays
+
+    @classmethod
+    def loadSourceArrays(cls, sampleDirPath):
+        '''
+        Parses the point cloud files read by the constructor.
+        Returns:
+            - dict of arrays: rotation, xyz, projected, label and detailed_label
+        '''
+        pcColumns = PcColumns.loadFromSampleDir(sampleDirPath, cls.pcProjectedPointsFn, cls.pcLabelsFn, cls.pcLabelsDetailedFn)
 
+        return {
+            "rotation": np.fromfile(os.path.join(sampleDirPath, cls.rotationFn), dtype=np.float64, sep=' '),
+            "xyz": pcColumns.xyz,
+            "projected": pcColumns.projected,
+            "label": pcColumns.label,
+            "detailed_label": pcColumns.detailed_label,
+        }
+
+    def getVehicleRecords(self):
+        '''
+        Returns:
+            - structured array with a record per vehicle of the vehicles file (see VehicleRecords), parsed once per sample
+        '''
+        if self.vehicleRecords is None:
+            self.vehicleRecords = loadVehicleRecords(os.path.join(self.directory_path, self.vehiclesInfoFn))
+        return self.vehicleRecords
 
     def loadTxtFileIntoStrList(self, filename):
         '''
@@ -137,7 +244,7 @@ class GtaSample:
             for line in file_in:
                 lines.append(int(line))
 
-        print("-------> " + str(len(lines)))
+        log.debug(filename + ": " + str(len(lines)) + " values")
         return lines
 
     def loadTxtFileIntoTupleFloatList(self, filename, integer_indices_list = [], ignore_indices = []):
@@ -170,33 +277,21 @@ class GtaSample:
 
         return lines
 
-    def createFrontviewPc(self, point_cloud, point_cloud_labels, point_cloud_detailed_labels, point_projections_list, orientedToXdirection = False):
+    def createViewMask(self, view_index = 0, orientedToXdirection = False):
         '''
-        Creates a point cloud only with the points that are projected onto the front view (index 0).
-        It takes the view indices from the point_projections_list, and the points from the rotated point cloud.
-        It also creates a tuple list for the labels and the labels_detailed of the new front view point cloud.
+        Selects the points that are projected onto a view (the front view has index 0).
+        It takes the view indices from the projected points, and the points from the rotated point cloud.
         Arguments: 
-            - list of tuples containing the points position, projx, projy and view index. The view index is the sixth value of each line in the file.
+            - view_index: index of the view (0, 1 or 2)
+            - orientedToXdirection: also remove the points with x < 0 in the rotated point cloud
         Returns:
-            - a new point cloud containing only the points that are projected onto the front view image
-            - and respective tuple list of labels and labels_detailed, and the list of tuples containing projx, ptojy
-        '''
-        trimmed_pc = []
-        trimmed_pc_labels = []
-        trimmed_pc_labels_detailed = []
-        trimmed_projected = []
-        for i in range(0, len(point_projections_list)):
-            if point_projections_list[i][2] == 0: 
-                if orientedToXdirection:    
-                    if point_cloud[i][0] < 0:   # also remove the points with x < 0
-                        continue
-
-                trimmed_pc.append(point_cloud[i])
-                trimmed_pc_labels.append(point_cloud_labels[i])
-                trimmed_pc_labels_detailed.append(point_cloud_detailed_labels[i])
-                trimmed_projected.append(point_projections_list[i]) # stores (projx, projy) tuples
-
-        return trimmed_pc, trimmed_pc_labels, trimmed_pc_labels_detailed, trimmed_projected
+            - boolean mask with one value per point of pcData
+        '''
+        mask = self.pcData.raw_projected_points[:, 2] == view_index
+        if orientedToXdirection:
+            mask &= self.pcData.rotated_pc[:, 0] >= 0
+
+        return mask
 
     def loadTxtFileToDict(self, filename):
         '''
@@ -218,77 +313,75 @@ class GtaSample:
 
         return dict
 
-    def savePlyFile(self, filename, tuple_list, attributes = None):
+    def savePlyFile(self, filename, tuple_list, attributes = None, binary = True):
         '''
         Save list of points (possibly with attributes such as color) into a .PLY formated file
         Arguments: 
-            - tuple_list: list of points and their attributes
+            - tuple_list: list (or array) of points and their attributes
             - attributes: to indicate what type of attributes are included in the points:
                 - c: each point has position + color (r, g, b)
+            - binary: write a binary_little_endian .PLY instead of an ascii one
         '''
-        with open(os.path.join(self.directory_path, filename), "w") as the_file:
-            header_lines = ["ply", "format ascii 1.0"]
-            header_lines.append("element vertex " + str(len(tuple_list)))
-            header_lines.append("property float x")
-            header_lines.append("property float y")
-            header_lines.append("property float z")
-
-            # if point have color 
-            if attributes == "c":
-                header_lines.append("property uchar red")
-                header_lines.append("property uchar green")
-                header_lines.append("property uchar blue")
-            
-            header_lines.append("end_header")
-            
-            for i in range(0, len(header_lines)):
-                the_file.write(header_lines[i] + "\n")
-
-            for i in range(0, len(tuple_list)):
-                the_file.write(self.tupleToStr(tuple_list[i]) + "\n")
-
-    def savePlyFileFromDict(self, filename, dict, attributes = None):
+        with stageTimers.stage("encode", len(tuple_list)):
+            points = self.tupleListToArray(tuple_list, 6 if attributes == "c" else 3)
+            colors = points[:, 3:6] if attributes == "c" else None
+            vertices = createVertexArray(points[:, 0:3], colors)
+
+        with stageTimers.stage("write", len(vertices)):
+            writePly(os.path.join(self.directory_path, filename), vertices, binary)
+
+    def savePlyFileFromDict(self, filename, dict, attributes = None, binary = True):
         '''
         Save dictionary of lists of points (possibly with attributes such as color) into a .PLY formated file
         Arguments: 
             - dict: dictionary of list of points and their attributes
             - attributes: to indicate what type of attributes are included in the points:
                 - c: each point has position + color (r, g, b)
+            - binary: write a binary_little_endian .PLY instead of an ascii one
         '''
-        with open(os.path.join(self.directory_path, filename), "w") as the_file:
-
-            count_points = 0
-            for key in dict.keys():
-                count_points += len(dict[key])
-
-            header_lines = ["ply", "format ascii 1.0"]
-            header_lines.append("element vertex " + str(count_points))
-            header_lines.append("property float x")
-            header_lines.append("property float y")
-            header_lines.append("property float z")
-
-            # if point have color 
-            if attributes == "c":
-                header_lines.append("property uchar red")
-                header_lines.append("property uchar green")
-                header_lines.append("property uchar blue")
-            
-            header_lines.append("end_header")
-            
-            for i in range(0, len(header_lines)):
-                the_file.write(header_lines[i] + "\n")
-
-            for key in dict.keys():
-                for i in range(0, len(dict[key])):
-                    the_file.write(self.tupleToStr(dict[key][i]) + "\n")
+        with stageTimers.stage("encode") as encodeStage:
+            n_values = 6 if attributes == "c" else 3
+            points_per_key = [self.tupleListToArray(dict[key], n_values) for key in dict.keys()]
+            points = np.concatenate(points_per_key) if len(points_per_key) > 0 else np.zeros((0, n_values))
+            colors = points[:, 3:6] if attributes == "c" else None
+            vertices = createVertexArray(points[:, 0:3], colors)
+            encodeStage["points"] = len(vertices)
+
+        with stageTimers.stage("write", len(vertices)):
+            writePly(os.path.join(self.directory_path, filename), vertices, binary)
+
+    def savePlyFileFromArrays(self, filename, xyz, colors = None, binary = True, **properties):
+        '''
+        Save point arrays into a .PLY formated file
+        Arguments: 
+            - xyz: (N, 3) array with the points positions
+            - colors: optional (N, 3) array with the points colors (r, g, b)
+            - properties: other per point properties to store (ex: label=..., instance=...)
+            - binary: write a binary_little_endian .PLY instead of an ascii one
+        '''
+        with stageTimers.stage("encode", len(xyz)):
+            vertices = createVertexArray(xyz, colors, **properties)
+
+        with stageTimers.stage("write", len(vertices)):
+            writePly(os.path.join(self.directory_path, filename), vertices, binary)
+
+    def tupleListToArray(self, tuple_list, n_values):
+        '''
+        Converts a list of tuples (or an array) with n_values per point into a (N, n_values) array.
+        '''
+        if len(tuple_list) == 0:
+            return np.zeros((0, n_values))
+
+        return np.asarray(tuple_list).reshape(len(tuple_list), -1)
 
     def saveListIntoTxtFile(self, list_of_str, dirname, filename):
         '''
         Store list of strings into a file
         '''
-        with open(os.path.join(dirname, filename), "w") as the_file:
-            for i in range(0, len(list_of_str)):
-                the_file.write(list_of_str[i] + "\n")
+        with stageTimers.stage("write"):
+            with open(os.path.join(dirname, filename), "w") as the_file:
+                for i in range(0, len(list_of_str)):
+                    the_file.write(list_of_str[i] + "\n")
 
     def isNumber(self, s):
         '''
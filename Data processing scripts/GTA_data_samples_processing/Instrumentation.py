@@ -0,0 +1,151 @@
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    # not available on windows; the peak memory is not reported there
+    resource = None
+
+# stages of the export, in the order they run for a sample
+EXPORT_STAGES = ("load", "rotate", "split", "project", "encode", "write")
+
+def configureLogging(level = logging.INFO):
+    '''
+    Sends the log messages of the scripts to stderr. Debug messages (ex: the summaries of the point clouds) are only
+    shown with level = logging.DEBUG.
+    Arguments:
+        - level: logging level, or its name (ex: "DEBUG")
+    '''
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger().setLevel(level)
+
+def getPeakMemoryBytes():
+    '''
+    Returns:
+        - peak resident memory of this process in bytes, or None if it is not available
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes on linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class StageTimers:
+    '''
+    Wall and CPU time, number of points and peak memory of each stage of the export. The stages can be timed from
+    several threads (the CPU time is the one of the thread that runs the stage).
+    Usage:
+        with stageTimers.stage("rotate", nPoints):
+            ...
+    or, when the number of points is only known at the end:
+        with stageTimers.stage("load") as loadStage:
+            ...
+            loadStage["points"] = nPoints
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # dict with an entry {"calls", "wall_seconds", "cpu_seconds", "points", "peak_memory_bytes", "peak_memory_growth_bytes"} per stage
+            self.stats = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, nPoints = 0):
+        '''
+        Times the code of the with block as part of a stage.
+        Arguments:
+            - name: name of the stage (see EXPORT_STAGES)
+            - nPoints: number of points (or objects) processed by the block
+        '''
+        record = {"points": nPoints}
+        peakBefore = getPeakMemoryBytes()
+        cpuStart = time.thread_time()
+        wallStart = time.perf_counter()
+        try:
+            yield record
+        finally:
+            wallSeconds = time.perf_counter() - wallStart
+            cpuSeconds = time.thread_time() - cpuStart
+            peakAfter = getPeakMemoryBytes()
+            # the stages that make the peak memory grow are the ones to look at when it is too high
+            peakGrowth = peakAfter - peakBefore if peakAfter is not None else 0
+            self.add(name, {"calls": 1, "wall_seconds": wallSeconds, "cpu_seconds": cpuSeconds, "points": int(record["points"]),
+                "peak_memory_bytes": peakAfter, "peak_memory_growth_bytes": peakGrowth})
+
+    def add(self, name, values):
+        with self.lock:
+            stats = self.stats.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "points": 0,
+                "peak_memory_bytes": None, "peak_memory_growth_bytes": 0})
+            for key in ("calls", "wall_seconds", "cpu_seconds", "points", "peak_memory_growth_bytes"):
+                stats[key] += values[key]
+            if values["peak_memory_bytes"] is not None:
+                stats["peak_memory_bytes"] = max(stats["peak_memory_bytes"] or 0, values["peak_memory_bytes"])
+
+    def getStats(self):
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+    def merge(self, stats):
+        '''
+        Adds the stats of another StageTimers (ex: of a worker process, from getStats).
+        '''
+        for name, values in stats.items():
+            self.add(name, values)
+
+    def getReport(self, wallSeconds, nSamples):
+        '''
+        Arguments:
+            - wallSeconds: duration of the run
+            - nSamples: number of samples processed in the run
+        Returns:
+            - dict with the throughput of the run and of each stage (points and samples per second of the time spent in the stage)
+        '''
+        stats = self.getStats()
+        stageNames = [name for name in EXPORT_STAGES if name in stats] + sorted(name for name in stats if name not in EXPORT_STAGES)
+
+        stages = {}
+        for name in stageNames:
+            values = stats[name]
+            stageSeconds = max(values["wall_seconds"], 1e-9)
+            stages[name] = dict(values)
+            stages[name]["points_per_second"] = values["points"] / stageSeconds
+            stages[name]["samples_per_second"] = nSamples / stageSeconds
+
+        peaks = [values["peak_memory_bytes"] for values in stats.values() if values["peak_memory_bytes"] is not None]
+        if getPeakMemoryBytes() is not None:
+            peaks.append(getPeakMemoryBytes())
+
+        loadedPoints = stats["load"]["points"] if "load" in stats else 0
+        return {
+            "wall_seconds": wallSeconds,
+            "samples": nSamples,
+            "samples_per_second": nSamples / max(wallSeconds, 1e-9),
+            "points": loadedPoints,
+            "points_per_second": loadedPoints / max(wallSeconds, 1e-9),
+            "peak_memory_bytes": max(peaks) if len(peaks) > 0 else None,
+            "stages": stages,
+        }
+
+    def saveReport(self, filePath, wallSeconds, nSamples):
+        '''
+        Writes the report of the run (see getReport) into a json file.
+        Returns:
+            - the report
+        '''
+        report = self.getReport(wallSeconds, nSamples)
+        with open(filePath, "w") as f:
+            json.dump(report, f, indent=1)
+        return report
+
+# timers of the export in this process (each worker process has its own, merged by the main process)
+stageTimers = StageTimers()
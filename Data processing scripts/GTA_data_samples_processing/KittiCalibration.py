@@ -0,0 +1,131 @@
+import os
+import os.path
+import shutil
+import threading
+import functools
+import numpy as np
+
+# identity, the gta camera images don't need rectification
+IDENTITY_R0_RECT = ((1, 0, 0),
+                    (0, 1, 0),
+                    (0, 0, 1))
+
+# from the velodyne coordinate system (x forward, y left, z up) to the camera coordinate system (x right, y down, z forward)
+DEFAULT_TR_VELO_TO_CAM = ((0, -1, 0, 0),
+                          (0, 0, -1, 0),
+                          (1, 0, 0, 0))
+
+DEFAULT_TR_IMU_TO_VELO = ((1, 0, 0, 0),
+                          (0, 1, 0, 0),
+                          (0, 0, 1, 0))
+
+class KittiCalibration:
+    '''
+    Calibration matrices of the kitti samples generated from gta, and the text of their calib file.
+    Every sample taken with the same camera has the same calibration, so it is computed once
+    (see getKittiCalibration) and its calib file is written once and hardlinked for the other samples.
+    '''
+
+    def __init__(self, fov = 75, img_width = 1224, img_height = 370, tr_velo_to_cam = DEFAULT_TR_VELO_TO_CAM, r0_rect = IDENTITY_R0_RECT, tr_imu_to_velo = DEFAULT_TR_IMU_TO_VELO):
+        '''
+        Arguments:
+            - fov: horizontal field of view of the camera in degrees
+            - img_width, img_height: resolution of the kitti images
+            - tr_velo_to_cam, r0_rect, tr_imu_to_velo: extrinsics, as lists (or tuples) of rows
+        '''
+        # https://towardsdatascience.com/inverse-projection-transformation-c866ccedef1c
+        # https://github.com/darylclimb/cvml_project/blob/master/projections/inverse_projection/geometry_utils.py
+        Cu = img_width/2 # half screen width
+        Cv = img_height/2  # half screen height
+
+        hor_fov = fov / 360. * 2. * np.pi       # 50.0
+        fx = img_width / (2. * np.tan(hor_fov / 2.))# img_width / (2.0 * math.tan(hor_fov * math.pi / 360.0))  # focus length
+
+        vert_fov = 2. * np.arctan(np.tan(hor_fov / 2) * img_height / img_width)
+        fy = img_height / (2. * np.tan(vert_fov / 2.))
+
+        # 3x4 projection matrix, the same for the 4 cameras
+        self.P0 = np.reshape(np.array([[fx, 0, Cu, 0.],
+                                       [0, fy, Cv, 0.],
+                                       [0, 0, 1., 0.]]), [3,4])
+
+        # Rotation from reference camera coord to rect camera coord
+        self.R0 = np.reshape(np.array(r0_rect), [3,3])
+
+        self.V2C = np.reshape(np.array(tr_velo_to_cam), [3,4])
+        self.C2V = KittiCalibration.inverseRigidTrans(self.V2C)
+
+        line = KittiCalibration.matToStringKitti("P0", self.P0)
+        line += KittiCalibration.matToStringKitti("P1", self.P0)
+        line += KittiCalibration.matToStringKitti("P2", self.P0)
+        line += KittiCalibration.matToStringKitti("P3", self.P0)
+        line += KittiCalibration.matToStringKitti("R0_rect", r0_rect)
+        line += KittiCalibration.matToStringKitti("Tr_velo_to_cam", tr_velo_to_cam)
+        line += KittiCalibration.matToStringKitti("Tr_imu_to_velo", tr_imu_to_velo)
+
+        # content of the calib file
+        self.calibText = line
+
+        # calib file written by this instance, that the calib files of the next samples are linked to
+        self.calibFilePath = None
+        # the calib files may be saved from several writer threads
+        self.calibFileLock = threading.Lock()
+
+    @staticmethod
+    def inverseRigidTrans(Tr):
+        ''' Inverse a rigid body transform matrix (3x4 as [R|t])
+            [R'|-R't; 0|1]
+        '''
+        inv_Tr = np.zeros_like(Tr) # 3x4
+        inv_Tr[0:3,0:3] = np.transpose(Tr[0:3,0:3])
+        inv_Tr[0:3,3] = np.dot(-np.transpose(Tr[0:3,0:3]), Tr[0:3,3])
+        return inv_Tr
+
+    @staticmethod
+    def matToStringKitti(name, mat):
+        '''
+            Arguments:
+                - name: name of the matrix
+                - mat: list of lists of int or float values
+            Returns:
+                - string
+        '''
+        line = name + ": "
+        for i in range(0, len(mat)):
+            for j in range(0, len(mat[i])):
+                line += str(mat[i][j]) + " "
+
+        line += "\n"
+
+        return line
+
+    def saveCalibFile(self, dirPath, filename):
+        '''
+        Saves the calib file of a sample. The first file is written, the next ones are hardlinks to it
+        (or copies, if hardlinks are not supported).
+        '''
+        filePath = os.path.join(dirPath, filename)
+
+        with self.calibFileLock:
+            if self.calibFilePath is not None and os.path.exists(self.calibFilePath):
+                if os.path.exists(filePath):
+                    if os.path.samefile(self.calibFilePath, filePath):
+                        return
+                    os.remove(filePath)
+                try:
+                    os.link(self.calibFilePath, filePath)
+                except OSError:
+                    shutil.copyfile(self.calibFilePath, filePath)
+                return
+
+            with open(filePath, "w") as the_file:
+                the_file.write(self.calibText)
+            self.calibFilePath = filePath
+
+@functools.lru_cache(maxsize=None)
+def getKittiCalibration(fov = 75, img_width = 1224, img_height = 370, tr_velo_to_cam = DEFAULT_TR_VELO_TO_CAM, r0_rect = IDENTITY_R0_RECT, tr_imu_to_velo = DEFAULT_TR_IMU_TO_VELO):
+    '''
+    Returns:
+        - KittiCalibration shared by every call with the same arguments (the matrices must be tuples of tuples)
+    '''
+    return KittiCalibration(fov, img_width, img_height, tr_velo_to_cam, r0_rect, tr_imu_to_velo)
@@ -1,16 +1,48 @@
 from GtaSample import GtaSample
+from GtaView import GtaView
 from pathlib import Path
 import numpy as np
 import os.path
 import math
-import struct
-from kitti_util import compute_box_3d
+import logging
+from kitti_util import compute_boxes, has_box_area
+import VelodyneFile
+from KittiCalibration import KittiCalibration, getKittiCalibration
+from ExportPipeline import writeNow
+from Instrumentation import stageTimers
+
+log = logging.getLogger(__name__)
 
 class KittiSample:
 
-    dict_2d_bb_NEW = {}
+    # every attribute is per instance; __slots__ keeps the instances compact and prevents state shared between samples
+    __slots__ = (
+        # output directories
+        'kittiOutputSamplesDir',
+        'kittiLabelsDir',
+        'kittiVelodyneDir',
+        'kittiViewsDir',
+        'kittiCalibDir',
+        # GtaSample instance the kitti sample is created from
+        'gtaSample',
+        # 2D bounding box (minx, miny, maxx, maxy) in the kitti image of each vehicle entity, projected by the game (used by testProjection)
+        'dict_2d_bb_NEW',
+        # KittiCalibration of the sample (shared by every sample), set by saveCalibInfo
+        'calibration',
+        # function that runs the file writes: fileWriter(saveFn, *args)
+        'fileWriter',
+    )
+
+    def __init__(self, gtaSample, outputRootDir, outputLabelsDir, outputVelDir, outputViewsDir, outputCalDir, sampleCounter, fileWriter = None):
+        '''
+        Arguments:
+            - fileWriter: optional function called as fileWriter(saveFn, *args) for each output file, that runs the
+              write (ex: submits it to a WriterPool batch); by default the files are written right away
+        '''
+        self.dict_2d_bb_NEW = {}
+        self.calibration = None
+        self.fileWriter = fileWriter if fileWriter is not None else writeNow
 
-    def __init__(self, gtaSample, outputRootDir, outputLabelsDir, outputVelDir, outputViewsDir, outputCalDir, sampleCounter):
         self.kittiOutputSamplesDir = outputRootDir
         self.kittiLabelsDir = outputRootDir + outputLabelsDir
         self.kittiVelodyneDir = outputRootDir + outputVelDir
@@ -21,71 +53,78 @@ class KittiSample:
 
         self.outputKittiLabelFile(sampleCounter, ignore_truncated_bbs = True)
 
+    def release(self):
+        '''
+        Drops the reference to the gta sample, so its memory can be freed as soon as the kitti sample is written.
+        '''
+        self.gtaSample = None
+        self.calibration = None
+        self.fileWriter = None
+        self.dict_2d_bb_NEW = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
     @staticmethod
     def loadKittiVelodyneFile(file_path, include_luminance = False):
         '''
-        Loads a kitti velodyne file (ex: 000000.bin) into a list of tuples, where each tuple has (x, y, z) or (x, y, z, l)
-        Right now it discards the 4th vaule of each point, i.e. the luminance
+        Loads a kitti velodyne file (ex: 000000.bin) into a memory-mapped (N, 3) array with (x, y, z), or (N, 4) with (x, y, z, l)
         Argument:
-            - include_luminance: if the function should also store the pont intensisty value in the list of points
+            - include_luminance: if the function should also return the point intensity value
         '''
-        # Source: https://github.com/hunse/kitti/blob/master/kitti/velodyne.py
-        points = np.fromfile(file_path, dtype=np.float32).reshape(-1, 4)
-        points = points[:, :3]  # exclude luminance
-
-        point_tuple_list = []
-        for i in range(len(points)):
-            point_tuple_list.append((points[i][0], points[i][1], points[i][2],))
-
-        return point_tuple_list
+        return VelodyneFile.loadKittiVelodyneFile(file_path, include_luminance)
 
     @staticmethod
     def loadGtaVelodyneBinFile(file_path, include_luminance = False):
         '''
-        Loads a kitti velodyne file (ex: 000000.bin) into a list of tuples, where each tuple has (x, y, z) or (x, y, z, l)
+        Loads a velodyne file with 3 float64 values per point into a memory-mapped (N, 3) array with (x, y, z)
         Argument:
-            - include_luminance: if the function should also store the pont intensisty value in the list of points
+            - include_luminance: unused, these files don't have the point intensity value
         '''
-        f = open(file_path, mode='rb')
-        dt=np.dtype('float,float,float')
-        numpyList = np.fromfile(f, dt)
-
-        point_tuple_list = []
-        for i in range(len(numpyList)):
-            point_tuple_list.append((numpyList[i][0], numpyList[i][1], numpyList[i][2],))
-
-        return point_tuple_list
+        return VelodyneFile.loadGtaVelodyneBinFile(file_path)
 
     @staticmethod
-    def saveKittiVelodyneFile(tuple_list, filename, directory, output_luminance = False):
+    def saveKittiVelodyneFile(points, filename, directory, output_luminance = False, intensity = 1.0):
         '''
-        Saves pointcloud without luminance in binary
+        Saves pointcloud in binary, with or without luminance
         For frustum pointnet, the point cloud must contain luminance
+        Arguments:
+            - points: (N, 3) or (N, 4) array with the points
+            - output_luminance: if the luminance of each point is saved
+            - intensity: luminance of every point, as a single value or a (N,) array
         '''
-        with open(directory + filename, "wb") as f:
-            for point in tuple_list:
-                s = struct.pack('f'*len(point), *point)
-                f.write(s)
-                #newline = "\n"
-                #f.write(newline.encode("utf-8").replace(newline, os.linesep))
-        
+        with stageTimers.stage("write", len(points)):
+            if output_luminance:
+                VelodyneFile.saveKittiVelodyneFile(directory + filename, points, intensity)
+            else:
+                VelodyneFile.saveKittiVelodyneFile(directory + filename, VelodyneFile.getXyz(np.asarray(points)), None)
 
-    def addDummyLuminenceValuesToPointCloud(self, tuple_list):
-        new_tuple_list = []
-        for t in tuple_list:
-            new_tuple_list.append((t[0], t[1], t[2], 1))
+    @staticmethod
+    def saveKittiImage(imageView, image, dirPath, filename):
+        '''
+        Encodes the image in the format of the filename extension and writes it.
+        Arguments:
+            - imageView: GtaView of the image
+        '''
+        with stageTimers.stage("encode"):
+            encodedImage = imageView.encodeImage(image, os.path.splitext(filename)[1])
+        with stageTimers.stage("write"):
+            imageView.saveEncodedImage(encodedImage, dirPath, filename)
 
-        return new_tuple_list
+    @staticmethod
+    def getOutputFileName(sampleCounter):
+        '''
+        Returns:
+            - name (without extension) of the files of a kitti sample, ex: 000042
+        '''
+        return str(sampleCounter).zfill(6)
 
     def outputKittiLabelFile(self, sampleCounter, ignore_truncated_bbs = True):
         # generate file name
-        n_digits = len(str(sampleCounter))
-        output_file_name = ""               # ex: 000000.txt
-        for i in range(0, 6-n_digits):
-            output_file_name = output_file_name + "0"
-        
-        if len(output_file_name) is not 6:
-            output_file_name = output_file_name + str(sampleCounter)
+        output_file_name = KittiSample.getOutputFileName(sampleCounter)   # ex: 000000.txt
 
         # create the hierarchy of directories
         Path(self.kittiOutputSamplesDir).mkdir(parents=True, exist_ok=True)
@@ -95,9 +134,9 @@ class KittiSample:
         Path(self.kittiCalibDir).mkdir(parents=True, exist_ok=True)
 
         # save image
-        self.gtaSample.imageView.saveImage(self.gtaSample.imageView.kittiImage, self.kittiViewsDir, output_file_name + ".png")
+        self.fileWriter(KittiSample.saveKittiImage, self.gtaSample.imageView, self.gtaSample.imageView.kittiImage, self.kittiViewsDir, output_file_name + ".png")
         # save point cloud - the full rotated point cloud
-        KittiSample.saveKittiVelodyneFile(self.addDummyLuminenceValuesToPointCloud(self.gtaSample.pcData.list_rotated_raw_pc), output_file_name + ".bin", self.kittiVelodyneDir, output_luminance = True)
+        self.fileWriter(KittiSample.saveKittiVelodyneFile, self.gtaSample.pcData.list_rotated_raw_pc, output_file_name + ".bin", self.kittiVelodyneDir, output_luminance = True)
         # save calibration info
         self.saveCalibInfo(self.kittiCalibDir, output_file_name + ".txt")
         # labels info
@@ -116,73 +155,24 @@ class KittiSample:
         ''' Inverse a rigid body transform matrix (3x4 as [R|t])
             [R'|-R't; 0|1]
         '''
-        inv_Tr = np.zeros_like(Tr) # 3x4
-        inv_Tr[0:3,0:3] = np.transpose(Tr[0:3,0:3])
-        inv_Tr[0:3,3] = np.dot(-np.transpose(Tr[0:3,0:3]), Tr[0:3,3])
-        return inv_Tr
+        return KittiCalibration.inverseRigidTrans(Tr)
 
     def saveCalibInfo(self, dirname, filename):
-        # https://towardsdatascience.com/inverse-projection-transformation-c866ccedef1c
-        # https://github.com/darylclimb/cvml_project/blob/master/projections/inverse_projection/geometry_utils.py
-        img_width = 1224
-        img_height = 370
-
-        fov = 75
-        Cu = img_width/2 # half screen width
-        Cv = img_height/2  # half screen height
+        '''
+        Saves the calib file of the sample. The calibration is the same for every sample, so it is only computed
+        the first time and its file is hardlinked to the one of the first sample.
+        '''
+        self.calibration = getKittiCalibration(fov = 75, img_width = 1224, img_height = 370)
+        self.fileWriter(KittiSample.saveCalibFile, self.calibration, dirname, filename)
 
-        hor_fov = fov / 360. * 2. * np.pi       # 50.0  
-        fx = img_width / (2. * np.tan(hor_fov / 2.))# img_width / (2.0 * math.tan(hor_fov * math.pi / 360.0))  # focus length
+    @staticmethod
+    def saveCalibFile(calibration, dirname, filename):
+        '''
+        Writes the calib file; static, so it doesn't depend on the kitti sample when it runs in a writer thread.
+        '''
+        with stageTimers.stage("write"):
+            calibration.saveCalibFile(dirname, filename)
 
-        vert_fov = 2. * np.arctan(np.tan(hor_fov / 2) * img_height / img_width)
-        fy = img_height / (2. * np.tan(vert_fov / 2.))
-        
-        print("hor_fov: " + str(hor_fov))
-        print("pi: " + str(math.pi))
-        print("Cu: " + str(Cu))
-        print("Cv: " + str(Cv))
-
-        self.p0_mat =[[fx, 0, Cu, 0.],
-                      [0, fy, Cv, 0.],
-                      [0, 0, 1., 0.]]
-        
-        # store in a 3x4 np matrix
-        self.p0_mat = np.array(self.p0_mat)
-        self.p0_mat = np.reshape(self.p0_mat, [3,4])
-
-        p1_mat=p2_mat=p3_mat=self.p0_mat
-
-        # identity
-        r0_rect = [[1, 0, 0],
-                  [0, 1, 0],
-                   [0, 0, 1]]
-
-        # Rotation from reference camera coord to rect camera coord
-        self.R0 = np.array(r0_rect)
-        self.R0 = np.reshape(self.R0,[3,3])
-
-        tr_velo_to_cam = [[0, -1, 0, 0],
-                          [0, 0, -1, 0],
-                          [1, 0, 0, 0]]
-
-        self.V2C = np.array(tr_velo_to_cam)
-        self.V2C = np.reshape(self.V2C, [3,4])
-        self.C2V = self.inverse_rigid_trans(self.V2C)
-
-        tr_imu_to_velo = [[1, 0, 0, 0],
-                          [0, 1, 0, 0],
-                          [0, 0, 1, 0]]
-
-        line = KittiSample.matToStringKitti("P0", self.p0_mat)
-        line += KittiSample.matToStringKitti("P1", p1_mat)
-        line += KittiSample.matToStringKitti("P2", p2_mat)
-        line += KittiSample.matToStringKitti("P3", p3_mat)
-        line += KittiSample.matToStringKitti("R0_rect", r0_rect)
-        line += KittiSample.matToStringKitti("Tr_velo_to_cam", tr_velo_to_cam)
-        line += KittiSample.matToStringKitti("Tr_imu_to_velo", tr_imu_to_velo)
-
-        KittiSample.saveStrInTxtFile(dirname, filename, line)
-        
     @staticmethod
     def matToStringKitti(name, mat):
         '''
@@ -192,14 +182,7 @@ class KittiSample:
             Returns:
                 - string
         '''
-        line = name + ": "
-        for i in range(0, len(mat)):
-            for j in range(0, len(mat[i])):
-                line += str(mat[i][j]) + " "
-
-        line += "\n"
-        
-        return line
+        return KittiCalibration.matToStringKitti(name, mat)
 
     @staticmethod
     def saveStrInTxtFile(dirPath, filename, line):
@@ -225,234 +208,167 @@ class KittiSample:
             (1 value) rotation_y: [-pi, pi], rotation around Y-axis (up axis) in camera coordinates
         '''
 
-        '''
-            Values per vehicle: [Entity] 
-            | Hash 
-            | minCornerX | minCornerY | minCornerZ | projMinCornerX | projMinCornerX 
-            | maxCornerX | maxCornerY | maxCornerZ | projMaxCornerX | projMaxCornerY 
-            | Posx | Posy | Posz | Rotx | Roty | Rotz 
-            | projCenterX | projCenterY 
-            | dimX | dimY | dimZ
-            | objectType | truncated"
-        '''
-        vehicleInfoDict = self.gtaSample.loadTxtFileToDict(self.gtaSample.vehiclesInfoFn)
+        # one record per vehicle of the vehicles file, with a field per value (see VehicleRecords)
+        vehicleRecords = self.gtaSample.getVehicleRecords()
 
         contents_list = []
 
         # for visualization purposes
         boundingBoxList = []
 
-        print("Number of keys: " + str(vehicleInfoDict.keys()))
+        log.debug("Vehicles: " + str(vehicleRecords["entity"].tolist()))
 
-        for key in vehicleInfoDict.keys():
-            label_line = ""
+        objRotZ = vehicleRecords["rotation"][:, 2]
+        objForwardDirs = vehicleRecords["forward"]
 
-            kitti_height, kitti_width, kitti_channels = self.gtaSample.imageView.getKittiImageDimensions()
+        #### 3D bounding box dimensions ####
+        # height (dimz), width (dimx), length (dimy)
+        bb3d_heights = vehicleRecords["dims"][:, 2]
+        bb3d_widths = vehicleRecords["dims"][:, 0]
+        bb3d_lengths = vehicleRecords["dims"][:, 1]
 
-            #### Calculate object location (the center of its base plane ###)
-            # rotate location point around z axis according to the angle that the point cloud was rotated (- Z angle of the camera - 90º)
-            originalVehiclePoint = (float(vehicleInfoDict[key][11]), float(vehicleInfoDict[key][12]), float(vehicleInfoDict[key][13]) - float(vehicleInfoDict[key][21])/2)
+        #### Calculate objects location (the center of their base plane ###)
+        originalVehiclePoints = vehicleRecords["position"].copy()
+        originalVehiclePoints[:, 2] -= bb3d_heights/2
 
-            # because of the point cloud is aditionally transformed to be pointing in the direction of x axis instead of the y axis
-            rotatedVehiclePos = self.gtaSample.pcData.rotatePointAroundZaxis(originalVehiclePoint, self.gtaSample.pcData.rotation_amount)
+        # rotate location points around z axis according to the angle that the point cloud was rotated (- Z angle of the camera - 90º),
+        # because of the point cloud is aditionally transformed to be pointing in the direction of x axis instead of the y axis,
+        # and then transform from lidar coordinate system to camera coordinate system
+        gtaToCamTransform = self.gtaSample.pcData.transform.rotateZ(self.degreesToRad(90)).rotateX(self.degreesToRad(90))
+        rotatedVehiclePositions = gtaToCamTransform.apply(originalVehiclePoints)
 
-            # transform from lidar coordinate system to camera coordinate system
-            rotatedVehiclePos = self.gtaSample.pcData.rotatePointAroundZaxis(rotatedVehiclePos, self.degreesToRad(90))
-            rotatedVehiclePos = self.gtaSample.pcData.rotatePointAroundXaxis(rotatedVehiclePos, self.degreesToRad(90))
+        kitti_height, kitti_width, kitti_channels = self.gtaSample.imageView.getKittiImageDimensions()
 
-            # check if the vehicle is in front of the camera if not, ignore it
-            objectPosition = np.array([originalVehiclePoint[0], originalVehiclePoint[1], originalVehiclePoint[2]])
-            print("Object position: " + str(objectPosition))
+        with stageTimers.stage("project", len(vehicleRecords)):
+            # check if the vehicles are in front of the camera, if not, ignore them
+            inFrontOfCamera = self.areInFrontOfCamera(originalVehiclePoints)
 
-            camPosition = np.zeros(3)
-            
-            # car to cam instead of cam to car because the gta is in left handed coords and the projection matrix is in right handed coords
-            vecCamToObj = objectPosition - camPosition
-            vecCamToObj.dot(vecCamToObj)
-            # normalize vector       
-            mag = np.sqrt(math.pow(vecCamToObj[0], 2) + math.pow(vecCamToObj[1], 2) + math.pow(vecCamToObj[2], 2))
-            vecCamToObj = np.array([vecCamToObj[0]/mag, vecCamToObj[1]/mag, vecCamToObj[2]/mag])
-
-            # # dot product
-            dotCamObj = self.gtaSample.camForwardDir.dot(vecCamToObj)
-            
-            angle = math.acos(dotCamObj) * 180 / math.pi
-
-            if angle < 0 or angle > 90:
-                continue
-
-            #### 3D bounding box dimensions ####
-            # height (dimz), width (dimx), length (dimy)
-            bb3d_height = float(vehicleInfoDict[key][21])
-            bb3d_width = float(vehicleInfoDict[key][19])
-            bb3d_length = float(vehicleInfoDict[key][20])
-
-            #### Calculate 3D and 2D bounding boxes through the object's rotation and forward vector, and camera rotation 
-            obj_rot_rads = 0
-            if float(vehicleInfoDict[key][24]) < 0 and float(vehicleInfoDict[key][25]) < 0: #DONE
-                print("1")
-                obj_rot_rads = float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation + 90
-            elif float(vehicleInfoDict[key][24]) < 0 and float(vehicleInfoDict[key][25]) > 0: #DONE
-                print("4")
-                obj_rot_rads = -float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation - 90
-            elif float(vehicleInfoDict[key][24]) > 0 and float(vehicleInfoDict[key][25]) > 0: # almost
-                #if (float(vehicleInfoDict[key][16]) > -45):
-                if float(vehicleInfoDict[key][26]) < 0:
-                    print("5")
-                    #obj_rot_rads = float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation
-                    obj_rot_rads = -float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation - 90
-                else:
-                    print("6")
-                    obj_rot_rads = -float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation - 90
-            elif float(vehicleInfoDict[key][24]) > 0 and float(vehicleInfoDict[key][25]) < 0:
-                #if float(vehicleInfoDict[key][16]) >= -45:
-                if float(vehicleInfoDict[key][26]) < 0:
-                    print("7")
-                    obj_rot_rads = float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation - 90 + 180
-                    print("ROT: " + str(obj_rot_rads))
-                    #obj_rot_rads = -float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation
-                else:
-                    print("8")
-                    obj_rot_rads = float(vehicleInfoDict[key][16]) + self.gtaSample.rawCamRotation - 90 - 180
-
-            obj_rot_rads = self.degreesToRad(obj_rot_rads)
-
-            # make sure the ry is between [-pi, pi]
-            if obj_rot_rads > math.pi:
-                obj_rot_rads = -(math.pi + (math.pi - obj_rot_rads)) 
-            elif obj_rot_rads < -math.pi:
-                obj_rot_rads = math.pi + (math.pi + obj_rot_rads)
-
-            #### Calculate 2D and 3D bounding boxes ####
-            box3d_pts_2d, box3d_pts_3d = compute_box_3d(bb3d_length, bb3d_width, bb3d_height, obj_rot_rads, rotatedVehiclePos, self.p0_mat, self.R0, self.C2V)
-            
-            xmin = 0
-            ymin = 0
-            xmax = 0
-            ymax = 0
-            print(len(box3d_pts_2d))
-            for i in range(0, len(box3d_pts_2d)):
-                if i == 0:
-                    xmin = box3d_pts_2d[i,0]
-                    ymin = box3d_pts_2d[i,1]
-                    xmax = box3d_pts_2d[i,0]
-                    ymax = box3d_pts_2d[i,1]
-                else:
-                    if box3d_pts_2d[i,0] < xmin:
-                        xmin = box3d_pts_2d[i,0]
-                    elif box3d_pts_2d[i,0] > xmax:
-                        xmax = box3d_pts_2d[i,0]
-                    
-                    if box3d_pts_2d[i,1] < ymin:
-                        ymin = box3d_pts_2d[i,1]
-                    elif box3d_pts_2d[i,1] > ymax:
-                        ymax = box3d_pts_2d[i,1]
-
-            if xmin < 0 and xmax > kitti_width and ymin < 0 and ymax > kitti_height: # ignore object
-                continue
-            
-            # make sure that the uv coorsinates are within image bounds
-            if xmin < 0: 
-                xmin = 0
-            if xmax >= kitti_width:
-                xmax = kitti_width-1
-            if ymin < 0:
-                ymin = 0
-            if ymax >= kitti_height:
-                ymax = kitti_height-1
-
-            boundingBoxList.append((xmin, ymin, xmax, ymax))
-
-            # object type: car
-            label_line += vehicleInfoDict[key][22] + " "
+            #### Calculate 3D and 2D bounding boxes through the object's rotation and forward vector, and camera rotation
+            objRotRads = self.computeRotationsY(objRotZ, objForwardDirs)
+
+            box3d_pts_3d, box3d_pts_2d, boxes2d, coverImage = compute_boxes(bb3d_lengths, bb3d_widths, bb3d_heights, objRotRads, rotatedVehiclePositions, self.calibration.P0, kitti_width, kitti_height)
+
+        # vehicles whose box is outside of the image have no area after clipping, and are not labeled
+        labeledVehicles = np.flatnonzero(inFrontOfCamera & ~coverImage & has_box_area(boxes2d))
+        with stageTimers.stage("encode", len(labeledVehicles)):
+            for vehicleIndex in labeledVehicles:
+                label_line = ""
+
+                rotatedVehiclePos = rotatedVehiclePositions[vehicleIndex]
+                xmin, ymin, xmax, ymax = boxes2d[vehicleIndex].tolist()
+
+                boundingBoxList.append((xmin, ymin, xmax, ymax))
+
+                # object type: car
+                label_line += vehicleRecords["object_type"][vehicleIndex] + " "
             
-            # truncated
-            label_line += "0 "
+                # truncated
+                label_line += "0 "
 
-            # occluded
-            label_line += "0 "
+                # occluded
+                label_line += "0 "
 
-            # alpha
-            label_line += "0 "
+                # alpha
+                label_line += "0 "
 
-            # minx, miny, maxx, maxy
-            label_line += str(int(xmin)) + " " + str(int(ymin)) + " " + str(int(xmax)) + " " + str(int(ymax)) + " "
+                # minx, miny, maxx, maxy
+                label_line += str(int(xmin)) + " " + str(int(ymin)) + " " + str(int(xmax)) + " " + str(int(ymax)) + " "
 
-            label_line += str(bb3d_height) + " " + str(bb3d_width) + " " + str(bb3d_length) + " "
+                label_line += str(bb3d_heights[vehicleIndex].item()) + " " + str(bb3d_widths[vehicleIndex].item()) + " " + str(bb3d_lengths[vehicleIndex].item()) + " "
             
-            label_line += str(rotatedVehiclePos[0]) + " " + str(rotatedVehiclePos[1]) + " " + str(rotatedVehiclePos[2]) + " "
+                label_line += str(rotatedVehiclePos[0]) + " " + str(rotatedVehiclePos[1]) + " " + str(rotatedVehiclePos[2]) + " "
 
-            label_line += str(obj_rot_rads) + " "
+                label_line += str(objRotRads[vehicleIndex].item()) + " "
 
-            contents_list.append(label_line)
+                contents_list.append(label_line)
 
         # show resulting bounding boxes in kitti images
         #self.gtaSample.imageView.showViewWith2dBoundingBoxes(boundingBoxList, self.gtaSample.imageView.kittiImage, color = (0, 0, 255), window_title = "Bounding box results", window_size = 0.8)
         
-        self.gtaSample.saveListIntoTxtFile(contents_list, dirname, filename)
+        self.fileWriter(self.gtaSample.saveListIntoTxtFile, contents_list, dirname, filename)
         
 
+    def areInFrontOfCamera(self, objectPositions):
+        '''
+        Checks which objects are within 90 degrees of the camera forward direction.
+        Arguments:
+            - objectPositions: (K, 3) array with the positions of the objects, in the original point cloud coordinates (camera at the origin)
+        Returns:
+            - (K,) bool array
+        '''
+        # car to cam instead of cam to car because the gta is in left handed coords and the projection matrix is in right handed coords
+        vecCamToObj = objectPositions / np.linalg.norm(objectPositions, axis=1, keepdims=True)
+        dotCamObj = np.clip(vecCamToObj.dot(self.gtaSample.camForwardDir), -1, 1)
+
+        angle = np.arccos(dotCamObj) * 180 / math.pi
+        return (angle >= 0) & (angle <= 90)
+
+    def computeRotationsY(self, objRotZ, objForwardDirs):
+        '''
+        Rotation around the Y-axis (up axis) in camera coordinates of each object, from its rotation around the z axis in gta,
+        its forward vector (which gives its heading quadrant) and the camera rotation.
+        Arguments:
+            - objRotZ: (K,) array with the rotations of the objects around the z axis in degrees
+            - objForwardDirs: (K, 3) array with the forward vectors of the objects
+        Returns:
+            - (K,) array with the rotations in radians, between [-pi, pi]
+        '''
+        camRot = self.gtaSample.rawCamRotation
+        fx = objForwardDirs[:, 0]
+        fy = objForwardDirs[:, 1]
+        fz = objForwardDirs[:, 2]
+
+        # one rotation per heading quadrant; objects with a forward vector on an axis have no rotation
+        conditions = [(fx < 0) & (fy < 0),
+                      (fx < 0) & (fy > 0),
+                      (fx > 0) & (fy > 0),
+                      (fx > 0) & (fy < 0) & (fz < 0),
+                      (fx > 0) & (fy < 0) & (fz >= 0)]
+        rotations = [objRotZ + camRot + 90,
+                     -objRotZ + camRot - 90,
+                     -objRotZ + camRot - 90,
+                     objRotZ + camRot - 90 + 180,
+                     objRotZ + camRot - 90 - 180]
+        objRotRads = self.degreesToRad(np.select(conditions, rotations, default=0.0))
+
+        # make sure the ry is between [-pi, pi]
+        objRotRads = np.where(objRotRads > math.pi, -(math.pi + (math.pi - objRotRads)), objRotRads)
+        return np.where(objRotRads < -math.pi, math.pi + (math.pi + objRotRads), objRotRads)
+
     def is_bb_truncated(self, list_coords):
         '''
             Checks if the 2d bounding box of the object was cut when the image view was resized to the kitti resolution
+            Arguments:
+                - list_coords: (minx, miny, maxx, maxy) of the box in the kitti image
         '''
-        kitti_height, kitti_width, kitti_channels = self.imageView.get_kitti_image_dimensions()
-        #print("height: " + str(kitti_height))
-        #print("width: " + str(kitti_width))
-        #print("list: " + str(list_coords))
-
-        if list_coords[0] < 0 or list_coords[1] > kitti_width or list_coords[2] < 0 or list_coords[3] > kitti_height:
-            return True 
+        kitti_height, kitti_width, kitti_channels = self.gtaSample.imageView.getKittiImageDimensions()
 
-        return False
+        box = np.array([list_coords], dtype=np.float64)
+        return bool(GtaView.getBoxesTruncation(box, GtaView.clipBoxes(box, kitti_width, kitti_height))[0] > 0)
 
     def testProjection(self):
         '''
             Calculate bounding box with projections taken from gtav (not working as desired)
         '''
-        
-        dict_vehicles_dim = self.gtaSample.loadTxtFileToDict(self.gtaSample.vehiclesInfoFn)
-
-        print(dict_vehicles_dim)
-        dict_vehicle_projected_center = {}
-        for key in self.gtaSample.imageView.dict_2d_bb_of_kitti_image.keys():
-            self.gtaSample.dict_2d_bb_NEW[key] = []
-            dict_vehicle_projected_center[key] = []
-            # ignore bounding boxes that have coordinates out of bounds
-            if int(float(dict_vehicles_dim[str(key)][9])) < 0 \
-                or int(float(dict_vehicles_dim[str(key)][4])) < 0 \
-                or int(float(dict_vehicles_dim[str(key)][10])) < 0 \
-                or int(float(dict_vehicles_dim[str(key)][5])) < 0:
-
-                self.gtaSample.dict_2d_bb_NEW[key].append(-1)
-                self.gtaSample.dict_2d_bb_NEW[key].append(-1)
-                self.gtaSample.dict_2d_bb_NEW[key].append(-1)
-                self.gtaSample.dict_2d_bb_NEW[key].append(-1)
-                dict_vehicle_projected_center[key].append(-1)
-                dict_vehicle_projected_center[key].append(-1)
-                continue
-
-            self.gtaSample.dict_2d_bb_NEW[key].append(int(float(dict_vehicles_dim[str(key)][4])))
-            self.gtaSample.dict_2d_bb_NEW[key].append(int(float(dict_vehicles_dim[str(key)][9])))
-            self.gtaSample.dict_2d_bb_NEW[key].append(int(float(dict_vehicles_dim[str(key)][10])))
-            self.gtaSample.dict_2d_bb_NEW[key].append(int(float(dict_vehicles_dim[str(key)][5])))
-            
-            dict_vehicle_projected_center[key].append(int(float(dict_vehicles_dim[str(key)][17])))
-            dict_vehicle_projected_center[key].append(int(float(dict_vehicles_dim[str(key)][18])))
-
-            #print("New projection: " + str(self.dict_2d_bb_NEW[key][0]) + " " + str(self.dict_2d_bb_NEW[key][1]) + " " + str(self.dict_2d_bb_NEW[key][2]) + " " + str(self.dict_2d_bb_NEW[key][3]))
-        
-        self.gtaSample.imageView.showViewWith2dBoundingBoxes(self.gtaSample.dict_2d_bb_NEW, self.gtaSample.imageView.gtaImage, self.gtaSample.imageView.dict_2d_bb_of_kitti_image.keys(), window_size = 0.7, object_centers = dict_vehicle_projected_center)
-        pass
-
-
-
-
-
+        imageView = self.gtaSample.imageView
+        vehicleRecords = self.gtaSample.getVehicleRecords()
 
+        log.debug(str(vehicleRecords))
 
+        # boxes (minX, minY, maxX, maxY) of the corners and centers projected by the game, in the gta image
+        projCorners = np.stack((vehicleRecords["proj_min_corner"], vehicleRecords["proj_max_corner"]), axis=1)
+        projBoxes = np.concatenate((projCorners.min(axis=1), projCorners.max(axis=1)), axis=1)
 
+        # ignore bounding boxes that have coordinates out of bounds
+        onScreen = (projBoxes >= 0).all(axis=1)
 
+        kittiBoxes, truncation = GtaView.mapBoxes(projBoxes, imageView.kittiCrop, "gta", "kitti")
+        kittiCenters = GtaView.mapPixels(vehicleRecords["proj_center"], imageView.kittiCrop, "gta", "kitti")[0]
 
+        visible = np.flatnonzero(onScreen & (truncation < 1))
+        for vehicleIndex in visible:
+            self.dict_2d_bb_NEW[int(vehicleRecords["entity"][vehicleIndex])] = kittiBoxes[vehicleIndex].astype(int).tolist()
 
+        log.debug("Projected boxes: " + str(self.dict_2d_bb_NEW) + ", centers: " + str(kittiCenters[visible].tolist()))
 
+        imageView.showViewWith2dBoundingBoxes(list(self.dict_2d_bb_NEW.values()), imageView.kittiImage, window_size = 0.7)
@@ -0,0 +1,69 @@
+import numpy as np
+
+class LabelIndex:
+    '''
+    Inverted index from the values of a per-point label array (labels or detailed labels/gameobject ids)
+    to the indices of the points that have them.
+    It is stored CSR-style: the point indices sorted by label (order), and the position in order where
+    the points of each different label start (offsets), so the points of any label are a single slice.
+    '''
+
+    def __init__(self, point_labels):
+        '''
+        Arguments:
+            - point_labels: (N,) array (or list) with the label of each point
+        '''
+        point_labels = np.asarray(point_labels).reshape(-1)
+
+        # point indices sorted by label; stable so the points of each label keep the point cloud order
+        self.order = np.argsort(point_labels, kind='stable')
+        sorted_labels = point_labels[self.order]
+
+        # different labels (sorted) and where their points start in order
+        self.labels, starts = np.unique(sorted_labels, return_index=True)
+        self.offsets = np.append(starts, len(point_labels))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return self.findLabel(label) >= 0
+
+    def findLabel(self, label):
+        '''
+        Returns:
+            - position of the label in the labels array, or -1 if no point has it
+        '''
+        i = np.searchsorted(self.labels, label)
+        if i < len(self.labels) and self.labels[i] == label:
+            return int(i)
+        return -1
+
+    def getIndices(self, label):
+        '''
+        Returns:
+            - (k,) array with the indices of the points with the given label (a view of order, empty if the label does not exist)
+        '''
+        i = self.findLabel(label)
+        if i < 0:
+            return self.order[0:0]
+
+        return self.order[self.offsets[i]:self.offsets[i+1]]
+
+    def getCounts(self):
+        '''
+        Returns:
+            - (K,) array with the number of points of each label in the labels array
+        '''
+        return np.diff(self.offsets)
+
+    def split(self):
+        '''
+        Returns:
+            - dictionary where each key is a label and the value is the array with the indices of its points
+        '''
+        split_dict = {}
+        for i in range(0, len(self.labels)):
+            split_dict[self.labels[i].item()] = self.order[self.offsets[i]:self.offsets[i+1]]
+
+        return split_dict
@@ -0,0 +1,43 @@
+'''
+Deterministic colors for labels and gameobject ids (detailed labels).
+The color of a label is computed from a hash of its value, so the same label has the same color
+in every run and in every sample, without storing a palette.
+Ref: https://prng.di.unimi.it/splitmix64.c
+'''
+import numpy as np
+
+def hashLabels(labels, seed = 0):
+    '''
+    splitmix64 hash of integer labels.
+    Arguments:
+        - labels: array (or list) of integers
+        - seed: changes every color while keeping them deterministic
+    Returns:
+        - uint64 array with the same shape as labels
+    '''
+    z = np.asarray(labels).astype(np.int64).view(np.uint64) ^ np.uint64(seed)
+    # uint64 arithmetic wraps around, as in the reference implementation
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def labelColors(labels, seed = 0):
+    '''
+    Returns:
+        - (..., 3) uint8 array with the color (r, g, b) of each label
+    '''
+    h = hashLabels(labels, seed)
+    shifts = np.array([0, 8, 16], dtype=np.uint64)
+    return ((h[..., None] >> shifts) & np.uint64(0xFF)).astype(np.uint8)
+
+def colorPointsByLabel(point_labels, seed = 0):
+    '''
+    Colors every point by its label through a lookup table, so each different label is only hashed once.
+    Arguments:
+        - point_labels: (N,) array with the label of each point
+    Returns:
+        - (N, 3) uint8 array with the color (r, g, b) of each point
+    '''
+    labels, inverse = np.unique(np.asarray(point_labels).reshape(-1), return_inverse=True)
+    return labelColors(labels, seed)[inverse.reshape(-1)]
@@ -3,57 +3,32 @@ from pathlib import Path
 import numpy as np
 import os.path
 import math
+from PlyFile import createVertexArray, writePly
+# memory-mapped velodyne reader, imported here to keep the existing imports of this module working
+from VelodyneFile import loadKittiVelodyneFile
 
-def loadKittiVelodyneFile(file_path, include_luminance = False):
-    '''
-    Loads a kitti velodyne file (ex: 000000.bin) into a list of tuples, where each tuple has (x, y, z) or (x, y, z, l)
-    Right now it discards the 4th vaule of each point, i.e. the luminance
-    Argument:
-        - include_luminance: if the function should also store the pont intensisty value in the list of points
-    '''
-    # Source: https://github.com/hunse/kitti/blob/master/kitti/velodyne.py
-    points = np.fromfile(file_path, dtype=np.float32).reshape(-1, 4)
-    points = points[:, :3]  # exclude luminance
-
-    point_tuple_list = []
-    for i in range(len(points)):
-        point_tuple_list.append((points[i][0], points[i][1], points[i][2],))
-
-    return point_tuple_list
-
-def savePlyFile(filepath, tuple_list, attributes = None, color_for_every_point = (0, 255, 0)):
+def savePlyFile(filepath, tuple_list, attributes = None, color_for_every_point = (0, 255, 0), binary = True):
     '''
     For testing in the Main.py file
     Save list of points (possibly with attributes such as color) into a .PLY formated file
     Arguments: 
-        - tuple_list: list of points and their attributes
+        - tuple_list: list (or array) of points and their attributes
         - attributes: to indicate what type of attributes are included in the points:
             - c: each point has position + color (r, g, b)
+        - color_for_every_point: color given to the points when attributes is "c" but the points dont have color
+        - binary: write a binary_little_endian .PLY instead of an ascii one
     '''
-    with open(filepath, "w") as the_file:
-        header_lines = ["ply", "format ascii 1.0"]
-        header_lines.append("element vertex " + str(len(tuple_list)))
-        header_lines.append("property float x")
-        header_lines.append("property float y")
-        header_lines.append("property float z")
+    if len(tuple_list) == 0:
+        points = np.zeros((0, 3))
+    else:
+        points = np.asarray(tuple_list).reshape(len(tuple_list), -1)
 
-        # if point have color 
-        if attributes == "c":
-            header_lines.append("property uchar red")
-            header_lines.append("property uchar green")
-            header_lines.append("property uchar blue")
-        
-        header_lines.append("end_header")
-        
-        for i in range(0, len(header_lines)):
-            the_file.write(header_lines[i] + "\n")
+    colors = None
+    if attributes == "c":
+        # if the points dont have color, but the attributes is set to "c"
+        colors = points[:, 3:6] if points.shape[1] >= 6 else color_for_every_point
 
-        for i in range(0, len(tuple_list)):
-            if attributes == "c" and len(tuple_list[i]) <= 3:    # if the points dont have color, but the attributes is set to "c"
-                new_tuple = (tuple_list[i][0], tuple_list[i][1], tuple_list[i][2], color_for_every_point[0], color_for_every_point[1], color_for_every_point[2])
-                the_file.write(tupleToStr(new_tuple) + "\n")
-            else:
-                the_file.write(tupleToStr(tuple_list[i]) + "\n")
+    writePly(filepath, createVertexArray(points[:, 0:3], colors), binary)
 
 def tupleToStr(tuple):
     '''
@@ -1,11 +1,23 @@
 import os
+import re
+import time
+import logging
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from GtaSample import GtaSample
 from KittiSample import KittiSample
+from SampleCache import SampleCache
+from ExportManifest import ExportManifest
+from ExportPipeline import SamplePrefetcher, WriterPool, writeNow, getUtilizationReport
+from Instrumentation import configureLogging, stageTimers
 from LoadBinPointclouds import loadKittiVelodyneFile
 from LoadBinPointclouds import savePlyFile
 
+log = logging.getLogger(__name__)
+
 def testFunction():
-    print("test\n")
+    log.debug("test")
     #kittipointcloud = loadKittiVelodyneFile("000003.bin")
 
     #savePlyFile("1_exp2.ply", kittipointcloud, "c", (0, 150, 150))
@@ -27,60 +39,300 @@ kittiViewsDir = 'data_object_image_2/training/'
 # calibration matrices samples output directory
 kittiCalibDir = 'data_object_calib/training/calib/'
 
-# to generate the naming sequence for the kitti samples
-sampleCounter = 0
+# binary cache of the sample files, created next to the sample directories (rootDir/_SampleCache/)
+useSampleCache = True
+# maximum size of the cache directory in bytes
+maxSampleCacheBytes = 8 * 1024**3
+
+# number of processes exporting samples in parallel (1 = every sample is exported in this process)
+exportWorkers = 1
+
+# when exporting in this process, the samples go through a pipeline: a thread loads the next samples, this thread
+# processes them and a pool of threads writes the output files.
+# number of loaded samples waiting to be processed
+prefetchDepth = 2
+# number of threads writing output files
+writerThreads = 4
+# maximum number of file writes waiting or running; the processing waits when it is reached
+maxPendingWrites = 32
 
-### testing function
-testFunction()
+# the export manifest in rootKittiOutputDir records the samples already exported, so only new or changed samples are exported.
+# kitti id of the first sample, when there's no export manifest yet
+firstSampleId = 0
+# export every sample again, even if its source files did not change (the samples keep their kitti ids)
+reexportAll = False
 
-to_overwrite = input("Do you want to overwrite previous kitti samples? (No = 0, Yes = 1)\n> ")
+# logging level of the export: "DEBUG" also logs the summaries of the point clouds and images of every sample
+logLevel = "INFO"
+# json file in rootKittiOutputDir with the wall/CPU time, points/s and samples/s of each stage and the peak memory of the last run
+runReportFn = "export_report.json"
 
-if not int(to_overwrite):
-    # determine how many samples are in one of the destination directories to increase the counter accordingly
-    for subdir, dirs, files in os.walk(rootKittiOutputDir + kittiLabelsDir):
-        for sample_label_file in files:
-            sampleCounter += 1
+# sample cache of the current process (each worker process has its own)
+sampleCache = None
 
-print("Current number of samples in " + rootKittiOutputDir + ": " + str(sampleCounter))
+def naturalSortKey(name):
+    '''
+    Sorts names with numbers by their numeric value (LiDAR_PointCloud2 before LiDAR_PointCloud10).
+    '''
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+def findSampleDirs(rootDir):
+    '''
+    Returns:
+        - sorted list with the names of the sample directories in rootDir; new samples get their kitti ids
+          in this order, so the ids don't depend on the file system order
+    '''
+    sampleDirs = []
+    for name in os.listdir(rootDir):
+        # the cache directory does not hold samples
+        if name == SampleCache.cacheDirName or not os.path.isdir(os.path.join(rootDir, name)):
+            continue
+        sampleDirs.append(name)
 
+    return sorted(sampleDirs, key=naturalSortKey)
 
-# walk through all samples in rootDir and create the kitti output accordingly
-for subdir, dirs, files in os.walk(rootDir):
-    for dirName in dirs:
-        print('\n\n::::::: Current sample directory: ' + dirName + ' :::::::')
+def initExportProcess(useCache, processLogLevel = None):
+    '''
+    Creates the sample cache of a process that exports samples.
+    Arguments:
+        - processLogLevel: if given, the logging of the process is configured with this level (for worker processes)
+    '''
+    global sampleCache
+    if processLogLevel is not None:
+        configureLogging(processLogLevel)
+    sampleCache = None
+    if useCache:
+        sampleCache = SampleCache(os.path.join(rootDir, SampleCache.cacheDirName), maxCacheBytes = maxSampleCacheBytes)
 
+def exportSample(dirName, sampleId, sampleArrays = None, fileWriter = writeNow):
+    '''
+    Creates the kitti sample of a sample directory. Errors are caught, so a bad sample doesn't stop the other ones.
+    Arguments:
+        - dirName: name of the sample directory (in rootDir)
+        - sampleId: kitti id of the sample (name of its files)
+        - sampleArrays: optional arrays of the sample files, already loaded with GtaSample.loadSampleArrays
+        - fileWriter: function called as fileWriter(saveFn, *args) for each output file; by default the files are written
+          before returning, so a sample is only complete when the writes given to another fileWriter have finished
+    Returns:
+        - tuple (dirName, sampleId, status, message), where status is "exported", "no vehicles" or "failed"
+    '''
+    log.info("Exporting sample directory " + dirName + " (sample " + str(sampleId) + ")")
+
+    try:
         # load sample (point cloud + front view image) and create the original pointcloud, a rotated point cloud, a front view point cloud, the kitti dataset resolution image
-        pc_sample1 = GtaSample(rootDir + dirName)
+        # the point clouds and images of the sample are released at the end of the with block, so memory does not grow with the number of samples
+        with GtaSample(rootDir + dirName, sampleCache, sampleArrays) as pc_sample1:
 
-        # save the original point cloud (not rotated) into a file
-        pc_sample1.savePlyFile('Original point cloud.ply', pc_sample1.pcData.list_raw_pc)
-        
-        pc_sample1.savePlyFile("Rotated point cloud.ply", pc_sample1.pcData.list_rotated_raw_pc)
+            # save the original point cloud (not rotated) into a file
+            fileWriter(pc_sample1.savePlyFile, 'Original point cloud.ply', pc_sample1.pcData.list_raw_pc)
 
-        pc_sample1.savePlyFile("Frontview point cloud.ply", pc_sample1.pcFvData.list_rotated_raw_pc)
+            fileWriter(pc_sample1.savePlyFile, "Rotated point cloud.ply", pc_sample1.pcData.list_rotated_raw_pc)
 
-        # create a point cloud only with points with label = 2, vehicles
-        pc_sample1.pcFvData. \
-            generateSingleCategoryPointCloud(2, category_name="vehicles", debug_mode=True)
+            fileWriter(pc_sample1.savePlyFile, "Frontview point cloud.ply", pc_sample1.pcFvData.list_rotated_raw_pc)
 
-        # if no vehicle points were detected in the front view point cloud, pass to the next sample
-        if 2 not in pc_sample1.pcFvData.single_category_pcs_list.keys():
-            continue
+            # create a point cloud only with points with label = 2, vehicles
+            pc_sample1.pcFvData. \
+                generateSingleCategoryPointCloud(2, category_name="vehicles")
+
+            # if no vehicle points were detected in the front view point cloud, pass to the next sample
+            if 2 not in pc_sample1.pcFvData.single_category_pcs_list.keys():
+                return dirName, sampleId, "no vehicles", ""
+
+            # save the vehicles frontview pointcloud into a file, each vehicle with its own color
+            vehiclesPc = pc_sample1.pcFvData.single_category_pcs_list[2]
+            fileWriter(pc_sample1.savePlyFileFromArrays, "Vehicles point cloud.ply", vehiclesPc.positions, vehiclesPc.getPointColors())
+
+            with KittiSample(pc_sample1, rootKittiOutputDir, kittiLabelsDir, kittiVelodyneDir, kittiViewsDir, kittiCalibDir, sampleId, fileWriter) as kittiSample1:
+                pass
+
+            #pc_sample1.outputKittiLabelFile(sampleCounter)
+
+            # show kitti dataset resolution front viw with the calculated 2d bounding boxes
+            #pc_sample1.imageView.show_image_view_with_2d_bounding_boxes(pc_sample1.imageView.dict_2d_bb_of_kitti_image, pc_sample1.imageView.kitti_image, pc_sample1.pc_fv_raw_data.single_category_pcs_list[2].object_ids_list, window_size = 1)
+
+    except Exception:
+        return dirName, sampleId, "failed", traceback.format_exc()
+
+    return dirName, sampleId, "exported", ""
+
+def exportSampleInWorker(dirName, sampleId):
+    '''
+    exportSample for the worker processes.
+    Returns:
+        - the result of exportSample, the stage timers of the sample (merged into the timers of the main process)
+          and the sample cache stats of the sample (None without cache), added up by the main process
+    '''
+    stageTimers.reset()
+    cacheStatsBefore = sampleCache.getStats() if sampleCache is not None else None
+    result = exportSample(dirName, sampleId)
+
+    cacheStats = None
+    if sampleCache is not None:
+        cacheStats = {key: value - cacheStatsBefore[key] for key, value in sampleCache.getStats().items()}
+    return result, stageTimers.getStats(), cacheStats
+
+def addCacheStats(totalStats, stats):
+    '''
+    Adds the sample cache stats (SampleCache.getStats) of a process or a sample to the totals.
+    '''
+    for key, value in stats.items():
+        totalStats[key] = totalStats.get(key, 0) + value
 
-        # save the vehicles frontview pointcloud into a file
-        pc_sample1.savePlyFileFromDict("Vehicles point cloud.ply", \
-            pc_sample1.pcFvData.single_category_pcs_list[2].getColoredPointCloudDictByDetailedLabels(), attributes = 'c')
+def getKittiOutputPaths(sampleId):
+    '''
+    Returns:
+        - paths of the files of a kitti sample: image, velodyne, calib and label
+    '''
+    fileName = KittiSample.getOutputFileName(sampleId)
+    return [rootKittiOutputDir + kittiViewsDir + fileName + ".png",
+            rootKittiOutputDir + kittiVelodyneDir + fileName + ".bin",
+            rootKittiOutputDir + kittiCalibDir + fileName + ".txt",
+            rootKittiOutputDir + kittiLabelsDir + fileName + ".txt"]
+
+def removeKittiOutput(sampleId):
+    '''
+    Removes the files of a kitti sample, so no incomplete sample (ex: image without label) is left in the dataset.
+    '''
+    for filePath in getKittiOutputPaths(sampleId):
+        if os.path.exists(filePath):
+            os.remove(filePath)
+
+def exportSamplesPipelined(jobs, onResult):
+    '''
+    Exports the samples in this process, overlapping the loading of the next samples and the writing of the
+    previous ones with the processing of the current sample (see prefetchDepth, writerThreads and maxPendingWrites).
+    The result of a sample is only given to onResult when all its files were written, in the order of jobs.
+    Returns:
+        - sample cache stats (SampleCache.getStats), or None without cache
+    '''
+    initExportProcess(useSampleCache)
+
+    def loadSample(job):
+        return GtaSample.loadSampleArrays(rootDir + job[0], sampleCache)
+
+    writerPool = WriterPool(writerThreads, maxPendingWrites)
+    # results of the processed samples, with the batch of their file writes
+    pendingResults = deque()
+
+    def finishResults(wait):
+        while len(pendingResults) > 0 and (wait or pendingResults[0][1].isDone()):
+            result, writes = pendingResults.popleft()
+            writeError = writes.getError()
+            if writeError is not None and result[2] != "failed":
+                result = (result[0], result[1], "failed", writeError)
+            onResult(result)
+
+    startTime = time.perf_counter()
+    computeSeconds = 0.0
+    prefetcher = SamplePrefetcher(jobs, loadSample, prefetchDepth)
+    try:
+        for (dirName, sampleId), sampleArrays, loadError in prefetcher:
+            writes = writerPool.createBatch()
+            if loadError is not None:
+                result = (dirName, sampleId, "failed", loadError)
+            else:
+                computeStart = time.perf_counter()
+                result = exportSample(dirName, sampleId, sampleArrays, writes)
+                computeSeconds += time.perf_counter() - computeStart
+            # drop the reference, so the arrays are freed as soon as the writes of the sample finish
+            sampleArrays = None
+
+            pendingResults.append((result, writes))
+            finishResults(wait = False)
+    finally:
+        writerPool.shutdown()
+        finishResults(wait = True)
+
+    log.info(getUtilizationReport(time.perf_counter() - startTime, prefetcher, computeSeconds, writerPool))
+    return sampleCache.getStats() if sampleCache is not None else None
+
+def exportSamples(jobs, nWorkers, onResult):
+    '''
+    Exports the samples, in this process or in nWorkers processes. The output is the same in both cases,
+    since the id of each sample is assigned beforehand.
+    Arguments:
+        - jobs: list of (sample directory name, kitti id)
+        - onResult: function called in this process with the result of exportSample of each sample, as soon as it finishes
+    Returns:
+        - sample cache stats of every process (hits, misses, evictions), or None without cache
+    '''
+    if nWorkers <= 1:
+        cacheStats = exportSamplesPipelined(jobs, onResult)
+    else:
+        cacheStats = None
+        with ProcessPoolExecutor(max_workers=nWorkers, initializer=initExportProcess, initargs=(useSampleCache, logLevel)) as executor:
+            futures = [executor.submit(exportSampleInWorker, dirName, sampleId) for dirName, sampleId in jobs]
+            for future in as_completed(futures):
+                result, sampleStageStats, sampleCacheStats = future.result()
+                stageTimers.merge(sampleStageStats)
+                if sampleCacheStats is not None:
+                    cacheStats = cacheStats if cacheStats is not None else {}
+                    addCacheStats(cacheStats, sampleCacheStats)
+                onResult(result)
+
+    if cacheStats is not None:
+        # a warm run with unchanged samples only has hits (no source file is parsed)
+        log.info("Sample cache: " + str(cacheStats))
+    return cacheStats
+
+def main():
+    configureLogging(logLevel)
+
+    ### testing function
+    testFunction()
+
+    manifest = ExportManifest(rootKittiOutputDir)
+    if len(manifest.entries) == 0:
+        manifest.nextId = max(manifest.nextId, firstSampleId)
+
+    sampleDirs = findSampleDirs(rootDir)
+
+    # remove the kitti samples of the sample directories that were deleted
+    for dirName in manifest.getRemovedDirs(sampleDirs):
+        removeKittiOutput(manifest.removeEntry(dirName)["id"])
+
+    # new or changed samples, and samples whose export was interrupted or failed. New samples get the next ids, in the order of sampleDirs
+    sourceFns = GtaSample.getSourceFns() + [GtaSample.vehiclesInfoFn]
+    jobs = []
+    for dirName in sampleDirs:
+        sources, sampleHash = manifest.getSourcesInfo(dirName, rootDir + dirName, sourceFns)
+        if not reexportAll and manifest.isUpToDate(dirName, sampleHash):
+            continue
 
-        kittiSample1 = KittiSample(pc_sample1, rootKittiOutputDir, kittiLabelsDir, kittiVelodyneDir, kittiViewsDir, kittiCalibDir, sampleCounter)
+        sampleId = manifest.getId(dirName)
+        # files of a previous export of the sample
+        removeKittiOutput(sampleId)
+        manifest.setStatus(dirName, "pending", sampleHash, sources)
+        jobs.append((dirName, sampleId))
+    manifest.save()
 
-        #pc_sample1.outputKittiLabelFile(sampleCounter)
+    log.info(str(len(sampleDirs)) + " samples in " + rootDir + ", " + str(len(jobs)) + " to export into " + rootKittiOutputDir)
 
-        # show kitti dataset resolution front viw with the calculated 2d bounding boxes
-        #pc_sample1.imageView.show_image_view_with_2d_bounding_boxes(pc_sample1.imageView.dict_2d_bb_of_kitti_image, pc_sample1.imageView.kitti_image, pc_sample1.pc_fv_raw_data.single_category_pcs_list[2].object_ids_list, window_size = 1)
+    results = []
+    def onResult(result):
+        dirName, sampleId, status, message = result
+        if status == "failed":
+            removeKittiOutput(sampleId)
+        manifest.setStatus(dirName, status)
+        manifest.save(force = False)
+        results.append(result)
 
-        sampleCounter += 1
+    startTime = time.perf_counter()
+    exportSamples(jobs, exportWorkers, onResult)
+    manifest.save()
 
-        #input()
+    for dirName, sampleId, status, message in sorted(results, key=lambda result: result[1]):
+        if status == "failed":
+            log.error("Failed to export " + dirName + " (sample " + str(sampleId) + "):\n" + message)
 
+    log.info("Exported " + str(sum(1 for result in results if result[2] == "exported")) + " of " + str(len(results)) + " samples, "
+        + str(sum(1 for result in results if result[2] == "no vehicles")) + " without vehicles, "
+        + str(sum(1 for result in results if result[2] == "failed")) + " failed")
+    log.info("Export manifest: " + str(manifest.getStatusCounts()))
 
+    report = stageTimers.saveReport(os.path.join(rootKittiOutputDir, runReportFn), time.perf_counter() - startTime, len(results))
+    log.info("Run report: %.2f samples/s, %.0f points/s, peak memory %s bytes (%s)", report["samples_per_second"],
+        report["points_per_second"], report["peak_memory_bytes"], os.path.join(rootKittiOutputDir, runReportFn))
 
+if __name__ == "__main__":
+    main()
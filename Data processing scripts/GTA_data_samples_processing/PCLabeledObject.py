@@ -4,31 +4,43 @@ import numpy as np
 import random
 import cv2
 import os.path
+from LabelIndex import LabelIndex
+from LabelPalette import labelColors
 
 class PcLabeledObject():
     '''
     This object represents a data of a point cloud containing only one type object (pedestrians, vehicles, ...).
     It can represent vehicles, pedestrians, and so on...
+    The points are stored sorted by gameobject id (detailed label), so the points of each gameobject are a contiguous
+    segment of the arrays, delimited by segment_offsets.
     '''
 
-    # category/label id and name
-    category_id = -1
-    category_name = ""
+    # every attribute is per instance; __slots__ keeps the instances compact and prevents state shared between samples
+    __slots__ = (
+        # category/label id and name
+        'category_id',
+        'category_name',
 
-    #### Each key of the dictionaries is an id present in the categories_ids list   ####
+        # list of all the different gameobject ids (detailed labels) within the point cloud, sorted
+        'object_ids_list',
+        # (K,) array with the same ids
+        'object_ids',
 
-    # list of all the different gameobject ids (detailed labels) within the point cloud
-    object_ids_list = []
+        # (K+1,) array where the points of the gameobject object_ids[i] are in the rows [segment_offsets[i], segment_offsets[i+1]) of the point arrays
+        'segment_offsets',
 
-    # color for each detailed label
-    color_per_detailed_label_dict = {}
-    
-    # each value is a list of positions [(x, y, z), ...] of the points belonging to a gameobject
-    dict_of_positions_per_obj = {}
-    # each value is a list of colors [(r, g, b), ...] of the points belonging to a gameobject
-    dict_of_colors_per_obj = {}
-    # each value is a list of projected points [(projx, projy), ...] of the points belonging to a gameobject
-    dict_projected_coords_per_obj = {}
+        #### Point arrays, sorted by gameobject id ####
+
+        # (M, 3) float32 array with the position (x, y, z) of each point
+        'positions',
+        # (M, 2) int32 array with the projected coordinates (projx, projy) of each point
+        'projected_coords',
+        # (M,) array with the gameobject id of each point
+        'point_object_ids',
+
+        # (K, 3) uint8 array with the color (r, g, b) of each gameobject (see LabelPalette); the color of a point is looked up from it
+        'palette',
+    )
 
     # FOI PASSADO PARA O GTAView.py
     # each value is a list [minX, maxX, minY, maxY] of the 2D bounding box belonging to a gameobject, in the original image resolution (taken from gta)
@@ -39,62 +51,60 @@ class PcLabeledObject():
     def __init__(self, list_raw_pc, list_raw_detailed_labels, list_raw_projected_points, category_id, category_name = "", debug_mode = False):
         '''
         The argument's point cloud data only correspond to a single label/category
+        Arguments:
+            - list_raw_pc: (M, 3) array (or list) with the points positions
+            - list_raw_detailed_labels: (M,) array (or list) with the gameobject id of each point
+            - list_raw_projected_points: (M, 2+) array (or list) with (projx, projy, ...) of each point
         '''
         self.category_id = category_id
         self.category_name = category_name
 
-        self.object_ids_list = self.getIndividualObjectIds(list_raw_detailed_labels)
-
-        self.dict_of_positions_per_obj, self.dict_of_colors_per_obj, self.dict_projected_coords_per_obj, self.color_per_detailed_label_dict = self.createDictsToSeparateIndividualObjects(list_raw_pc, list_raw_detailed_labels, list_raw_projected_points, self.object_ids_list)
+        self.createSegmentsToSeparateIndividualObjects(list_raw_pc, list_raw_detailed_labels, list_raw_projected_points)
 
-    def generateRandomColorsForObjects(self, object_ids_list):
-        # create random colors for the different object ids
-        #print(object_ids_list)
-        color_per_object_id_dict = {}     # dicionario onde cada key é um gameobject id, e onde cada valor é uma string a indicar a cor rgb. 
-        for i in range(0, len(object_ids_list)):
-            # generate random rgb color for the id of the current iteration
-            r = random.randint(0, 256)   # random value between [0, 255]
-            g = random.randint(0, 256)
-            b = random.randint(0, 256)
-            color_per_object_id_dict[object_ids_list[i]] = (r, g, b) 
-        
-        return color_per_object_id_dict
+        self.palette = self.generateColorsForObjects(self.object_ids_list)
 
-    def createDictsToSeparateIndividualObjects(self, list_raw_pc, list_raw_detailed_labels, list_raw_projected_points, object_ids_list):
+    def release(self):
         '''
-        Creates a dictionary with positions + color per vehicle, and a dictionary of the correpondent projected coordinates.
-        Arguments:
-            - point_list: point cloud with points belongin to the same label
-            - labels_detailed_list: list of ints (detailed_labels) of a point cloud only with points of the same label
-            - object_ids_list: list of the different detailed_labels of the in the point_list
-        Returns:
-            - dictionary with lists of tuples (x, y, z, r, g, b) corresponding to various cars in thte point cloud. The keys are the objects ids (detailed labels).
-            - dictionary of projected points, where each key is an object id and the value is a list of 2 values (projx, projy)
+        Drops the references to the point arrays, so their memory can be freed as soon as the sample is processed.
         '''
+        self.positions = None
+        self.projected_coords = None
+        self.point_object_ids = None
+        self.segment_offsets = None
+        self.palette = None
+        self.object_ids = None
+        self.object_ids_list = []
 
-        color_per_object_dict = self.generateRandomColorsForObjects(object_ids_list)
+    def __enter__(self):
+        return self
 
-        # dictionary
-        dict_of_positions_per_obj = {}
-        dict_of_colors_per_obj = {}
-        dict_projected_coords_per_obj = {}
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
 
-        for i in range(0, len(list_raw_pc)):
-            if list_raw_detailed_labels[i] not in dict_of_positions_per_obj.keys():
-                dict_of_positions_per_obj[list_raw_detailed_labels[i]] = []
-                dict_of_colors_per_obj[list_raw_detailed_labels[i]] = []
-                dict_projected_coords_per_obj[list_raw_detailed_labels[i]] = []
+    def createSegmentsToSeparateIndividualObjects(self, list_raw_pc, list_raw_detailed_labels, list_raw_projected_points):
+        '''
+        Sorts the points by gameobject id and finds the segment of each gameobject.
+        '''
+        detailed_labels = np.asarray(list_raw_detailed_labels).reshape(-1)
+        index = LabelIndex(detailed_labels)
 
-            dict_of_positions_per_obj[list_raw_detailed_labels[i]].append((list_raw_pc[i][0], list_raw_pc[i][1], list_raw_pc[i][2]))
+        self.object_ids = index.labels
+        self.object_ids_list = self.object_ids.tolist()
+        self.segment_offsets = index.offsets
 
-            
-            dict_of_colors_per_obj[list_raw_detailed_labels[i]].append((color_per_object_dict[list_raw_detailed_labels[i]][0],
-                                                                    color_per_object_dict[list_raw_detailed_labels[i]][1], 
-                                                                    color_per_object_dict[list_raw_detailed_labels[i]][2]))
-                        
-            dict_projected_coords_per_obj[list_raw_detailed_labels[i]].append((list_raw_projected_points[i][0], list_raw_projected_points[i][1]))
+        self.positions = np.asarray(list_raw_pc, dtype=np.float32).reshape(-1, 3)[index.order]
+        if len(detailed_labels) > 0:
+            self.projected_coords = np.asarray(list_raw_projected_points, dtype=np.int32).reshape(len(detailed_labels), -1)[index.order, 0:2]
+        else:
+            self.projected_coords = np.zeros((0, 2), dtype=np.int32)
+        self.point_object_ids = detailed_labels[index.order]
 
-        return dict_of_positions_per_obj, dict_of_colors_per_obj, dict_projected_coords_per_obj, color_per_object_dict
+    def generateColorsForObjects(self, object_ids_list):
+        '''
+        Returns:
+            - (K, 3) uint8 array with a color (r, g, b) for each of the object ids, the same in every run and sample
+        '''
+        return labelColors(np.asarray(object_ids_list, dtype=np.int64).reshape(-1))
 
     def getIndividualObjectIds(self, labels_detailed_list):
         '''
@@ -102,33 +112,88 @@ class PcLabeledObject():
         Arguments:
             - labels_detailed_list: list of ints (detailed_labels) of a point cloud only with points of the same label
         Returns:
-            - list of integers with thte different ids found
+            - sorted list of integers with thte different ids found
         '''
-        new_list = []
-        for i in range(0, len(labels_detailed_list)):
-            if labels_detailed_list[i] not in new_list:
-                new_list.append(labels_detailed_list[i])
+        return np.unique(np.asarray(labels_detailed_list)).tolist()
 
-        return new_list
+    def getObjectSlice(self, object_id):
+        '''
+        Returns:
+            - slice of the point arrays with the points of the given gameobject id
+        '''
+        i = self.object_ids_list.index(object_id)
+        return slice(self.segment_offsets[i], self.segment_offsets[i+1])
+
+    def getPointColors(self):
+        '''
+        Returns:
+            - (M, 3) uint8 array with the color of each point (the color of its gameobject)
+        '''
+        return np.repeat(self.palette, self.getPointCounts(), axis=0)
+
+    def getColorPerObjectDict(self):
+        '''
+        Returns:
+            - dictionary with the color (r, g, b) of each gameobject id
+        '''
+        return {self.object_ids_list[i]: tuple(self.palette[i].tolist()) for i in range(0, len(self.object_ids_list))}
+
+    #### Per gameobject reductions, each returns an array with one row per gameobject (same order as object_ids) ####
+
+    def getPointCounts(self):
+        '''
+        Returns:
+            - (K,) array with the number of points of each gameobject
+        '''
+        return np.diff(self.segment_offsets)
+
+    def reduceSegments(self, ufunc, values):
+        '''
+        Applies a reduction (ex: np.add, np.minimum) to the rows of each gameobject segment.
+        '''
+        if len(self.object_ids) == 0:
+            return np.zeros((0,) + values.shape[1:], dtype=values.dtype)
+
+        return ufunc.reduceat(values, self.segment_offsets[:-1], axis=0)
+
+    def getCentroids(self):
+        '''
+        Returns:
+            - (K, 3) array with the mean position of the points of each gameobject
+        '''
+        return self.reduceSegments(np.add, self.positions.astype(np.float64)) / self.getPointCounts()[:, None]
+
+    def getMinXyz(self):
+        return self.reduceSegments(np.minimum, self.positions)
+
+    def getMaxXyz(self):
+        return self.reduceSegments(np.maximum, self.positions)
+
+    def get2dBoundingBoxes(self):
+        '''
+        2D bounding boxes of the gameobjects computed from their projected points (in the original image resolution).
+        Returns:
+            - (K, 4) int32 array with (minx, miny, maxx, maxy) of each gameobject
+        '''
+        min_coords = self.reduceSegments(np.minimum, self.projected_coords)
+        max_coords = self.reduceSegments(np.maximum, self.projected_coords)
+
+        return np.hstack((min_coords, max_coords))
+
+    #### Dictionaries per gameobject id, built from the segments ####
 
     def getUncoloredPointCloudDict(self):
-        return self.dict_of_positions_per_obj
+        '''
+        Returns:
+            - dictionary with a (k, 3) array of positions per gameobject id (views of the positions array)
+        '''
+        return {self.object_ids_list[i]: self.positions[self.segment_offsets[i]:self.segment_offsets[i+1]] for i in range(0, len(self.object_ids_list))}
 
     def getColoredPointCloudDictByDetailedLabels(self):
         '''
-        Returns a list of tuples (x, y, z, r, g, b)
+        Returns:
+            - dictionary with a (k, 6) array of (x, y, z, r, g, b) per gameobject id
         '''
-        new_dict = {} # will contain, per detailed label, a list of tuples (x, y, z, r, g, b)
-        
-        for i in range(0, len(self.object_ids_list)):
-            new_dict[self.object_ids_list[i]] = []
-
-            for j in range(0, len(self.dict_of_positions_per_obj[self.object_ids_list[i]])):
-                new_dict[self.object_ids_list[i]].append((self.dict_of_positions_per_obj[self.object_ids_list[i]][j][0],
-                                                    self.dict_of_positions_per_obj[self.object_ids_list[i]][j][1],
-                                                    self.dict_of_positions_per_obj[self.object_ids_list[i]][j][2],
-                                                    self.dict_of_colors_per_obj[self.object_ids_list[i]][j][0],
-                                                    self.dict_of_colors_per_obj[self.object_ids_list[i]][j][1],
-                                                    self.dict_of_colors_per_obj[self.object_ids_list[i]][j][2]))
+        colored_points = np.hstack((self.positions, self.getPointColors()))
 
-        return new_dict
\ No newline at end of file
+        return {self.object_ids_list[i]: colored_points[self.segment_offsets[i]:self.segment_offsets[i+1]] for i in range(0, len(self.object_ids_list))}
@@ -4,63 +4,204 @@ import numpy as np
 import random
 import cv2
 import os.path
+import logging
 from PcLabeledObject import PcLabeledObject
+from RigidTransform import RigidTransform
+from LabelIndex import LabelIndex
+from Instrumentation import stageTimers
+
+log = logging.getLogger(__name__)
 
 class PcRaw:
     '''
     Contains raw information about a point cloud.
     It can be an entire point cloud, or a point cloud with points associated to a given label (vehicles, pedestrians, ...). 
     '''
-    pc_name = ""
-    # Raw point cloud containing the points of all the object in the category. It is a list of tuples representing the position (x, y, z) of each the points
-    list_raw_pc = []
-    # roation in radians to aligne point cloud with the direction that the character is facing
-    rotation_amount = 0
-    # Rotate raw point cloud, list of (x, y, z) tuples
-    list_rotated_raw_pc = []
-    # List that associates each point of list_raw_pc to the correspondent labels. Each label is an integer
-    list_raw_labels = []
-    # List that associates each point of list_raw_pc to the correspondent gameobject id. Each id is represented by an integer.
-    list_raw_detailed_labels = []
-    # List of tuples (projx, projy, viewID) storing the projection of each point of the point cloud onto the front view image
-    list_raw_projected_points = []
-    # List of all the different labels within the point cloud
-    list_labels = []
-
-    # dict of PCLabeledObject's, where each key is a label/category integer 
-    single_category_pcs_list = {}
+    # every attribute is per instance; __slots__ keeps the instances compact and prevents state shared between samples
+    __slots__ = (
+        'pc_name',
+        # roation in radians to aligne point cloud with the direction that the character is facing
+        'rotation_amount',
+        # RigidTransform from the raw point cloud coordinates to the rotated point cloud coordinates
+        'transform',
+
+        #### Point arrays, shared by a point cloud and all the subsets created from it ####
+
+        # (N, 3) array with the raw position (x, y, z) of each point
+        'raw_pc',
+        # (N, 3) float32 array with the rotated position (x, y, z) of each point
+        'rotated_pc',
+        # (N,) array with the label of each point. Each label is an integer
+        'raw_labels',
+        # (N,) array with the gameobject id of each point. Each id is represented by an integer.
+        'raw_detailed_labels',
+        # (N, 3) array of (projx, projy, viewID) storing the projection of each point of the point cloud onto the view images
+        'raw_projected_points',
+        # indices (into the arrays above) of the points that belong to this point cloud, or None if it has all the points
+        'point_indices',
+
+        # List of all the different labels within the point cloud
+        'list_labels',
+        # LabelIndex with the points of each label, and LabelIndex with the points of each gameobject id (detailed label).
+        # The indices are relative to this point cloud (positions in list_raw_pc, ...)
+        'label_index',
+        'detailed_label_index',
+
+        # dict of PCLabeledObject's, where each key is a label/category integer 
+        'single_category_pcs_list',
+    )
 
     def __init__(self, list_raw_pc, list_raw_labels, list_raw_detailed_labels, list_raw_projected_points, camRot = 0, debugMode = False, pcName = ""):
         self.pc_name = pcName
         self.rotation_amount = self.degreesToRad(camRot)  # rotation around z axis, in radians
-        self.list_labels = self.getListLabelsWithinPc(list_raw_labels)
+        self.transform = RigidTransform().rotateZ(self.rotation_amount)
 
-        self.list_raw_pc = list_raw_pc
-        self.list_raw_labels = list_raw_labels
-        self.list_raw_detailed_labels = list_raw_detailed_labels
-        self.list_raw_projected_points = list_raw_projected_points
+        self.raw_pc = np.asarray(list_raw_pc)
+        self.raw_labels = np.asarray(list_raw_labels)
+        self.raw_detailed_labels = np.asarray(list_raw_detailed_labels)
+        self.raw_projected_points = np.asarray(list_raw_projected_points)
+        self.point_indices = None
+        self.single_category_pcs_list = {}
 
-        self.list_rotated_raw_pc = self.rotatePcToAlignWithRectCamCoordSystem(self.list_raw_pc, self.rotation_amount)
+        with stageTimers.stage("rotate", len(self.raw_pc)):
+            self.rotated_pc = self.rotatePcToAlignWithRectCamCoordSystem(self.raw_pc, self.rotation_amount)
+
+        with stageTimers.stage("split", len(self.raw_pc)):
+            self.createLabelIndices()
         
         self.debug(debugMode)
 
+    def createSubset(self, points_selection, pcName = "", debugMode = False):
+        '''
+        Creates a point cloud with a subset of the points of this point cloud (ex: the points of a view or within a FOV).
+        The new point cloud shares the arrays (and the rotation) of this one, so nothing is copied or rotated again;
+        its arrays (list_raw_pc, list_rotated_raw_pc, ...) are only gathered when they are accessed.
+        Arguments:
+            - points_selection: boolean mask with one value per point of this point cloud, or array of point indices
+        Returns:
+            - PcRaw instance
+        '''
+        points_selection = np.asarray(points_selection)
+        if points_selection.dtype == bool:
+            points_selection = np.flatnonzero(points_selection)
+
+        subset = PcRaw.__new__(PcRaw)
+        subset.pc_name = pcName
+        subset.rotation_amount = self.rotation_amount
+        subset.transform = self.transform
+
+        subset.raw_pc = self.raw_pc
+        subset.rotated_pc = self.rotated_pc
+        subset.raw_labels = self.raw_labels
+        subset.raw_detailed_labels = self.raw_detailed_labels
+        subset.raw_projected_points = self.raw_projected_points
+        subset.point_indices = self.toParentIndices(points_selection)
+        subset.single_category_pcs_list = {}
+
+        with stageTimers.stage("split", len(subset.point_indices)):
+            subset.createLabelIndices()
+
+        subset.debug(debugMode)
+
+        return subset
+
+    def release(self):
+        '''
+        Drops the references to the point arrays and category point clouds, so their memory can be freed
+        as soon as the sample is processed. The point arrays are only freed when no subset references them.
+        '''
+        for category_pc in self.single_category_pcs_list.values():
+            category_pc.release()
+        self.single_category_pcs_list = {}
+
+        self.raw_pc = None
+        self.rotated_pc = None
+        self.raw_labels = None
+        self.raw_detailed_labels = None
+        self.raw_projected_points = None
+        self.point_indices = None
+        self.label_index = None
+        self.detailed_label_index = None
+        self.list_labels = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def createLabelIndices(self):
+        # built once, so the points of any category or gameobject are found without scanning the point cloud
+        self.label_index = LabelIndex(self.list_raw_labels)
+        self.detailed_label_index = LabelIndex(self.list_raw_detailed_labels)
+        self.list_labels = self.label_index.labels.tolist()
+
+    def toParentIndices(self, point_indices):
+        '''
+        Converts indices of points of this point cloud into indices of the shared point arrays.
+        '''
+        if self.point_indices is None:
+            return point_indices
+
+        return self.point_indices[point_indices]
+
+    def selectPoints(self, array):
+        if self.point_indices is None:
+            return array
+
+        return array[self.point_indices]
+
+    def getNumPoints(self):
+        if self.point_indices is None:
+            return len(self.raw_labels)
+
+        return len(self.point_indices)
+
+    @property
+    def list_raw_pc(self):
+        '''
+        Raw point cloud, (N, 3) array of (x, y, z)
+        '''
+        return self.selectPoints(self.raw_pc)
+
+    @property
+    def list_rotated_raw_pc(self):
+        '''
+        Rotated raw point cloud, (N, 3) float32 array of (x, y, z)
+        '''
+        return self.selectPoints(self.rotated_pc)
+
+    @property
+    def list_raw_labels(self):
+        '''
+        (N,) array that associates each point of list_raw_pc to the correspondent label
+        '''
+        return self.selectPoints(self.raw_labels)
+
+    @property
+    def list_raw_detailed_labels(self):
+        '''
+        (N,) array that associates each point of list_raw_pc to the correspondent gameobject id
+        '''
+        return self.selectPoints(self.raw_detailed_labels)
+
+    @property
+    def list_raw_projected_points(self):
+        '''
+        (N, 3) array of (projx, projy, viewID) of each point of list_raw_pc
+        '''
+        return self.selectPoints(self.raw_projected_points)
+
     def rotatePcToAlignWithRectCamCoordSystem(self, point_list, rotation_rad):
         '''
         Rotates the entire point cloud to align with the rectified camera coordinate system
         Arguments:
-            - tuple list with all the point cloud points.
+            - (N, 3) array (or tuple list) with all the point cloud points.
             - angle_rad: rotation in radians
         Returns:
-            - tuple list with the rotated point cloud points
+            - (N, 3) float32 array with the rotated point cloud points
         '''
-        rot_point_list = []
-        for i in range(0, len(point_list)):
-            rot_point_tuple = self.rotatePointAroundZaxis(point_list[i], rotation_rad)
-            #rot_point_tuple = self.rotatePointAroundYaxis(rot_point_tuple, self.degreesToRad(-90))
-            #rot_point_tuple = self.scalePoint(rot_point_tuple, 1, -1, 1)
-            rot_point_list.append(rot_point_tuple)
-
-        return rot_point_list
+        return RigidTransform().rotateZ(rotation_rad).apply(np.asarray(point_list, dtype=np.float32).reshape(-1, 3))
     
     def rotatePointAroundZaxis(self, point, angle_rad):
         '''
@@ -134,50 +275,81 @@ class PcRaw:
     def getListLabelsWithinPc(self, point_cloud_labels):
         '''
         Search for all different labels within a point cloud.
+        Returns:
+            - sorted list with the different labels
         '''
-        list = []
-        for i in range(0, len(point_cloud_labels)):
-            if point_cloud_labels[i] not in list:
-                list.append(point_cloud_labels[i])
-        return list
+        return np.unique(np.asarray(point_cloud_labels)).tolist()
 
     def debug(self, debug_mode):
-        if debug_mode:
-            print("\n==== PointCloud: " + self.pc_name + " ====")
-            print("Rotation amount: " + str(self.rotation_amount) + " rad")
-            print("list_raw_pc:\t\t\t " + str(len(self.list_raw_pc)) + " elements;\t element: " + str(type(self.list_raw_pc[0])) + ";\t element length: " + str(len(self.list_raw_pc[0])) + "; \tinfo: (x, y, z)")
-            print("list_raw_labels:\t\t " + str(len(self.list_raw_labels)) + " elements;\t element: " + str(type(self.list_raw_labels[0])))
-            print("list_raw_detailed_labels:\t " + str(len(self.list_raw_detailed_labels)) + " elements;\t element: " + str(type(self.list_raw_detailed_labels[0])))
-            print("list_raw_projected_points:\t " + str(len(self.list_raw_projected_points)) + " elements;\t element: " + str(type(self.list_raw_projected_points[0])) + ";\t element length: " + str(len(self.list_raw_projected_points[0])) + "; \tinfo: (projX, projY, viewID)")
-            print("list_rotated_raw_pc:\t\t " + str(len(self.list_rotated_raw_pc)) + " elements;\t element: " + str(type(self.list_rotated_raw_pc[0])) + ";\t element length: " + str(len(self.list_rotated_raw_pc[0])) + "; \tinfo: (x, y, z)")
-            print("list_labels:\t\t\t " + str(len(self.list_labels)) + " elements;\t\t element: " + str(type(self.list_labels[0])) + "\t\t printed list: " +  str(self.list_labels))
+        '''
+        Logs a summary of the point cloud: at info level if debug_mode, otherwise at debug level.
+        The summary is only formatted if the level is enabled.
+        '''
+        level = logging.INFO if debug_mode else logging.DEBUG
+        if not log.isEnabledFor(level):
+            return
+
+        log.log(level, "\n==== PointCloud: " + self.pc_name + " ====\n"
+            + "Rotation amount: " + str(self.rotation_amount) + " rad\n"
+            + "Number of points: " + str(self.getNumPoints()) + (" (subset of " + str(len(self.raw_labels)) + " points)" if self.point_indices is not None else "") + "\n"
+            + "raw_pc:\t\t\t " + str(self.raw_pc.shape) + " " + str(self.raw_pc.dtype) + "; \tinfo: (x, y, z)\n"
+            + "raw_labels:\t\t " + str(self.raw_labels.shape) + " " + str(self.raw_labels.dtype) + "\n"
+            + "raw_detailed_labels:\t " + str(self.raw_detailed_labels.shape) + " " + str(self.raw_detailed_labels.dtype) + "\n"
+            + "raw_projected_points:\t " + str(self.raw_projected_points.shape) + " " + str(self.raw_projected_points.dtype) + "; \tinfo: (projX, projY, viewID)\n"
+            + "rotated_pc:\t\t " + str(self.rotated_pc.shape) + " " + str(self.rotated_pc.dtype) + "; \tinfo: (x, y, z)\n"
+            + "list_labels:\t\t\t " + str(len(self.list_labels)) + " elements;\t\t printed list: " +  str(self.list_labels))
 
     def generateSingleCategoryPointCloud(self, category_id, category_name = "", debug_mode = False):
         '''
         Create a point cloud with points belonging to the same label/category.
         '''
-        category_exists = False
-        for i in range(0, len(self.list_labels)):
-            print("i: " + str(self.list_labels[i]))
-            if self.list_labels[i] == category_id:
-                category_exists = True
-
-        if not category_exists:
-            print("ERROR: label " + str(category_id)  + " does not exist!")
+        if category_id not in self.label_index:
+            log.debug("label " + str(category_id) + " does not exist in point cloud " + self.pc_name)
             return None
 
         # get all points with the given label/category
-        points = []
-        detailed_labels_list = []
-        projected_point_list = []
-        for i in range(0, len(self.list_rotated_raw_pc)):
-            if self.list_raw_labels[i] == category_id:
-                points.append(self.list_rotated_raw_pc[i])
-                detailed_labels_list.append(self.list_raw_detailed_labels[i])
-                projected_point_list.append(self.list_raw_projected_points[i])
-
-        category_pc = PcLabeledObject(points, detailed_labels_list, projected_point_list, debug_mode, category_id, category_name)
+        point_indices = self.label_index.getIndices(category_id)
+        with stageTimers.stage("split", len(point_indices)):
+            category_pc = self.createLabeledObject(point_indices, category_id, category_name, debug_mode)
 
         self.single_category_pcs_list[category_id] = category_pc
 
-    
\ No newline at end of file
+        return category_pc
+
+    def generateAllCategoryPointClouds(self, category_names = {}, debug_mode = False):
+        '''
+        Create a point cloud for every label/category of the point cloud, splitting the points in a single pass.
+        Arguments:
+            - category_names: optional dictionary with the name of each category id
+        '''
+        for category_id, point_indices in self.label_index.split().items():
+            self.single_category_pcs_list[category_id] = \
+                self.createLabeledObject(point_indices, category_id, category_names.get(category_id, ""), debug_mode)
+
+        return self.single_category_pcs_list
+
+    def getCategoryPointIndices(self, category_id):
+        '''
+        Returns:
+            - array with the indices of the points with the given label/category
+        '''
+        return self.label_index.getIndices(category_id)
+
+    def getObjectPointIndices(self, object_id):
+        '''
+        Returns:
+            - array with the indices of the points belonging to the given gameobject id (detailed label)
+        '''
+        return self.detailed_label_index.getIndices(object_id)
+
+    def createLabeledObject(self, point_indices, category_id, category_name = "", debug_mode = False):
+        '''
+        Create a PcLabeledObject with the points at the given indices (relative to this point cloud).
+        '''
+        # gather directly from the shared arrays, without materializing this point cloud's arrays first
+        point_indices = self.toParentIndices(point_indices)
+        points = self.rotated_pc[point_indices]
+        detailed_labels_list = self.raw_detailed_labels[point_indices]
+        projected_point_list = self.raw_projected_points[point_indices]
+
+        return PcLabeledObject(points, detailed_labels_list, projected_point_list, category_id, category_name, debug_mode)
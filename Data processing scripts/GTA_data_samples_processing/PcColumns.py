@@ -0,0 +1,86 @@
+import os.path
+import numpy as np
+
+class PcColumns:
+    '''
+    Columnar (one array per attribute) representation of the per-point data of a sample generated in GTA V.
+    Every array has one row per point, in the same order as the lines of the files written by the LiDAR mod.
+    Abreviations:
+        - proj: projected coordinates of a point onto one of the camera views
+    '''
+
+    __slots__ = (
+        # (N, 3) float32 array with the position (x, y, z) of each point
+        'xyz',
+        # (N, 3) int32 array with (projx, projy, viewID) of each point; proj_x, proj_y and view_id are views over its columns
+        'projected',
+        # (N,) int32 views over the columns of the projected array
+        'proj_x',
+        'proj_y',
+        'view_id',
+        # (N,) int32 array with the label of each point (background (0), pedestrian (1), vehicle (2), game props (3))
+        'label',
+        # (N,) int32 array with the id of the gameobject hit by each point
+        'detailed_label',
+    )
+
+    def __init__(self, xyz, projected, label, detailed_label):
+        '''
+        Arguments:
+            - xyz: (N, 3) array with the points positions
+            - projected: (N, 3) array with (projx, projy, viewID) per point
+            - label: (N,) array with the label of each point
+            - detailed_label: (N,) array with the gameobject id of each point
+        '''
+        self.xyz = np.ascontiguousarray(xyz, dtype=np.float32).reshape(-1, 3)
+        self.projected = np.ascontiguousarray(projected, dtype=np.int32).reshape(-1, 3)
+        self.proj_x = self.projected[:, 0]
+        self.proj_y = self.projected[:, 1]
+        self.view_id = self.projected[:, 2]
+        self.label = np.ascontiguousarray(label, dtype=np.int32).reshape(-1)
+        self.detailed_label = np.ascontiguousarray(detailed_label, dtype=np.int32).reshape(-1)
+
+        n_points = len(self.xyz)
+        if len(self.projected) != n_points or len(self.label) != n_points or len(self.detailed_label) != n_points:
+            raise ValueError("Point cloud columns have different lengths: xyz " + str(n_points) + ", projected " + str(len(self.projected))
+                + ", labels " + str(len(self.label)) + ", detailed labels " + str(len(self.detailed_label)))
+
+    def __len__(self):
+        return len(self.xyz)
+
+    @staticmethod
+    def loadFromSampleDir(sampleDirPath, projectedPointsFn, labelsFn, labelsDetailedFn):
+        '''
+        Loads the point cloud of a sample directory. The positions are read once from the projected points file
+        (which also holds them), so the .ply point cloud file does not need to be parsed.
+        Arguments:
+            - sampleDirPath: path to the directory where the sample files are located
+            - projectedPointsFn: file where each line is "x y z projx projy viewID"
+            - labelsFn: file with one label per line
+            - labelsDetailedFn: file with one gameobject id per line
+        Returns:
+            - PcColumns instance
+        '''
+        points = PcColumns.loadFloatColumns(os.path.join(sampleDirPath, projectedPointsFn), 6)
+        labels = PcColumns.loadIntColumn(os.path.join(sampleDirPath, labelsFn))
+        labels_detailed = PcColumns.loadIntColumn(os.path.join(sampleDirPath, labelsDetailedFn))
+
+        return PcColumns(points[:, 0:3], points[:, 3:6], labels, labels_detailed)
+
+    @staticmethod
+    def loadFloatColumns(file_path, n_columns, dtype = np.float32):
+        '''
+        Reads a text file with n_columns whitespace separated values per line into a (N, n_columns) array in a single pass.
+        '''
+        values = np.fromfile(file_path, dtype=dtype, sep=' ')
+        if len(values) % n_columns != 0:
+            raise ValueError(file_path + " does not have " + str(n_columns) + " values in every line")
+
+        return values.reshape(-1, n_columns)
+
+    @staticmethod
+    def loadIntColumn(file_path, dtype = np.int32):
+        '''
+        Reads a text file with one integer per line into a (N,) array in a single pass.
+        '''
+        return np.fromfile(file_path, dtype=dtype, sep=' ')
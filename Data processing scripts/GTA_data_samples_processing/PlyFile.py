@@ -0,0 +1,322 @@
+'''
+Reading and writing of .PLY point cloud files shared by every exporter.
+Vertices are handled as numpy structured arrays, where each field is a per-vertex property
+(x, y, z, red, green, blue, label, instance, intensity, ...).
+Ref: http://paulbourke.net/dataformats/ply/
+'''
+import numpy as np
+
+# PLY property type names and the correspondent little endian numpy types
+PLY_TO_NUMPY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': '<i2', 'int16': '<i2',
+    'ushort': '<u2', 'uint16': '<u2',
+    'int': '<i4', 'int32': '<i4',
+    'uint': '<u4', 'uint32': '<u4',
+    'float': '<f4', 'float32': '<f4',
+    'double': '<f8', 'float64': '<f8',
+}
+
+# numpy types (kind + item size) and the correspondent PLY property type names used when writing
+NUMPY_TO_PLY_TYPES = {
+    'i1': 'char', 'u1': 'uchar',
+    'i2': 'short', 'u2': 'ushort',
+    'i4': 'int', 'u4': 'uint',
+    'f4': 'float', 'f8': 'double',
+}
+
+# type used for each of the known vertex properties when building a vertex array
+DEFAULT_PROPERTY_TYPES = {
+    'x': 'f4', 'y': 'f4', 'z': 'f4',
+    'red': 'u1', 'green': 'u1', 'blue': 'u1',
+    'label': 'i4', 'instance': 'i4',
+    'intensity': 'f4',
+}
+
+class PlyHeader:
+    '''
+    Parsed header of a .PLY file.
+    '''
+    def __init__(self, format, elements, header_size):
+        '''
+        Arguments:
+            - format: 'ascii', 'binary_little_endian' or 'binary_big_endian'
+            - elements: list of (name, count, list of (property name, ply type)) tuples, in file order
+            - header_size: number of bytes of the header, including the end_header line
+        '''
+        self.format = format
+        self.elements = elements
+        self.header_size = header_size
+
+    def getElement(self, name):
+        for i in range(0, len(self.elements)):
+            if self.elements[i][0] == name:
+                return i, self.elements[i]
+
+        raise ValueError("PLY file has no '" + name + "' element")
+
+def readPlyHeader(file):
+    '''
+    Reads the header of an opened (binary mode) .PLY file, leaving the file positioned at the start of the data.
+    Returns:
+        - PlyHeader instance
+    '''
+    first_line = file.readline()
+    if first_line.strip() != b'ply':
+        raise ValueError("Not a PLY file")
+
+    format = None
+    elements = []
+    header_size = len(first_line)
+    while True:
+        raw_line = file.readline()
+        if not raw_line:
+            raise ValueError("PLY header has no end_header line")
+        header_size += len(raw_line)
+
+        line = raw_line.decode('ascii').split()
+        if len(line) == 0 or line[0] in ('comment', 'obj_info'):
+            continue
+        if line[0] == 'end_header':
+            break
+        if line[0] == 'format':
+            format = line[1]
+        elif line[0] == 'element':
+            elements.append((line[1], int(line[2]), []))
+        elif line[0] == 'property':
+            if line[1] == 'list':
+                # list properties have a variable size, which can't be represented by a fixed numpy type
+                elements[-1][2].append((line[4], 'list'))
+            else:
+                elements[-1][2].append((line[2], line[1]))
+
+    return PlyHeader(format, elements, header_size)
+
+def elementDtype(element):
+    '''
+    Numpy structured type of a PLY element without list properties.
+    '''
+    name, count, properties = element
+    fields = []
+    for property_name, ply_type in properties:
+        if ply_type == 'list':
+            raise ValueError("List property '" + property_name + "' of element '" + name + "' is not supported")
+        fields.append((property_name, PLY_TO_NUMPY_TYPES[ply_type]))
+
+    return np.dtype(fields)
+
+def readPly(file_path, element_name = 'vertex', mmap = True):
+    '''
+    Loads an element (by default the vertices) of an ascii or binary_little_endian .PLY file.
+    Arguments:
+        - file_path: path to the .ply file
+        - element_name: name of the element to load
+        - mmap: if the data of binary files is memory-mapped instead of being read into memory
+    Returns:
+        - structured array with one field per property of the element
+    '''
+    with open(file_path, 'rb') as f:
+        header = readPlyHeader(f)
+        element_index, element = header.getElement(element_name)
+        dtype = elementDtype(element)
+
+        if header.format == 'ascii':
+            if element[1] == 0:
+                # np.loadtxt can't give the (0, n_properties) shape of an empty element
+                return np.empty(0, dtype=dtype)
+            # skip the lines of the elements that come before the requested one
+            for i in range(0, element_index):
+                for j in range(0, header.elements[i][1]):
+                    f.readline()
+            values = np.loadtxt(f, dtype=np.float64, max_rows=element[1], ndmin=2)
+            vertices = np.empty(len(values), dtype=dtype)
+            for i in range(0, len(dtype.names)):
+                vertices[dtype.names[i]] = values[:, i]
+            return vertices
+
+        if header.format != 'binary_little_endian':
+            raise ValueError("PLY format '" + str(header.format) + "' is not supported")
+
+        offset = header.header_size
+        for i in range(0, element_index):
+            offset += header.elements[i][1] * elementDtype(header.elements[i]).itemsize
+
+    if mmap:
+        return np.memmap(file_path, dtype=dtype, mode='r', offset=offset, shape=(element[1],))
+
+    return np.fromfile(file_path, dtype=dtype, count=element[1], offset=offset)
+
+def iterPlyChunks(file_path, chunk_size = 1 << 20):
+    '''
+    Loads the vertices of an ascii or binary_little_endian .PLY file in chunks, so large files can be processed with bounded memory.
+    The vertices must be the first element of the file.
+    Arguments:
+        - file_path: path to the .ply file
+        - chunk_size: maximum number of vertices of each chunk
+    Returns:
+        - generator of structured arrays with at most chunk_size vertices each, in file order
+    '''
+    with open(file_path, 'rb') as f:
+        header = readPlyHeader(f)
+        element_index, element = header.getElement('vertex')
+        if element_index != 0:
+            raise ValueError("PLY file vertices are not the first element")
+        dtype = elementDtype(element)
+
+        if header.format == 'ascii':
+            # no chunks for an empty element (np.loadtxt is not called)
+            for start in range(0, element[1], chunk_size):
+                values = np.loadtxt(f, dtype=np.float64, max_rows=min(chunk_size, element[1] - start), ndmin=2)
+                vertices = np.empty(len(values), dtype=dtype)
+                for i in range(0, len(dtype.names)):
+                    vertices[dtype.names[i]] = values[:, i]
+                yield vertices
+            return
+
+    if header.format != 'binary_little_endian':
+        raise ValueError("PLY format '" + str(header.format) + "' is not supported")
+
+    vertices = readPly(file_path)
+    for start in range(0, len(vertices), chunk_size):
+        yield np.array(vertices[start:start + chunk_size])
+
+def propertyType(values):
+    '''
+    PLY compatible numpy type for the values of a property that has no default type (64 bit values are stored as 32 bit).
+    '''
+    dtype = np.asarray(values).dtype
+    if dtype.kind in 'iu' and dtype.itemsize <= 4:
+        return dtype.kind + str(dtype.itemsize)
+    if dtype.kind in 'iub':
+        return 'i4'
+
+    return 'f4'
+
+def createVertexArray(xyz, colors = None, **properties):
+    '''
+    Builds a structured vertex array from column data.
+    Arguments:
+        - xyz: (N, 3) array with the points positions
+        - colors: optional (N, 3) array (or a single (r, g, b) color for every point) with uchar colors
+        - properties: additional per-vertex properties, e.g. label=..., instance=..., intensity=...
+                      Each value is a (N,) array or a scalar shared by every point.
+    Returns:
+        - structured array with the fields x, y, z, [red, green, blue], [properties...]
+    '''
+    xyz = np.asarray(xyz).reshape(-1, 3)
+
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if colors is not None:
+        fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    for name, values in properties.items():
+        fields.append((name, '<' + DEFAULT_PROPERTY_TYPES.get(name, propertyType(values))))
+
+    vertices = np.empty(len(xyz), dtype=fields)
+    vertices['x'] = xyz[:, 0]
+    vertices['y'] = xyz[:, 1]
+    vertices['z'] = xyz[:, 2]
+    if colors is not None:
+        colors = np.asarray(colors)
+        vertices['red'] = colors[..., 0]
+        vertices['green'] = colors[..., 1]
+        vertices['blue'] = colors[..., 2]
+    for name, values in properties.items():
+        vertices[name] = values
+
+    return vertices
+
+def createPlyHeader(dtype, n_vertices, format = 'binary_little_endian'):
+    '''
+    Returns the header (string) of a .PLY file with n_vertices of the given structured type.
+    '''
+    header_lines = ["ply", "format " + format + " 1.0"]
+    header_lines.append("element vertex " + str(n_vertices))
+    for name in dtype.names:
+        field_type = dtype.fields[name][0]
+        header_lines.append("property " + NUMPY_TO_PLY_TYPES[field_type.kind + str(field_type.itemsize)] + " " + name)
+    header_lines.append("end_header")
+
+    return "\n".join(header_lines) + "\n"
+
+def writePly(file_path, vertices, binary = True):
+    '''
+    Saves a structured vertex array into a .PLY file. Each field of the array becomes a vertex property.
+    Arguments:
+        - file_path: path to the .ply file to create
+        - vertices: structured array (see createVertexArray)
+        - binary: write a binary_little_endian file in a single write; otherwise an ascii file
+    '''
+    # little endian with no padding between fields, as expected by the PLY format
+    packed_dtype = np.dtype([(name, vertices.dtype.fields[name][0].newbyteorder('<')) for name in vertices.dtype.names])
+    if vertices.dtype != packed_dtype:
+        vertices = vertices.astype(packed_dtype)
+
+    if binary:
+        with open(file_path, "wb") as the_file:
+            the_file.write(createPlyHeader(packed_dtype, len(vertices), 'binary_little_endian').encode('ascii'))
+            the_file.write(np.ascontiguousarray(vertices).tobytes())
+    else:
+        formats = ['%d' if packed_dtype.fields[name][0].kind in 'iu' else '%f' for name in packed_dtype.names]
+        with open(file_path, "w") as the_file:
+            the_file.write(createPlyHeader(packed_dtype, len(vertices), 'ascii'))
+            np.savetxt(the_file, vertices, fmt=formats, delimiter=' ')
+
+class PlyChunkWriter:
+    '''
+    Writes a binary .PLY file chunk by chunk, for point clouds that are not held in memory at once.
+    The number of vertices must be known in advance, since it is part of the header.
+    Usage:
+        with PlyChunkWriter(file_path, n_vertices) as writer:
+            writer.write(createVertexArray(...))
+    '''
+    def __init__(self, file_path, n_vertices, dtype = None):
+        '''
+        Arguments:
+            - dtype: optional structured type of the vertices, to write the header right away; otherwise it is
+              written with the first chunk (or when the file is closed, for files without vertices)
+        '''
+        self.file_path = file_path
+        self.n_vertices = n_vertices
+        self.n_written = 0
+        self.packed_dtype = None
+        self.file = open(file_path, "wb")
+        if dtype is not None:
+            self.writeHeader(np.dtype([(name, dtype.fields[name][0].newbyteorder('<')) for name in dtype.names]))
+
+    def writeHeader(self, packed_dtype):
+        self.packed_dtype = packed_dtype
+        self.file.write(createPlyHeader(packed_dtype, self.n_vertices, 'binary_little_endian').encode('ascii'))
+
+    def write(self, vertices):
+        '''
+        Appends a structured vertex array (see createVertexArray); every chunk must have the same fields.
+        '''
+        packed_dtype = np.dtype([(name, vertices.dtype.fields[name][0].newbyteorder('<')) for name in vertices.dtype.names])
+        if self.packed_dtype is None:
+            self.writeHeader(packed_dtype)
+        elif packed_dtype != self.packed_dtype:
+            raise ValueError("Vertex chunk fields " + str(packed_dtype) + " are different from the previous chunks " + str(self.packed_dtype))
+
+        if self.n_written + len(vertices) > self.n_vertices:
+            raise ValueError(self.file_path + " has more than the " + str(self.n_vertices) + " vertices declared in the header")
+
+        self.file.write(np.ascontiguousarray(vertices.astype(packed_dtype, copy=False)).tobytes())
+        self.n_written += len(vertices)
+
+    def close(self):
+        if self.packed_dtype is None:
+            # no chunk was written: the file still needs a header to be a valid (empty) .PLY, by default with x, y, z vertices
+            self.writeHeader(createVertexArray(np.zeros((0, 3))).dtype)
+        self.file.close()
+        if self.n_written != self.n_vertices:
+            raise ValueError(self.file_path + " has " + str(self.n_written) + " vertices instead of the " + str(self.n_vertices) + " declared in the header")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.file.close()
+            return
+        self.close()
@@ -0,0 +1,117 @@
+import math
+import numpy as np
+
+class RigidTransform:
+    '''
+    Transformation of 3D points (rotations around the x, y and z axis, scaling and translation) stored as a single 4x4 matrix.
+    Transformations are composed in the order they are added, e.g. RigidTransform().rotateZ(a).rotateX(b)
+    first rotates the points around the z axis and then around the x axis.
+    The rotations follow the same conventions as PcRaw.rotatePointAroundZaxis/Xaxis/Yaxis.
+    '''
+
+    # number of points transformed at a time when transforming in place, to bound the size of the temporary arrays
+    inPlaceChunkSize = 65536
+
+    def __init__(self, matrix = None):
+        '''
+        Arguments:
+            - matrix: 4x4 homogeneous transformation matrix (identity if None)
+        '''
+        if matrix is None:
+            matrix = np.identity(4)
+        self.matrix = np.array(matrix, dtype=np.float64).reshape(4, 4)
+
+    def then(self, transform):
+        '''
+        Returns:
+            - new RigidTransform that applies this transform followed by the given one (RigidTransform or 4x4 matrix)
+        '''
+        if isinstance(transform, RigidTransform):
+            transform = transform.matrix
+
+        return RigidTransform(np.dot(transform, self.matrix))
+
+    def rotateZ(self, angle_rad):
+        c = math.cos(angle_rad)
+        s = math.sin(angle_rad)
+        return self.then([[c, -s, 0, 0],
+                          [s,  c, 0, 0],
+                          [0,  0, 1, 0],
+                          [0,  0, 0, 1]])
+
+    def rotateX(self, angle_rad):
+        c = math.cos(angle_rad)
+        s = math.sin(angle_rad)
+        return self.then([[1, 0,  0, 0],
+                          [0, c, -s, 0],
+                          [0, s,  c, 0],
+                          [0, 0,  0, 1]])
+
+    def rotateY(self, angle_rad):
+        c = math.cos(angle_rad)
+        s = math.sin(angle_rad)
+        return self.then([[ c, 0, s, 0],
+                          [ 0, 1, 0, 0],
+                          [-s, 0, c, 0],
+                          [ 0, 0, 0, 1]])
+
+    def scale(self, vx, vy, vz):
+        return self.then([[vx, 0,  0,  0],
+                          [0,  vy, 0,  0],
+                          [0,  0,  vz, 0],
+                          [0,  0,  0,  1]])
+
+    def translate(self, tx, ty, tz):
+        return self.then([[1, 0, 0, tx],
+                          [0, 1, 0, ty],
+                          [0, 0, 1, tz],
+                          [0, 0, 0, 1]])
+
+    def inverse(self):
+        return RigidTransform(np.linalg.inv(self.matrix))
+
+    def apply(self, points, in_place = False):
+        '''
+        Transforms a set of points with a single matrix multiplication.
+        Arguments:
+            - points: (N, 3) array (or list of (x, y, z) tuples); float32 arrays are transformed in float32
+            - in_place: if the points array is overwritten with the result (points must be a writable float array)
+        Returns:
+            - (N, 3) array with the transformed points
+        '''
+        if in_place:
+            rotation, translation = self.getRotationAndTranslation(points.dtype)
+            for start in range(0, len(points), self.inPlaceChunkSize):
+                chunk = points[start:start + self.inPlaceChunkSize]
+                chunk[:] = np.dot(chunk, rotation.T) + translation
+            return points
+
+        points = np.asarray(points)
+        if points.dtype != np.float32 and points.dtype != np.float64:
+            points = points.astype(np.float64)
+        points = points.reshape(-1, 3)
+
+        rotation, translation = self.getRotationAndTranslation(points.dtype)
+        return np.dot(points, rotation.T) + translation
+
+    def applyToPoint(self, point):
+        '''
+        Transforms a single point.
+        Returns:
+            - tuple with the transformed point coordinates (x, y, z)
+        '''
+        return tuple(self.apply(np.array([point], dtype=np.float64))[0])
+
+    def applyToBoxes(self, corners):
+        '''
+        Transforms the corners of a set of boxes.
+        Arguments:
+            - corners: (K, 8, 3) array with the corners of K boxes
+        Returns:
+            - (K, 8, 3) array with the transformed corners
+        '''
+        corners = np.asarray(corners)
+        return self.apply(corners.reshape(-1, 3)).reshape(corners.shape)
+
+    def getRotationAndTranslation(self, dtype):
+        return self.matrix[0:3, 0:3].astype(dtype), self.matrix[0:3, 3].astype(dtype)
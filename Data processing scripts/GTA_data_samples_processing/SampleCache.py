@@ -0,0 +1,268 @@
+import os
+import os.path
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+class SampleCache:
+    '''
+    Binary cache of the input files of the samples generated in GTA V.
+    The text/BMP files of a sample directory are converted once into raw .npy files, stored in a cache
+    directory next to the sample directories (ex: GTASamples/_SampleCache/LiDAR_PointCloud1/).
+    Later runs memory-map those .npy files instead of parsing the text files again.
+
+    Each cache entry has a manifest with the size, modification time and hash of every source file it was built from.
+    The entry is rebuilt automatically when a source file changes, and the least recently used entries are removed
+    when the cache directory grows above maxCacheBytes.
+
+    The cache directory can be shared by several processes (ex: the workers of the process-pool export): the entries are
+    built in a temporary directory and moved into place when they are complete.
+    '''
+
+    # name of the cache directory created next to the sample directories
+    cacheDirName = "_SampleCache"
+    # file of each cache entry holding the information about the source files; it is written last, so an entry without it is incomplete
+    manifestFn = "manifest.json"
+    # prefix of the temporary directories where the entries are built before they are moved into place
+    buildDirPrefix = ".building-"
+    # seconds after which an entry without manifest (still being built by some process, or left incomplete by a process
+    # that stopped) can be evicted
+    incompleteEntryGraceSeconds = 3600
+
+    def __init__(self, cacheRootDir, maxCacheBytes = 8 * 1024**3, useHash = True):
+        '''
+        Arguments:
+            - cacheRootDir: directory where the cache entries are stored (ex: os.path.join(samplesRootDir, SampleCache.cacheDirName))
+            - maxCacheBytes: maximum size of the cache directory; least recently used entries are evicted above it
+            - useHash: if a source file with a different modification time but the same size is compared by its hash
+                       before rebuilding the entry (ex: samples copied to another disk)
+        '''
+        self.cacheRootDir = cacheRootDir
+        self.maxCacheBytes = maxCacheBytes
+        self.useHash = useHash
+        # size of the cache directory in bytes, updated when entries are saved; None until the directory is first scanned
+        self.cacheBytes = None
+
+        # number of loads served from the cache, and number of loads that had to parse the source files
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self, sampleDirPath, sourceFns, buildFn):
+        '''
+        Loads the arrays of a sample from the cache, building the cache entry first if it is missing or outdated.
+        Arguments:
+            - sampleDirPath: path to the sample directory
+            - sourceFns: names of the files of the sample directory that the arrays are computed from
+            - buildFn: function without arguments that parses the source files and returns a dict of numpy arrays
+        Returns:
+            - dict with the same keys as returned by buildFn, where each value is a read-only memory-mapped array
+        '''
+        entryDir = self.getEntryDir(sampleDirPath)
+        sourcesInfo = [self.getSourceFileInfo(os.path.join(sampleDirPath, fn)) for fn in sourceFns]
+
+        manifest = self.loadManifest(entryDir)
+        if manifest is not None and self.isValid(manifest, sampleDirPath, sourcesInfo):
+            try:
+                # the modification time of the manifest is used to find the least recently used entries
+                os.utime(os.path.join(entryDir, self.manifestFn))
+                arrays = self.loadArrays(entryDir, manifest["arrays"])
+                self.hits += 1
+                return arrays
+            except OSError:
+                # the entry was evicted (or replaced) by another process sharing the cache: it is built again
+                pass
+
+        self.misses += 1
+        arrays = buildFn()
+        self.saveEntry(entryDir, sampleDirPath, sourcesInfo, arrays)
+        self.evict(keepEntryDir = entryDir)
+
+        return self.loadArrays(entryDir, list(arrays.keys()))
+
+    def getEntryDir(self, sampleDirPath):
+        return os.path.join(self.cacheRootDir, os.path.basename(os.path.normpath(sampleDirPath)))
+
+    def getSourceFileInfo(self, filePath):
+        '''
+        Returns:
+            - dict with the name, size and modification time of a source file
+        '''
+        stat = os.stat(filePath)
+        return {"name": os.path.basename(filePath), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def hashFile(self, filePath, chunkSize = 4 * 1024**2):
+        sha1 = hashlib.sha1()
+        with open(filePath, "rb") as f:
+            for chunk in iter(lambda: f.read(chunkSize), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def loadManifest(self, entryDir):
+        try:
+            with open(os.path.join(entryDir, self.manifestFn)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def isValid(self, manifest, sampleDirPath, sourcesInfo):
+        '''
+        Checks if the source files are the same ones the cache entry was built from.
+        Size and modification time are compared first; files with a different modification time are compared by hash (if useHash).
+        '''
+        cachedSources = manifest["sources"]
+        if [s["name"] for s in cachedSources] != [s["name"] for s in sourcesInfo]:
+            return False
+
+        touched = False
+        for cached, current in zip(cachedSources, sourcesInfo):
+            if cached["size"] != current["size"]:
+                return False
+            if cached["mtime_ns"] != current["mtime_ns"]:
+                if not self.useHash or cached.get("sha1") != self.hashFile(os.path.join(sampleDirPath, current["name"])):
+                    return False
+                # same content, only the modification time changed
+                cached["mtime_ns"] = current["mtime_ns"]
+                touched = True
+
+        if touched:
+            self.saveManifest(self.getEntryDir(sampleDirPath), manifest)
+
+        return True
+
+    def saveManifest(self, entryDir, manifest):
+        tmpPath = os.path.join(entryDir, self.manifestFn + ".tmp")
+        with open(tmpPath, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmpPath, os.path.join(entryDir, self.manifestFn))
+
+    def saveEntry(self, entryDir, sampleDirPath, sourcesInfo, arrays):
+        '''
+        Stores the arrays of a sample into its cache entry directory. The entry is built in a temporary directory and
+        then renamed to entryDir, so other processes sharing the cache never see (or evict) a partial entry.
+        '''
+        os.makedirs(self.cacheRootDir, exist_ok=True)
+        buildDir = tempfile.mkdtemp(prefix=self.buildDirPrefix + os.path.basename(entryDir) + "-", dir=self.cacheRootDir)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(buildDir, name + ".npy"), np.ascontiguousarray(array))
+
+            if self.useHash:
+                for info in sourcesInfo:
+                    info["sha1"] = self.hashFile(os.path.join(sampleDirPath, info["name"]))
+
+            self.saveManifest(buildDir, {"sources": sourcesInfo, "arrays": list(arrays.keys())})
+            entrySize = self.getEntrySize(buildDir)
+
+            replacedSize = self.replaceEntry(buildDir, entryDir)
+        finally:
+            # only left when the entry could not be saved
+            shutil.rmtree(buildDir, ignore_errors=True)
+
+        if self.cacheBytes is not None:
+            self.cacheBytes += entrySize - replacedSize
+
+    def replaceEntry(self, buildDir, entryDir):
+        '''
+        Moves a complete entry from its build directory to entryDir, replacing the outdated entry (if any).
+        Returns:
+            - size of the replaced entry
+        '''
+        replacedSize = 0
+        # unique name, starting with buildDirPrefix so it is evicted if it can't be removed now
+        oldEntryDir = buildDir + "-old"
+        if os.path.isdir(entryDir):
+            replacedSize = self.getEntrySize(entryDir)
+            try:
+                os.rename(entryDir, oldEntryDir)
+            except FileNotFoundError:
+                # evicted by another process
+                replacedSize = 0
+
+        try:
+            os.rename(buildDir, entryDir)
+        except OSError:
+            # another process saved the same entry in the meantime; its entry is kept
+            if not os.path.isdir(entryDir):
+                raise
+
+        shutil.rmtree(oldEntryDir, ignore_errors=True)
+        return replacedSize
+
+    def loadArrays(self, entryDir, names):
+        arrays = {}
+        for name in names:
+            filePath = os.path.join(entryDir, name + ".npy")
+            try:
+                arrays[name] = np.load(filePath, mmap_mode='r')
+            except ValueError:
+                # empty arrays can't be memory-mapped
+                arrays[name] = np.load(filePath)
+        return arrays
+
+    def getEntrySize(self, entryDir):
+        size = 0
+        for fn in os.listdir(entryDir):
+            try:
+                size += os.path.getsize(os.path.join(entryDir, fn))
+            except FileNotFoundError:
+                # removed by another process
+                pass
+        return size
+
+    def evict(self, keepEntryDir = None):
+        '''
+        Removes the least recently used cache entries until the cache directory is smaller than maxCacheBytes.
+        The size of the cache is kept as a running total, so the cache directory is only scanned the first time and when
+        the total is above maxCacheBytes (each scan also counts the entries saved by other processes sharing the cache).
+        Arguments:
+            - keepEntryDir: entry that is never removed (the one that was just created)
+        '''
+        if self.cacheBytes is not None and self.cacheBytes <= self.maxCacheBytes:
+            return
+        if not os.path.isdir(self.cacheRootDir):
+            self.cacheBytes = 0
+            return
+
+        now = time.time()
+        entries = []
+        totalSize = 0
+        for name in os.listdir(self.cacheRootDir):
+            entryDir = os.path.join(self.cacheRootDir, name)
+            try:
+                if not os.path.isdir(entryDir):
+                    continue
+                size = self.getEntrySize(entryDir)
+                manifestPath = os.path.join(entryDir, self.manifestFn)
+                if os.path.exists(manifestPath):
+                    lastUsed = os.path.getmtime(manifestPath)
+                elif now - os.path.getmtime(entryDir) < self.incompleteEntryGraceSeconds:
+                    # being built, possibly by another process
+                    totalSize += size
+                    continue
+                else:
+                    # incomplete entries left by processes that stopped are the first ones to be removed
+                    lastUsed = 0
+            except FileNotFoundError:
+                # removed by another process while scanning
+                continue
+            entries.append((lastUsed, entryDir, size))
+            totalSize += size
+
+        entries.sort()
+        for lastUsed, entryDir, size in entries:
+            if totalSize <= self.maxCacheBytes:
+                break
+            if keepEntryDir is not None and os.path.normpath(entryDir) == os.path.normpath(keepEntryDir):
+                continue
+            shutil.rmtree(entryDir, ignore_errors=True)
+            totalSize -= size
+            self.evictions += 1
+
+        self.cacheBytes = totalSize
+
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -1,7 +1,7 @@
 import os
 from GtaSample import GtaSample
 from KittiSample import KittiSample
-from LoadBinPointclouds import loadKittiVelodyneFile
+from VelodyneFile import VelodyneDirectory, getXyz
 from LoadBinPointclouds import savePlyFile
 from kitti_util import compute_box_3d
 #from KittiSample import inverse_rigid_trans
@@ -12,22 +12,18 @@ outputpath = 'D:/diogo/Desktop/NewSolutionKitti/BinToPlyPointclouds/'
 
 counter = 0
 
-# Create ply point clouds from bin pointclouds (with intensity) from kitti dataset, with a red-green color contrast to trepresent the intensity value of each point
-for subdir, dirs, files in os.walk(pathToPointcloudBinDirectory):
-
-    for filename in files:
+# velodyne files of the directory, memory-mapped one at a time when accessed
+velodyneFiles = VelodyneDirectory(pathToPointcloudBinDirectory, include_luminance = True)
 
-        # dimensions of the cars in a label
-        label_cars_dims = []
-
-        kittipointcloud = loadKittiVelodyneFile(pathToPointcloudBinDirectory + filename, include_luminance = True)
+# Create ply point clouds from bin pointclouds (with intensity) from kitti dataset, with a red-green color contrast to trepresent the intensity value of each point
+for frameId, kittipointcloud in velodyneFiles:
 
-        savePlyFile(outputpath + filename.split('.')[0] + ".ply", kittipointcloud)
-        #savePlyFile(outputpath + filename.split('.')[0] + "_intensity" + ".ply", kittipointcloud, attributes = 'i')
+    savePlyFile(outputpath + frameId + ".ply", getXyz(kittipointcloud))
+    #savePlyFile(outputpath + frameId + "_intensity" + ".ply", kittipointcloud, attributes = 'i')
 
-        counter+=1
+    counter+=1
 
-        print(str(int(counter/len(files) * 100)) + '%')
+    print(str(int(counter/len(velodyneFiles) * 100)) + '%')
 
 
 
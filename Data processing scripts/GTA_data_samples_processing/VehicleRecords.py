@@ -0,0 +1,133 @@
+'''
+Parser of the vehicles file of a sample (LiDAR_PointCloud_vehicles_dims.txt) into a numpy structured array,
+with one record per vehicle and a named field per value, so the values are used as columns
+(ex: records["position"] is a (K, 3) array) instead of converting strings at magic indices.
+Values per line:
+    entity | hash
+    | minCornerX minCornerY minCornerZ | projMinCornerX projMinCornerY
+    | maxCornerX maxCornerY maxCornerZ | projMaxCornerX projMaxCornerY
+    | posX posY posZ | rotX rotY rotZ
+    | projCenterX projCenterY
+    | dimX dimY dimZ
+    | objectType | truncated
+    | forwardX forwardY forwardZ
+'''
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# (field name, number of values) in the order of the values of a line; objectType is the only text value
+VEHICLE_RECORD_LAYOUT = (
+    ("entity", 1),
+    ("hash", 1),
+    ("min_corner", 3),
+    ("proj_min_corner", 2),
+    ("max_corner", 3),
+    ("proj_max_corner", 2),
+    ("position", 3),
+    ("rotation", 3),
+    ("proj_center", 2),
+    ("dims", 3),
+    ("object_type", 1),
+    ("truncated", 1),
+    ("forward", 3),
+)
+
+# number of values of a line
+VEHICLE_RECORD_VALUES = sum(n for name, n in VEHICLE_RECORD_LAYOUT)
+
+def getVehicleRecordDtype(objectTypeLength = 16):
+    '''
+    Returns:
+        - structured dtype of the vehicle records; entity and hash are integers, truncated is a flag
+          and the other numeric fields are float64 (scalars or subarrays)
+    '''
+    fields = []
+    for name, n in VEHICLE_RECORD_LAYOUT:
+        if name == "object_type":
+            fields.append((name, "U" + str(objectTypeLength)))
+        elif name in ("entity", "hash"):
+            fields.append((name, np.int64))
+        elif name == "truncated":
+            fields.append((name, np.int8))
+        elif n == 1:
+            fields.append((name, np.float64))
+        else:
+            fields.append((name, np.float64, (n,)))
+    return np.dtype(fields)
+
+def getColumnIndices(name):
+    '''
+    Returns:
+        - indices of the values of a field in a line
+    '''
+    start = 0
+    for fieldName, n in VEHICLE_RECORD_LAYOUT:
+        if fieldName == name:
+            return list(range(start, start + n))
+        start += n
+    raise KeyError(name)
+
+def parseVehicleRecords(lines, source = "vehicles file"):
+    '''
+    Parses the lines of a vehicles file. Malformed lines (wrong number of values, values that are not numbers,
+    or not finite positions, rotations, dimensions and forward vectors) are skipped with a warning.
+    Arguments:
+        - lines: list of strings, one per vehicle
+        - source: name of the file, for the warnings
+    Returns:
+        - structured array with one record per valid line, in the order of the lines
+    '''
+    tokens = [line.split() for line in lines]
+    tokens = [lineTokens for lineTokens in tokens if len(lineTokens) > 0]
+
+    nValues = np.array([len(lineTokens) for lineTokens in tokens], dtype=np.int64)
+    valid = nValues == VEHICLE_RECORD_VALUES
+
+    table = np.array([lineTokens for lineTokens, isValid in zip(tokens, valid) if isValid], dtype=str).reshape(-1, VEHICLE_RECORD_VALUES)
+
+    typeColumn = getColumnIndices("object_type")[0]
+    numericColumns = [i for i in range(VEHICLE_RECORD_VALUES) if i != typeColumn]
+    try:
+        values = table[:, numericColumns].astype(np.float64)
+        numeric = np.ones(len(table), dtype=bool)
+    except ValueError:
+        # only when some line has a value that is not a number: find the lines one by one
+        values = np.full((len(table), len(numericColumns)), np.nan)
+        numeric = np.zeros(len(table), dtype=bool)
+        for row in range(len(table)):
+            try:
+                values[row] = table[row, numericColumns].astype(np.float64)
+                numeric[row] = True
+            except ValueError:
+                pass
+
+    # the values used by the bounding boxes must be finite
+    requiredColumns = [numericColumns.index(i) for name in ("position", "rotation", "dims", "forward") for i in getColumnIndices(name)]
+    usable = numeric & np.isfinite(values[:, requiredColumns]).all(axis=1)
+
+    nMalformed = len(tokens) - np.count_nonzero(usable)
+    if nMalformed > 0:
+        log.warning(source + ": skipped " + str(nMalformed) + " malformed vehicle lines of " + str(len(tokens)))
+
+    table = table[usable]
+    values = values[usable]
+
+    objectTypeLength = max([len(objectType) for objectType in table[:, typeColumn]] + [1])
+    records = np.zeros(len(table), dtype=getVehicleRecordDtype(objectTypeLength))
+    for name, n in VEHICLE_RECORD_LAYOUT:
+        if name == "object_type":
+            records[name] = table[:, typeColumn]
+            continue
+        columns = values[:, [numericColumns.index(i) for i in getColumnIndices(name)]]
+        records[name] = columns[:, 0] if n == 1 else columns
+
+    return records
+
+def loadVehicleRecords(filePath):
+    '''
+    Loads a vehicles file (see parseVehicleRecords).
+    '''
+    with open(filePath) as f:
+        return parseVehicleRecords(f.readlines(), filePath)
@@ -22,7 +22,6 @@ def project_to_image(pts_3d, P):
     '''
     n = pts_3d.shape[0]
     pts_3d_extend = np.hstack((pts_3d, np.ones((n,1))))
-    print(('pts_3d_extend shape: ', pts_3d_extend.shape))
     pts_2d = np.dot(pts_3d_extend, np.transpose(P)) # nx3
     pts_2d[:,0] /= pts_2d[:,2]
     pts_2d[:,1] /= pts_2d[:,2]
@@ -83,16 +82,10 @@ def compute_box_3d(l, w, h, ry, t, P, R0, C2V_mat): #obj, P):
     # rotate and translate 3d bounding box
     corners_3d = np.dot(R, np.vstack([x_corners,y_corners,z_corners]))
 
-    print("corners: " + str(corners_3d))
-
-    print("object center: " + str(t))
-
     corners_3d[0,:] = corners_3d[0,:] + t[0];
     corners_3d[1,:] = corners_3d[1,:] + t[1];
     corners_3d[2,:] = corners_3d[2,:] + t[2];
 
-    print("corners >>: " + str(corners_3d))
-
     # project the 3d bounding box into the image plane
     corners_2d = project_to_image(np.transpose(corners_3d), P);
 
@@ -102,6 +95,91 @@ def compute_box_3d(l, w, h, ry, t, P, R0, C2V_mat): #obj, P):
     
     return corners_2d, box3d_pts_3d_velo
 
+'''
+Batched versions of compute_box_3d, for the K objects of a sample at once.
+'''
+def roty_batch(t):
+    ''' Rotations about the y-axis.
+        input: t: (K,) angles
+        output: (K,3,3) rotation matrices
+    '''
+    t = np.asarray(t, dtype=np.float64)
+    c = np.cos(t)
+    s = np.sin(t)
+    R = np.zeros((len(t), 3, 3))
+    R[:,0,0] = c
+    R[:,0,2] = s
+    R[:,1,1] = 1
+    R[:,2,0] = -s
+    R[:,2,2] = c
+    return R
+
+def compute_boxes_3d(l, w, h, ry, t):
+    ''' Corners of K 3d bounding boxes, same corner order as compute_box_3d.
+        input: l, w, h, ry: (K,) dimensions and rotations around the up axis
+               t: (K,3) object positions in rect camera coord.
+        output: corners_3d: (K,8,3) array in rect camera coord.
+    '''
+    l = np.asarray(l, dtype=np.float64).reshape(-1, 1)
+    w = np.asarray(w, dtype=np.float64).reshape(-1, 1)
+    h = np.asarray(h, dtype=np.float64).reshape(-1, 1)
+
+    # (K,3,8) corners before rotation
+    x_corners = l/2 * np.array([1,1,-1,-1,1,1,-1,-1])
+    y_corners = -h * np.array([0,0,0,0,1,1,1,1])
+    z_corners = w/2 * np.array([1,-1,-1,1,1,-1,-1,1])
+    corners = np.stack((x_corners, y_corners, z_corners), axis=1)
+
+    # rotate and translate 3d bounding boxes
+    corners_3d = np.matmul(roty_batch(ry), corners) + np.asarray(t, dtype=np.float64).reshape(-1, 3, 1)
+    return np.transpose(corners_3d, (0, 2, 1))
+
+def project_boxes_to_image(corners_3d, P):
+    ''' Projects the corners of K boxes to the image plane.
+        input: corners_3d: (K,8,3) array in rect camera coord.
+               P: 3x4 projection matrix
+        output: corners_2d: (K,8,2) array in image coord.
+    '''
+    corners_3d = np.asarray(corners_3d)
+    return project_to_image(corners_3d.reshape(-1, 3), P).reshape(corners_3d.shape[0:2] + (2,))
+
+def compute_boxes_2d(corners_2d, img_width, img_height):
+    ''' 2d bounding boxes of K projected boxes, clipped to the image.
+        input: corners_2d: (K,8,2) array in image coord.
+        output: boxes_2d: (K,4) array of (xmin, ymin, xmax, ymax) within [0, img_width-1] x [0, img_height-1];
+                          the boxes outside of the image have no area (see has_box_area)
+                covers_image: (K,) bool array, True for the boxes that extend beyond every side of the image
+    '''
+    corners_2d = np.asarray(corners_2d).reshape(-1, 8, 2)
+    boxes_2d = np.hstack((corners_2d.min(axis=1), corners_2d.max(axis=1)))
+
+    covers_image = (boxes_2d[:,0] < 0) & (boxes_2d[:,2] > img_width) & (boxes_2d[:,1] < 0) & (boxes_2d[:,3] > img_height)
+
+    # make sure that the uv coordinates are within image bounds; boxes completely outside of the image
+    # become degenerate boxes (xmax <= xmin or ymax <= ymin) on its border
+    boxes_2d[:,[0,2]] = np.clip(boxes_2d[:,[0,2]], 0, img_width-1)
+    boxes_2d[:,[1,3]] = np.clip(boxes_2d[:,[1,3]], 0, img_height-1)
+    return boxes_2d, covers_image
+
+def has_box_area(boxes_2d):
+    ''' (K,) bool array, True for the 2d boxes (xmin, ymin, xmax, ymax) with a positive width and height
+        (after compute_boxes_2d, False for the boxes that are outside of the image).
+    '''
+    return (boxes_2d[:,2] > boxes_2d[:,0]) & (boxes_2d[:,3] > boxes_2d[:,1])
+
+def compute_boxes(l, w, h, ry, t, P, img_width, img_height):
+    ''' Batched compute_box_3d: projects K 3d bounding boxes into the image plane.
+        Returns:
+            corners_3d: (K,8,3) array in rect camera coord.
+            corners_2d: (K,8,2) array in image coord.
+            boxes_2d: (K,4) array of (xmin, ymin, xmax, ymax) clipped to the image
+            covers_image: (K,) bool array, True for the boxes that extend beyond every side of the image
+    '''
+    corners_3d = compute_boxes_3d(l, w, h, ry, t)
+    corners_2d = project_boxes_to_image(corners_3d, P)
+    boxes_2d, covers_image = compute_boxes_2d(corners_2d, img_width, img_height)
+    return corners_3d, corners_2d, boxes_2d, covers_image
+
 def draw_projected_box3d(image, qs, color=(255,255,255), thickness=2):
     ''' Draw 3d bounding box in image
         qs: (8,3) array of vertices for the 3d box in following order:
@@ -113,8 +191,6 @@ def draw_projected_box3d(image, qs, color=(255,255,255), thickness=2):
           |/         |/
           6 -------- 7
     '''
-    print("qs: " + str(qs))
-
     qs = qs.astype(np.int32)
     for k in range(0,4):
        # Ref: http://docs.enthought.com/mayavi/mayavi/auto/mlab_helper_functions.html
@@ -0,0 +1,171 @@
+#
+# This python script creates the colored point clouds of every LiDAR_PointCloudX directory (X = 1, 2, ...) in the current directory
+# (or the directory given in the first command argument) and gathers them into a single directory (_EveryPointCloud).
+# For each directory, colorize.py is used 2 times:
+#	- to produce the ideal colored point clouds, from the file LiDAR_PointCloud_points.txt
+#	- to produce the colored point clouds with errors/noise, from the file LiDAR_PointCloud_error.txt
+# The colorizations of all the directories are run in parallel (one process per CPU, or the number given in the second command argument).
+# Colored point clouds newer than their input files are not created again, so only the new directories are colorized in each run.
+# The colored point clouds and the label files are gathered with hardlinks (or copies, if hardlinks are not supported),
+# with the index of their directory appended to their name (ex: LiDAR_PointCloud_points_PC_Day1.ply, LiDAR_PointCloud_labels1.txt).
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import os.path
+import re
+import sys
+import shutil
+import time
+
+import colorize
+
+# directory that will hold all colored point clouds
+destDirName = '_EveryPointCloud'
+
+# Template of the name of the directories that hold all the data needed to create the colored point clouds.
+# The directory created by the manual LiDAR scan (LiDAR_PointCloud, without index) is ignored
+dirPointCloudPattern = re.compile(r'^LiDAR_PointCloud(\d+)$')
+
+# The following file names are present in every directory holding point cloud data
+cloudPointTxtFileName = 'LiDAR_PointCloud_points.txt'
+cloudPointErrorTxtFileName = 'LiDAR_PointCloud_error.txt'
+# files with the restrictive labels and with the detailed labels, gathered along with the colored point clouds
+labelsFileNames = ['LiDAR_PointCloud_labels.txt', 'LiDAR_PointCloud_labelsDetailed.txt']
+
+def findPointCloudDirs(rootDir):
+    '''
+    Returns:
+        - list of (index, directory path) of the LiDAR_PointCloudX directories, sorted by index
+    '''
+    pointCloudDirs = []
+    for name in os.listdir(rootDir):
+        match = dirPointCloudPattern.match(name)
+        if match is not None and os.path.isdir(os.path.join(rootDir, name)):
+            pointCloudDirs.append((int(match.group(1)), os.path.join(rootDir, name)))
+
+    return sorted(pointCloudDirs)
+
+def getColorizeInputs(pointsFilePath):
+    '''
+    Returns:
+        - paths of the files read by colorize.colorizePointCloud
+    '''
+    dirPath = os.path.dirname(pointsFilePath)
+    inputs = [pointsFilePath]
+    for weather in colorize.WEATHERS:
+        for view in range(0, colorize.N_VIEWS):
+            inputs.append(os.path.join(dirPath, 'LiDAR_PointCloud_Camera_Print_' + weather + '_' + str(view) + '.bmp'))
+    return inputs
+
+def getColorizeOutputs(pointsFilePath):
+    '''
+    Returns:
+        - paths of the colored point clouds written by colorize.colorizePointCloud
+    '''
+    outputBaseName = os.path.join(os.path.dirname(pointsFilePath), os.path.basename(pointsFilePath)[:-4])
+    return [outputBaseName + "_PC_" + weather + ".ply" for weather in colorize.WEATHERS]
+
+def isUpToDate(inputs, outputs):
+    '''
+    Checks if all the output files exist and are newer than all the input files.
+    '''
+    if not all(os.path.exists(path) for path in outputs):
+        return False
+
+    newestInput = max(os.path.getmtime(path) for path in inputs if os.path.exists(path))
+    return min(os.path.getmtime(path) for path in outputs) >= newestInput
+
+def colorizeJob(pointsFilePath):
+    '''
+    Colorizes a points file in a worker process.
+    Returns:
+        - points file path, number of colored points, number of discarded points and elapsed seconds
+    '''
+    start = time.perf_counter()
+    nPoints, nDiscarded = colorize.colorizePointCloud(pointsFilePath)
+    return pointsFilePath, nPoints, nDiscarded, time.perf_counter() - start
+
+def gatherFile(filePath, destDir, dirIndex):
+    '''
+    Places a file into the destination directory with the index of its directory appended to its name,
+    without copying its content: a hardlink is created, or the file is copied if hardlinks are not supported
+    (ex: FAT/exFAT, network shares or a different filesystem). The file is never moved, so the outputs stay in the
+    directory of the point cloud and are not created again in the next run.
+    '''
+    name, extension = os.path.splitext(os.path.basename(filePath))
+    destPath = os.path.join(destDir, name + str(dirIndex) + extension)
+
+    if os.path.exists(destPath):
+        if os.path.samefile(filePath, destPath):
+            return
+        os.remove(destPath)
+
+    try:
+        os.link(filePath, destPath)
+    except OSError:
+        shutil.copy2(filePath, destPath)
+
+def joinAllData(rootDir, nWorkers = None):
+    destDir = os.path.join(rootDir, destDirName)
+    # Create the directory that will hold all colored point clouds
+    os.makedirs(destDir, exist_ok=True)
+
+    pointCloudDirs = findPointCloudDirs(rootDir)
+
+    # colorization jobs of the directories whose colored point clouds are missing or older than their inputs
+    jobs = []
+    for dirIndex, dirPath in pointCloudDirs:
+        for txtFileName in [cloudPointTxtFileName, cloudPointErrorTxtFileName]:
+            pointsFilePath = os.path.join(dirPath, txtFileName)
+            if not os.path.exists(pointsFilePath):
+                continue
+            if isUpToDate(getColorizeInputs(pointsFilePath), getColorizeOutputs(pointsFilePath)):
+                continue
+            jobs.append((dirIndex, pointsFilePath))
+
+    print("---- " + str(len(pointCloudDirs)) + " point cloud directories, " + str(len(jobs)) + " point clouds to colorize")
+
+    # colorized points and elapsed time of each directory
+    dirStats = {}
+    failedDirs = set()
+    start = time.perf_counter()
+    if len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            futures = {executor.submit(colorizeJob, pointsFilePath): dirIndex for dirIndex, pointsFilePath in jobs}
+            for future in as_completed(futures):
+                dirIndex = futures[future]
+                try:
+                    pointsFilePath, nPoints, nDiscarded, seconds = future.result()
+                except Exception as e:
+                    print("---- Failed to colorize a point cloud of LiDAR_PointCloud" + str(dirIndex) + ": " + repr(e))
+                    failedDirs.add(dirIndex)
+                    continue
+
+                points, elapsed = dirStats.get(dirIndex, (0, 0.0))
+                dirStats[dirIndex] = (points + nPoints, elapsed + seconds)
+
+    for dirIndex, (points, elapsed) in sorted(dirStats.items()):
+        print("---- LiDAR_PointCloud" + str(dirIndex) + ": " + str(points) + " points in " + "%.2f" % elapsed + " s (" + "%.0f" % (points / max(elapsed, 1e-9)) + " points/s)")
+
+    # gather the colored point clouds and the labels of every directory
+    for dirIndex, dirPath in pointCloudDirs:
+        if dirIndex in failedDirs:
+            continue
+        for txtFileName in [cloudPointTxtFileName, cloudPointErrorTxtFileName]:
+            for plyFilePath in getColorizeOutputs(os.path.join(dirPath, txtFileName)):
+                if os.path.exists(plyFilePath):
+                    gatherFile(plyFilePath, destDir, dirIndex)
+        for labelsFileName in labelsFileNames:
+            if os.path.exists(os.path.join(dirPath, labelsFileName)):
+                gatherFile(os.path.join(dirPath, labelsFileName), destDir, dirIndex)
+
+    elapsed = time.perf_counter() - start
+    totalPoints = sum(points for points, _ in dirStats.values())
+    print("---- Colorized " + str(totalPoints) + " points of " + str(len(dirStats)) + " directories in " + "%.2f" % elapsed + " s")
+
+if __name__ == "__main__":
+    # directory with the LiDAR_PointCloudX directories
+    rootDir = sys.argv[1] if len(sys.argv) > 1 else '.'
+    # number of parallel colorization processes (None = number of CPUs)
+    nWorkers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    joinAllData(rootDir, nWorkers)
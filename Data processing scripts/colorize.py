@@ -1,4 +1,4 @@
-# 
+#
 # This python script colorizes the uncolored point clouds (LiDAR_PointCloud.ply and LiDAR_PointCloud_error.ply).
 # However these uncolored point clouds are not used by this script in order the produce the colored point clouds.
 # Instead, it used the files LiDAR_PointCloud_points.txt and LiDAR_PointCloud_error.txt to do so.
@@ -6,98 +6,104 @@
 #	- first, to produce the ideal colored point cloud, by specifying the file LiDAR_PointCloud_points.txt in the command argument
 #	- second, to produce the colored point cloud with errors/noise, by specifying the file LiDAR_PointCloud_error.txt in the command argument
 # This script produces 3 colored point clouds: one for the day, one for the night and one for the cloudy weather.
+# Several files can be given in the command arguments, they are colorized one after the other.
 from PIL import Image
-from tqdm import tqdm
+import numpy as np
+import os.path
 import sys
 
-arg = sys.argv[1]
-
-# splits the argument by '\'. The argument can be a file name, a relative or full path to the file
-filePath = arg.split('\\')
-
-# obtain the directory path to where the file specified in the argument resides.
-# discards the last elment because it's the name of the text file
-dirPath = ''
-for i in range(0, len(filePath)-1):
-	dirPath += filePath[i] + '\\'
-
-# load the pictures that into memory in order to assign them to them points of the point cloud
-imDay = []
-imDay.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Day_0.bmp', 'r'))
-imDay.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Day_1.bmp', 'r'))
-imDay.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Day_2.bmp', 'r'))
-
-imNight = []
-imNight.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Night_0.bmp', 'r'))
-imNight.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Night_1.bmp', 'r'))
-imNight.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Night_2.bmp', 'r'))
-
-imCloudy = []
-imCloudy.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Cloudy_0.bmp', 'r'))
-imCloudy.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Cloudy_1.bmp', 'r'))
-imCloudy.append(Image.open(dirPath + 'LiDAR_PointCloud_Camera_Print_Cloudy_2.bmp', 'r'))
-
-pix_rgb_day = []
-pix_rgb_day.append(imDay[0].load())
-pix_rgb_day.append(imDay[1].load())
-pix_rgb_day.append(imDay[2].load())
-
-pix_rgb_night = []
-pix_rgb_night.append(imNight[0].load())
-pix_rgb_night.append(imNight[1].load())
-pix_rgb_night.append(imNight[2].load())
-
-pix_rgb_cloudy = []
-pix_rgb_cloudy.append(imCloudy[0].load())
-pix_rgb_cloudy.append(imCloudy[1].load())
-pix_rgb_cloudy.append(imCloudy[2].load())
-
-# open the file specified in the python argument
-file = open(sys.argv[1], 'r')
-# and count the number of lines that it has
-n_lines = 0
-for x in file:
-    n_lines+=1
-file.close()
-
-# closing and opening the file again to reset the pointer
-file = open(sys.argv[1], 'r')
-color_mapping = {}
-
-print("--" + filePath[len(filePath)-1][:-4])
-with open(dirPath + filePath[len(filePath)-1][:-4] + "_PC_Day.ply","w") as day, open(dirPath + filePath[len(filePath)-1][:-4] + "_PC_Night.ply","w") as night, open(dirPath + filePath[len(filePath)-1][:-4] + "_PC_Cloudy.ply","w") as cloudy:
-    # add the header for the 3 point clouds files that are being generated
-	day.write("ply\nformat ascii 1.0\nelement vertex "+str(n_lines)+"\nproperty float x\nproperty float y\nproperty float z\nproperty uchar red\nproperty uchar green\nproperty uchar blue\nend_header")
-    night.write("ply\nformat ascii 1.0\nelement vertex "+str(n_lines)+"\nproperty float x\nproperty float y\nproperty float z\nproperty uchar red\nproperty uchar green\nproperty uchar blue\nend_header")
-    cloudy.write("ply\nformat ascii 1.0\nelement vertex "+str(n_lines)+"\nproperty float x\nproperty float y\nproperty float z\nproperty uchar red\nproperty uchar green\nproperty uchar blue\nend_header")
+# the shared .PLY writer, point file reader and .bmp reader live in GTA_data_samples_processing (or next to this script)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GTA_data_samples_processing'))
+from PlyFile import createVertexArray, writePly
+from PcColumns import PcColumns
+from BmpFile import loadBmpImage
 
+# weathers of the captured views, in the order of the first axis of the views array; each one produces a colored point cloud
+WEATHERS = ["Day", "Night", "Cloudy"]
+# number of views captured for each weather (LiDAR_PointCloud_Camera_Print_<weather>_<view>.bmp)
+N_VIEWS = 3
+
+def decodeViewImage(imagePath):
+    '''
+    Decodes a picture that can't be memory-mapped (ex: a compressed .bmp) into a (H, W, 3) uint8 rgb array.
+    '''
+    with Image.open(imagePath, 'r') as im:
+        return np.asarray(im.convert('RGB'))
+
+def loadViewImages(dirPath):
+    '''
+    Loads the pictures of all the weathers and views. The .bmp pictures are memory-mapped, so only the pixels
+    where points are projected are read (see BmpFile).
+    Arguments:
+        - dirPath: directory of the point cloud sample
+    Returns:
+        - list (one per weather) of lists (one per view) of (H, W, 3) uint8 arrays with the rgb color of every pixel
+    '''
+    images = []
+    resolution = None
+    for w in range(0, len(WEATHERS)):
+        images.append([])
+        for v in range(0, N_VIEWS):
+            imagePath = os.path.join(dirPath, 'LiDAR_PointCloud_Camera_Print_' + WEATHERS[w] + '_' + str(v) + '.bmp')
+            pixels = loadBmpImage(imagePath, rgb = True, decodeFn = decodeViewImage)
+
+            if resolution is None:
+                resolution = pixels.shape
+            elif pixels.shape != resolution:
+                raise ValueError(imagePath + " resolution " + str(pixels.shape[1::-1]) + " is different from the other views " + str(resolution[1::-1]))
+
+            images[w].append(pixels)
+
+    return images
+
+def colorizePointCloud(pointsFilePath):
+    '''
+    Creates the colored point clouds (one per weather) of a points file, by taking the color of the pixel where each point is projected.
+    Arguments:
+        - pointsFilePath: file where each line is "x y z projx projy viewID" (LiDAR_PointCloud_points.txt or LiDAR_PointCloud_error.txt)
+    Returns:
+        - number of colored points and number of points discarded because their projection is outside the views
+    '''
+    dirPath = os.path.dirname(pointsFilePath)
+    outputBaseName = os.path.join(dirPath, os.path.basename(pointsFilePath)[:-4])
+
+    print("--" + os.path.basename(pointsFilePath)[:-4])
     print("Colorizing point cloud...")
-    for line in tqdm(file, total=n_lines):
-        line = line.split()
-
-        coords3d = (line[0],line[1],line[2])
-        coords2d = (line[3],line[4])
-        color_mapping[coords2d] = [x for x in coords3d]
-
-        try:
-            if line[5] == '0':
-                rgbDay = pix_rgb_day[0][int(line[3]),int(line[4])]
-                rgbNight = pix_rgb_night[0][int(line[3]),int(line[4])]
-                rgbCloudy = pix_rgb_cloudy[0][int(line[3]),int(line[4])]
-                #r = 0
-            if line[5] == '1':
-                rgbDay = pix_rgb_day[1][int(line[3]),int(line[4])]
-                rgbNight = pix_rgb_night[1][int(line[3]),int(line[4])]
-                rgbCloudy = pix_rgb_cloudy[1][int(line[3]),int(line[4])]
-                #g = 0
-            if line[5] == '2':
-                rgbDay = pix_rgb_day[2][int(line[3]),int(line[4])]
-                rgbNight = pix_rgb_night[2][int(line[3]),int(line[4])]
-                rgbCloudy = pix_rgb_cloudy[2][int(line[3]),int(line[4])]
-                #b = 0
-                
-            day.write("\n"+line[0]+" "+line[1]+" "+line[2]+" "+str(rgbDay[0])+" "+str(rgbDay[1])+" "+str(rgbDay[2]))
-            night.write("\n"+line[0]+" "+line[1]+" "+line[2]+" "+str(rgbNight[0])+" "+str(rgbNight[1])+" "+str(rgbNight[2]))
-            cloudy.write("\n"+line[0]+" "+line[1]+" "+line[2]+" "+str(rgbCloudy[0])+" "+str(rgbCloudy[1])+" "+str(rgbCloudy[2]))
-        except:
-            pass
\ No newline at end of file
+
+    images = loadViewImages(dirPath)
+    n_weathers = len(images)
+    n_views = len(images[0])
+    height, width = images[0][0].shape[0:2]
+
+    points = PcColumns.loadFloatColumns(pointsFilePath, 6, np.float64)
+    positions = points[:, 0:3].astype(np.float32)
+    proj_x = points[:, 3].astype(np.int64)
+    proj_y = points[:, 4].astype(np.int64)
+    view_id = points[:, 5].astype(np.int64)
+
+    # points projected outside of the views can't be colored
+    valid = (proj_x >= 0) & (proj_x < width) & (proj_y >= 0) & (proj_y < height) & (view_id >= 0) & (view_id < n_views)
+    n_discarded = len(valid) - np.count_nonzero(valid)
+    if n_discarded > 0:
+        print("Discarded " + str(n_discarded) + " of " + str(len(valid)) + " points projected outside of the views")
+        positions = positions[valid]
+        proj_x = proj_x[valid]
+        proj_y = proj_y[valid]
+        view_id = view_id[valid]
+
+    # (weather, N, 3) colors of every point in every weather, gathered view by view from the pixels where the points are projected
+    colors = np.zeros((n_weathers, len(positions), 3), dtype=np.uint8)
+    for v in range(0, n_views):
+        inView = np.flatnonzero(view_id == v)
+        for w in range(0, n_weathers):
+            colors[w, inView] = images[w][v][proj_y[inView], proj_x[inView]]
+
+    # the point clouds share the positions, only the colors change
+    for w in range(0, n_weathers):
+        writePly(outputBaseName + "_PC_" + WEATHERS[w] + ".ply", createVertexArray(positions, colors[w]))
+
+    return len(positions), n_discarded
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        colorizePointCloud(arg)
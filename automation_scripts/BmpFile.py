@@ -0,0 +1,109 @@
+'''
+Reading of the .bmp images captured in gta (ex: LiDAR_PointCloud_Camera_Print_Day_0.bmp).
+Uncompressed 24-bit .bmp files are memory-mapped instead of decoded: the pixels are a view of the file
+with the row order and row stride of the .bmp, so only the rows that are accessed are read from disk.
+Other images (other formats, or compressed and palette .bmp files) are decoded.
+Ref: https://en.wikipedia.org/wiki/BMP_file_format
+'''
+import os.path
+import struct
+import collections
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    # the images are decoded with pillow instead
+    cv2 = None
+
+# header fields of a .bmp file:
+#   - dataOffset: position of the pixels in the file
+#   - width, height: resolution of the image
+#   - bitsPerPixel, compression: format of the pixels (24 and 0 for uncompressed bgr pixels)
+#   - topDown: if the first row in the file is the top of the image (by default the rows are stored bottom-up)
+#   - rowStride: bytes per row in the file, padded to a multiple of 4
+BmpHeader = collections.namedtuple("BmpHeader", ["dataOffset", "width", "height", "bitsPerPixel", "compression", "topDown", "rowStride"])
+
+# compression value of the uncompressed pixels (BI_RGB)
+BMP_UNCOMPRESSED = 0
+
+def readBmpHeader(f):
+    '''
+    Reads the file header and the info header of a .bmp file.
+    Returns:
+        - BmpHeader, or None if the file is not a .bmp with an info header that has at least the BITMAPINFOHEADER fields
+    '''
+    fileHeader = f.read(14)
+    if len(fileHeader) < 14 or fileHeader[0:2] != b'BM':
+        return None
+    dataOffset = struct.unpack('<I', fileHeader[10:14])[0]
+
+    infoHeader = f.read(40)
+    if len(infoHeader) < 40 or struct.unpack('<I', infoHeader[0:4])[0] < 40:
+        return None
+    width, height, planes, bitsPerPixel, compression = struct.unpack('<iiHHI', infoHeader[4:20])
+
+    rowStride = ((width * bitsPerPixel + 31) // 32) * 4
+    return BmpHeader(dataOffset, width, abs(height), bitsPerPixel, compression, height < 0, rowStride)
+
+def mapBmpImage(file_path, rgb = False):
+    '''
+    Memory-maps the pixels of an uncompressed 24-bit .bmp file.
+    Arguments:
+        - rgb: return the channels in rgb order instead of the bgr order of the file (and of opencv)
+    Returns:
+        - read-only (H, W, 3) uint8 view of the file, with the top row first, or None if the file can't be mapped
+    '''
+    with open(file_path, 'rb') as f:
+        header = readBmpHeader(f)
+
+    if header is None or header.bitsPerPixel != 24 or header.compression != BMP_UNCOMPRESSED or header.width <= 0 or header.height == 0:
+        return None
+    if os.path.getsize(file_path) < header.dataOffset + header.rowStride * header.height:
+        # truncated file
+        return None
+
+    rows = np.memmap(file_path, dtype=np.uint8, mode='r', offset=header.dataOffset, shape=(header.height, header.rowStride))
+    # drop the padding at the end of each row
+    pixels = rows[:, 0:header.width * 3].reshape(header.height, header.width, 3)
+    if not header.topDown:
+        pixels = pixels[::-1]
+    if rgb:
+        pixels = pixels[:, :, ::-1]
+
+    return pixels
+
+def decodeImage(file_path, rgb = False):
+    '''
+    Decodes an image file of any format into a (H, W, 3) uint8 array, with opencv or with pillow if opencv is not installed.
+    Arguments:
+        - rgb: return the channels in rgb order instead of the bgr order of opencv
+    '''
+    if cv2 is not None:
+        image = cv2.imread(file_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise IOError("could not read image " + file_path)
+        return image[:, :, ::-1] if rgb else image
+
+    from PIL import Image
+    with Image.open(file_path, 'r') as im:
+        image = np.asarray(im.convert('RGB'))
+    return image if rgb else image[:, :, ::-1]
+
+def loadBmpImage(file_path, rgb = False, decodeFn = None):
+    '''
+    Loads an image, memory-mapped if it's an uncompressed 24-bit .bmp file (see mapBmpImage), otherwise decoded.
+    Arguments:
+        - rgb: return the channels in rgb order instead of bgr
+        - decodeFn: function called with the file path to decode the images that can't be mapped (by default decodeImage);
+          it must return the channels in the requested order
+    Returns:
+        - (H, W, 3) uint8 array (or the array returned by decodeFn)
+    '''
+    pixels = mapBmpImage(file_path, rgb)
+    if pixels is not None:
+        return pixels
+
+    if decodeFn is not None:
+        return decodeFn(file_path)
+    return decodeImage(file_path, rgb)
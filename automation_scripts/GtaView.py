@@ -2,6 +2,29 @@ import numpy as np
 import cv2
 import os.path
 import math
+import logging
+import functools
+import collections
+from BmpFile import loadBmpImage
+
+log = logging.getLogger(__name__)
+
+# Region of a gta image that is resized to produce the kitti image (see GtaView.getKittiCrop):
+#   - gtaWidth, gtaHeight: resolution of the gta image
+#   - camWidth, camHeight: resolution of the whole gta image resized to the kitti camera width
+#   - kittiRow, kittiColumn: position of the kitti image in the resized whole image
+#   - srcRect: (startRow, endRow, startColumn, endColumn) of the region of the gta image, or None if the whole image must be resized
+#   - resizedSize: (width, height) of the region after the resize
+#   - resizedOffset: (row, column) of the kitti image in the resized region
+# Pixel coordinate spaces of the images (see GtaView.mapPoints):
+#   - "gta": image taken in gta, resolution equal to the screen
+#   - "cam": gta image resized to the kitti camera width (KittiCrop.camWidth x KittiCrop.camHeight)
+#   - "kitti": kitti image cut from the resized image (GtaView.kittiWidth x GtaView.kittiHeight)
+# The coordinates are the ones of the pixel centers (pixel (0, 0) covers [-0.5, 0.5) x [-0.5, 0.5)), so a point is mapped
+# to the same place of the picture as cv2.resize does.
+IMAGE_SPACES = ("gta", "cam", "kitti")
+
+KittiCrop = collections.namedtuple("KittiCrop", ["gtaWidth", "gtaHeight", "camWidth", "camHeight", "kittiRow", "kittiColumn", "srcRect", "resizedSize", "resizedOffset"])
 
 class GtaView:
     '''
@@ -9,65 +32,313 @@ class GtaView:
     images used in the kitti dataset.
     '''
     
-    # image taken in gta, resolution equal to the screen
-    gtaImage = None
-    # original image resolution taken by the kitti camera
-    kittiCamImage = None
-    # properly transformed image view to be equal to the images present in the kitti dataset
-    kittiImage = None
-    # percentage of resize used to shrink the original image view resolution down to the resolution of the kitti camera
-    resizePercentage = None
-
-    def __init__(self, sampleDirPath, fvImgFn):
+    # width of the images of the kitti camera
+    kittiCamWidth = 1392
+    # height of the region of interest cut from the middle of the kitti camera images
+    kittiRoiHeight = 512
+    # kitti size: 1224x370
+    kittiWidth = 1224
+    kittiHeight = 370
+
+    # every attribute is per instance; __slots__ keeps the instances compact and prevents state shared between samples
+    __slots__ = (
+        'directoryPath',
+        'fvImgFn',
+        # image taken in gta, resolution equal to the screen
+        'gtaImage',
+        # KittiCrop of the gta image resolution (the region of the gta image that becomes the kitti image)
+        'kittiCrop',
+        # properly transformed image view to be equal to the images present in the kitti dataset
+        'kittiImage',
+        # percentage of resize used to shrink the original image view resolution down to the resolution of the kitti camera
+        'resizePercentage',
+    )
+
+    def __init__(self, sampleDirPath, fvImgFn, image = None):
+        '''
+        Arguments:
+            - sampleDirPath: directory of the image file
+            - fvImgFn: name of the image file
+            - image: optional image already loaded (ex: from a cache), used instead of reading the file
+        '''
         self.directoryPath = sampleDirPath
         self.fvImgFn = fvImgFn
+        self.gtaImage = image
+        self.kittiCrop = None
+        self.kittiImage = None
 
         self.transformImageForKittiDataset()
 
     def transformImageForKittiDataset(self, kittiImageOutputDir = None):
         '''
         Makes the image captured in gta the same dimensions as the images of the kitti dataset.
+        Only the region of the gta image that ends up in the kitti image is resized (see getKittiCrop); the result is the
+        same as resizing the whole image to the kitti camera width and cutting the kitti image from its middle.
+        Arguments:
+            - kittiImageOutputDir: optional directory where the kitti image is saved, with the name of the gta image file
         '''
         # load original image view
-        self.gtaImage = cv2.imread(os.path.join(self.directoryPath, self.fvImgFn), cv2.IMREAD_UNCHANGED)
+        if self.gtaImage is None:
+            self.gtaImage = GtaView.loadImage(os.path.join(self.directoryPath, self.fvImgFn))
 
-        h_gta, w_gta, c_gta = self.gtaImage.shape
+        if self.kittiImage is None:
+            h_gta, w_gta = self.gtaImage.shape[:2]
+            self.kittiCrop = GtaView.getKittiCrop(h_gta, w_gta)
+            self.resizePercentage = self.kittiCrop.camWidth/w_gta # 0.725
+            log.debug("resize percentage: " + str(self.resizePercentage) + ", kitti crop: " + str(self.kittiCrop))
 
-        self.kittiCamImage = self.imageResize(self.gtaImage, width = 1392)
-        h_kitti, w_kitti, c_kitti = self.kittiCamImage.shape
-        print(self.kittiCamImage.shape)
+            self.kittiImage = GtaView.cropForKittiDataset(self.gtaImage, self.kittiCrop)
+
+        if kittiImageOutputDir is not None:
+            cv2.imwrite(os.path.join(kittiImageOutputDir, self.fvImgFn), self.kittiImage)
 
-        self.resizePercentage = w_kitti/w_gta # 0.725
-        print(self.resizePercentage)
+    @staticmethod
+    def transformWholeImageForKittiDataset(image):
+        '''
+        Resizes the whole gta image to the kitti camera width, cuts the region of interest from its middle
+        and then the kitti image from the middle of the region of interest.
+        Returns:
+            - kitti image
+        '''
+        kittiCamImage = GtaView.imageResize(image, width = GtaView.kittiCamWidth)
+        h_kitti, w_kitti = kittiCamImage.shape[:2]
 
         # cut height to 512 pixels (obtained the region of interest (roi)); maintain the same width
-        roiDesiredMiddleHeight = 512
+        roiDesiredMiddleHeight = GtaView.kittiRoiHeight
         startRow = int((h_kitti-roiDesiredMiddleHeight)/2)
-        roiImage = self.kittiCamImage[startRow:startRow+roiDesiredMiddleHeight, 0:w_kitti-1]
-        h_roi, w_roi, c_roi = roiImage.shape
-        
-        # kitti size: 1224x370
-        desiredRectMiddleWidth = 1224
-        desiredRectMiddleHeight = 370
+        roiImage = kittiCamImage[startRow:startRow+roiDesiredMiddleHeight, 0:w_kitti-1]
+        h_roi, w_roi = roiImage.shape[:2]
+
+        desiredRectMiddleWidth = GtaView.kittiWidth
+        desiredRectMiddleHeight = GtaView.kittiHeight
 
         startRectRow = int((h_roi-desiredRectMiddleHeight)/2)
         startRectColumn = int((w_roi-desiredRectMiddleWidth)/2)
-        print("kitti cut x: " + str(startRectRow))
-        print("kitti cut y: " + str(startRectColumn))
 
-        self.kittiImage = roiImage[startRectRow:startRectRow+desiredRectMiddleHeight, startRectColumn:startRectColumn+desiredRectMiddleWidth]
+        return roiImage[startRectRow:startRectRow+desiredRectMiddleHeight, startRectColumn:startRectColumn+desiredRectMiddleWidth]
 
-        if kittiImageOutputDir is not None:
-            cv2.imwrite(os.path.join(kittiImageOutputDir, self.fvImgFn), self.kittiImage)
+    @staticmethod
+    def cropForKittiDataset(image, kittiCrop):
+        '''
+        Resizes only the region of the gta image given by the KittiCrop, and cuts the kitti image from it.
+        Returns:
+            - kitti image
+        '''
+        if kittiCrop.srcRect is None:
+            return GtaView.transformWholeImageForKittiDataset(image)
+
+        startRow, endRow, startColumn, endColumn = kittiCrop.srcRect
+        resized = cv2.resize(image[startRow:endRow, startColumn:endColumn], kittiCrop.resizedSize, interpolation = cv2.INTER_AREA)
+
+        offsetRow, offsetColumn = kittiCrop.resizedOffset
+        return resized[offsetRow:offsetRow+GtaView.kittiHeight, offsetColumn:offsetColumn+GtaView.kittiWidth]
+
+    @staticmethod
+    def getAlignedRange(srcLength, dstLength, dstStart, dstEnd):
+        '''
+        Smallest range of source pixels that covers the resized pixels [dstStart, dstEnd) and starts and ends at a multiple
+        of the resize period (srcLength/gcd source pixels become dstLength/gcd resized pixels), so resizing only that
+        range gives the same pixels as resizing the whole length.
+        Returns:
+            - start and end in the source, length after the resize and offset of dstStart in the resized range
+        '''
+        divisor = math.gcd(srcLength, dstLength)
+        srcPeriod = srcLength // divisor
+        dstPeriod = dstLength // divisor
+
+        firstPeriod = dstStart // dstPeriod
+        lastPeriod = -(-dstEnd // dstPeriod)
+        resizedStart = firstPeriod * dstPeriod
+        resizedEnd = min(lastPeriod * dstPeriod, dstLength)
+
+        return firstPeriod * srcPeriod, min(lastPeriod * srcPeriod, srcLength), resizedEnd - resizedStart, dstStart - resizedStart
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def getKittiCrop(gtaHeight, gtaWidth):
+        '''
+        Computes, once per gta image resolution, the region of the gta image that becomes the kitti image.
+        The crop is checked against the whole image transformation with a random image; if they differ
+        (or the image is too small for the kitti image), the whole image is resized.
+        Returns:
+            - KittiCrop
+        '''
+        # same size as GtaView.imageResize(image, width = kittiCamWidth)
+        camWidth = GtaView.kittiCamWidth
+        camHeight = int(gtaHeight * (camWidth / float(gtaWidth)))
+
+        # same cuts as transformWholeImageForKittiDataset
+        roiStartRow = int((camHeight-GtaView.kittiRoiHeight)/2)
+        roiHeight = min(GtaView.kittiRoiHeight, camHeight - roiStartRow)
+        roiWidth = camWidth - 1
+        kittiRow = roiStartRow + int((roiHeight-GtaView.kittiHeight)/2)
+        kittiColumn = int((roiWidth-GtaView.kittiWidth)/2)
+
+        if roiStartRow < 0 or roiHeight < GtaView.kittiHeight or roiWidth < GtaView.kittiWidth:
+            return KittiCrop(gtaWidth, gtaHeight, camWidth, camHeight, kittiRow, kittiColumn, None, None, None)
+
+        startRow, endRow, resizedHeight, offsetRow = GtaView.getAlignedRange(gtaHeight, camHeight, kittiRow, kittiRow + GtaView.kittiHeight)
+        startColumn, endColumn, resizedWidth, offsetColumn = GtaView.getAlignedRange(gtaWidth, camWidth, kittiColumn, kittiColumn + GtaView.kittiWidth)
+        kittiCrop = KittiCrop(gtaWidth, gtaHeight, camWidth, camHeight, kittiRow, kittiColumn, (startRow, endRow, startColumn, endColumn),
+            (resizedWidth, resizedHeight), (offsetRow, offsetColumn))
+
+        testImage = np.random.default_rng(0).integers(0, 256, (gtaHeight, gtaWidth, 3), dtype=np.uint8)
+        if not np.array_equal(GtaView.cropForKittiDataset(testImage, kittiCrop), GtaView.transformWholeImageForKittiDataset(testImage)):
+            log.warning("the kitti crop of " + str(gtaWidth) + "x" + str(gtaHeight) + " images differs from the whole image transformation, resizing whole images")
+            return KittiCrop(gtaWidth, gtaHeight, camWidth, camHeight, kittiRow, kittiColumn, None, None, None)
+
+        return kittiCrop
+
+    @staticmethod
+    def getImageSpaceSize(kittiCrop, space):
+        '''
+        Returns:
+            - (width, height) of the images of a coordinate space (see IMAGE_SPACES)
+        '''
+        if space == "gta":
+            return kittiCrop.gtaWidth, kittiCrop.gtaHeight
+        if space == "cam":
+            return kittiCrop.camWidth, kittiCrop.camHeight
+        if space == "kitti":
+            return GtaView.kittiWidth, GtaView.kittiHeight
+        raise ValueError("unknown image space " + str(space) + ", expected one of " + str(IMAGE_SPACES))
+
+    @staticmethod
+    def getImageSpaceTransform(kittiCrop, fromSpace, toSpace):
+        '''
+        Scale and offset that map the coordinates of a space into another: to = from * scale + offset.
+        Returns:
+            - (2,) scale and (2,) offset arrays, for (x, y)
+        '''
+        def fromGta(space):
+            # scale and offset of the mapping from the gta image into the space (unknown spaces raise a ValueError)
+            GtaView.getImageSpaceSize(kittiCrop, space)
+            if space == "gta":
+                return np.ones(2), np.zeros(2)
+            scale = np.array([kittiCrop.camWidth / kittiCrop.gtaWidth, kittiCrop.camHeight / kittiCrop.gtaHeight])
+            offset = 0.5 * scale - 0.5
+            if space == "kitti":
+                offset -= [kittiCrop.kittiColumn, kittiCrop.kittiRow]
+            return scale, offset
+
+        fromScale, fromOffset = fromGta(fromSpace)
+        toScale, toOffset = fromGta(toSpace)
+        scale = toScale / fromScale
+        return scale, toOffset - fromOffset * scale
+
+    @staticmethod
+    def mapPoints(points, kittiCrop, fromSpace = "gta", toSpace = "kitti"):
+        '''
+        Maps points between the coordinate spaces of the images (ex: the projections proj_x, proj_y of a whole point cloud
+        from the gta image into the kitti image).
+        Arguments:
+            - points: (N, 2) array of (x, y) coordinates
+            - kittiCrop: KittiCrop of the gta image (GtaView.kittiCrop)
+            - fromSpace, toSpace: coordinate spaces (see IMAGE_SPACES)
+        Returns:
+            - (N, 2) float64 array with the mapped points
+            - (N,) bool array, true for the points inside the pixels of the toSpace image
+        '''
+        scale, offset = GtaView.getImageSpaceTransform(kittiCrop, fromSpace, toSpace)
+        mapped = np.asarray(points, dtype=np.float64).reshape(-1, 2) * scale + offset
+
+        width, height = GtaView.getImageSpaceSize(kittiCrop, toSpace)
+        inside = (mapped[:, 0] >= -0.5) & (mapped[:, 0] < width - 0.5) & (mapped[:, 1] >= -0.5) & (mapped[:, 1] < height - 0.5)
+        return mapped, inside
+
+    @staticmethod
+    def mapPixels(pixels, kittiCrop, fromSpace = "gta", toSpace = "kitti"):
+        '''
+        Maps pixel indices between the coordinate spaces of the images, to the nearest pixel (see mapPoints).
+        Returns:
+            - (N, 2) int64 array with the (column, row) of the mapped pixels
+            - (N,) bool array, true for the pixels inside the toSpace image (the others must not be used as indices)
+        '''
+        mapped, inside = GtaView.mapPoints(pixels, kittiCrop, fromSpace, toSpace)
+        return np.floor(mapped + 0.5).astype(np.int64), inside
+
+    @staticmethod
+    def mapBoxes(boxes, kittiCrop, fromSpace = "gta", toSpace = "kitti"):
+        '''
+        Maps 2d bounding boxes between the coordinate spaces of the images and clips them to the toSpace image.
+        Arguments:
+            - boxes: (K, 4) array of (xmin, ymin, xmax, ymax)
+        Returns:
+            - (K, 4) float64 array with the mapped boxes, clipped to [0, width-1] x [0, height-1]
+            - (K,) float64 array with the truncation of each box: fraction of its area outside the image (1 if it is
+              completely outside, 0 if it is inside)
+        '''
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scale, offset = GtaView.getImageSpaceTransform(kittiCrop, fromSpace, toSpace)
+        scale = np.tile(scale, 2)
+        mapped = boxes * scale + np.tile(offset, 2)
+
+        width, height = GtaView.getImageSpaceSize(kittiCrop, toSpace)
+        clipped = GtaView.clipBoxes(mapped, width, height)
+        return clipped, GtaView.getBoxesTruncation(mapped, clipped)
+
+    @staticmethod
+    def clipBoxes(boxes, width, height):
+        '''
+        Clips 2d bounding boxes (K, 4) of (xmin, ymin, xmax, ymax) to [0, width-1] x [0, height-1] (as kitti_util.compute_boxes_2d).
+        Boxes completely outside of the image become degenerate boxes on its border.
+        '''
+        clipped = np.empty_like(boxes)
+        clipped[:, 0::2] = np.clip(boxes[:, 0::2], 0, width - 1)
+        clipped[:, 1::2] = np.clip(boxes[:, 1::2], 0, height - 1)
+        return clipped
+
+    @staticmethod
+    def getBoxesTruncation(boxes, clippedBoxes):
+        '''
+        Returns:
+            - (K,) array with the fraction of the area of each box that was clipped; boxes without area are truncated (1)
+              if any of their coordinates was clipped
+        '''
+        area = np.prod(boxes[:, 2:4] - boxes[:, 0:2], axis=1)
+        clippedArea = np.prod(clippedBoxes[:, 2:4] - clippedBoxes[:, 0:2], axis=1)
+        wasClipped = (boxes != clippedBoxes).any(axis=1)
 
+        with np.errstate(divide='ignore', invalid='ignore'):
+            truncation = np.where(area > 0, 1 - clippedArea / area, 1.0)
+        return np.where(wasClipped, np.clip(truncation, 0, 1), 0.0)
+
+    @staticmethod
+    def loadImage(filePath):
+        '''
+        Loads an image taken in gta. Uncompressed 24-bit .bmp files are memory-mapped (see BmpFile), so only the rows
+        that are used (ex: the ones cropped for the kitti image) are read; other images are decoded by opencv.
+        Returns:
+            - (H, W, C) bgr image
+        '''
+        def decode(filePath):
+            image = cv2.imread(filePath, cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise IOError("could not read image " + filePath)
+            return image
 
+        return loadBmpImage(filePath, decodeFn = decode)
+
+    def release(self):
+        '''
+        Drops the references to the images, so their memory can be freed as soon as the sample is processed.
+        '''
+        self.gtaImage = None
+        self.kittiImage = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
 
     def getKittiImageDimensions(self):
         kitti_height, kitti_width, kitti_channels = self.kittiImage.shape
 
         return kitti_height, kitti_width, kitti_channels
 
-    def imageResize(self, image, width = None, height = None, inter = cv2.INTER_AREA):
+    @staticmethod
+    def imageResize(image, width = None, height = None, inter = cv2.INTER_AREA):
         '''
         From https://stackoverflow.com/questions/44650888/resize-an-image-without-distortion-opencv
         '''
@@ -118,6 +389,24 @@ class GtaView:
         '''    
         cv2.imwrite(os.path.join(dirPath, filename), image)
 
+    def encodeImage(self, image, extension = ".png"):
+        '''
+        Encodes an image in the format of the extension, so it can be written separately (see saveEncodedImage).
+        Returns:
+            - bytes of the image file
+        '''
+        ok, encoded = cv2.imencode(extension, image)
+        if not ok:
+            raise IOError("could not encode image as " + extension)
+        return encoded.tobytes()
+
+    def saveEncodedImage(self, encodedImage, dirPath, filename):
+        '''
+        Writes an image encoded by encodeImage.
+        '''
+        with open(os.path.join(dirPath, filename), "wb") as the_file:
+            the_file.write(encodedImage)
+
     def showViewWith2dBoundingBoxes(self, boundingBoxList, image_opencv, color = (0, 0, 255), window_title = "Bounding box results", window_size = 0.5):
         '''
         Open a window showing the 2d bounding boxes over the given image view.
@@ -150,46 +439,13 @@ class GtaView:
     def calculate2dBoundingBoxesForKittiImgSize(self, tuple_2d_coords, discard_trucated_boxes = True, min_height = 40, min_length = 40):
         '''
         Calculate 2d bounding boxes for the resized and cropped image views that match kitti's images.
+        For many boxes at once use GtaView.mapBoxes.
+        Arguments:
+            - tuple_2d_coords: (minX, minY, maxX, maxY) of the box in the gta image
+        Returns:
+            - minX, minY, maxX, maxY of the box in the kitti image, clipped to the image
         '''
-        original_height, original_width, original_channels = self.gtaImage.shape
-        kitti_height, kitti_width, kitti_channels = self.kittiImage.shape
-
-        '''
-        lr_bar_width
-        <-->
-         _____________________________
-        |      . p2                   |
-        |    _____________________    |
-        |   |   . p1              | . |
-        |   |_____________________| p3|
-        |                             |  | ub_bar_width
-        |_____________________________|  |
-        '''
-        print("original_width: " + str(original_width))
-        print("kitti_width: " + str(kitti_width))
-        print("kitti_height: " + str(kitti_height))
-        kci_h, kci_w, kci_c = self.kittiCamImage.shape
-        print("kitti_cam_width: " + str(kci_w))
-        print("kitti_cam_height: " + str(kci_h))
-
-        lr_bar = int((kci_w-kitti_width) / 2)
-        ub_bar = int((kci_h-kitti_height) / 2)
-        print("lr_bar_width: " + str(lr_bar))
-        print("ub_bar_height: " + str(ub_bar))
-
-        resize_percentage = kci_w/original_width # 0.725
-
-        # minX
-        minX = math.ceil(tuple_2d_coords[0]*resize_percentage) - lr_bar
-        # maxX
-        maxX = math.ceil(tuple_2d_coords[2]*resize_percentage) - lr_bar
-        # minY
-        minY = math.ceil(tuple_2d_coords[1]*resize_percentage) - ub_bar
-        # maxY
-        maxY = math.ceil(tuple_2d_coords[3]*resize_percentage) - ub_bar
-
-        bb_height = maxX - minX
-        bb_length = maxY - minY
+        boxes, truncation = GtaView.mapBoxes([tuple_2d_coords], self.kittiCrop, "gta", "kitti")
+        minX, minY, maxX, maxY = np.ceil(boxes[0]).astype(int).tolist()
 
         return minX, minY, maxX, maxY
-
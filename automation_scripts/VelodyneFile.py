@@ -0,0 +1,159 @@
+'''
+Reading and writing of velodyne point cloud files (ex: 000000.bin).
+A KITTI velodyne file is a sequence of float32 (x, y, z, intensity) values.
+The files are memory-mapped, so the points are only read from disk when they are accessed.
+The files are written in blocks of points, without converting the whole point cloud first.
+Ref: https://github.com/hunse/kitti/blob/master/kitti/velodyne.py
+'''
+import os
+import os.path
+import numpy as np
+
+# number of float32 values per point in a KITTI velodyne file: x, y, z, intensity
+KITTI_VALUES_PER_POINT = 4
+
+# number of points converted and written at a time
+WRITE_BLOCK_POINTS = 1 << 16
+
+def openVelodyneFile(file_path, values_per_point = KITTI_VALUES_PER_POINT, dtype = np.float32):
+    '''
+    Memory-maps a velodyne file.
+    Arguments:
+        - file_path: path to the .bin file
+        - values_per_point: number of values of each point
+        - dtype: type of the values stored in the file
+    Returns:
+        - read-only (N, values_per_point) array backed by the file
+    '''
+    point_size = values_per_point * np.dtype(dtype).itemsize
+    file_size = os.path.getsize(file_path)
+    if file_size % point_size != 0:
+        raise ValueError(file_path + " size (" + str(file_size) + " bytes) is not a multiple of the point size (" + str(point_size) + " bytes)")
+
+    if file_size == 0:
+        # empty files can't be memory-mapped
+        return np.zeros((0, values_per_point), dtype=dtype)
+
+    return np.memmap(file_path, dtype=dtype, mode='r', shape=(file_size // point_size, values_per_point))
+
+def loadKittiVelodyneFile(file_path, include_luminance = False):
+    '''
+    Loads a kitti velodyne file (ex: 000000.bin) without copying it into memory.
+    Argument:
+        - include_luminance: if the point intensity value is included
+    Returns:
+        - (N, 4) float32 array with (x, y, z, l) per point if include_luminance, otherwise a (N, 3) view with (x, y, z)
+    '''
+    points = openVelodyneFile(file_path)
+    if include_luminance:
+        return points
+
+    return getXyz(points)
+
+def loadGtaVelodyneBinFile(file_path):
+    '''
+    Loads a velodyne file saved with 3 float64 values (x, y, z) per point and no intensity.
+    Returns:
+        - (N, 3) float64 array backed by the file
+    '''
+    return openVelodyneFile(file_path, 3, np.float64)
+
+def saveKittiVelodyneFile(file_path, points, intensity = 1.0, atomic = True):
+    '''
+    Saves a point cloud into a velodyne file of float32 values.
+    Arguments:
+        - file_path: path to the .bin file
+        - points: (N, 3) or (N, 4) array with (x, y, z[, intensity]) per point
+        - intensity: intensity of every point, as a single value or a (N,) array (the intensity column of points is ignored).
+                     If None, the points are written as they are (3 or 4 values per point)
+        - atomic: if the points are written into a temporary file that is renamed to file_path at the end,
+                  so an incomplete file never exists with the final name
+    '''
+    points = np.asarray(points)
+    if points.ndim != 2 or points.shape[1] not in (3, KITTI_VALUES_PER_POINT):
+        raise ValueError("Velodyne points must be a (N, 3) or (N, 4) array, not " + str(points.shape))
+
+    if intensity is None:
+        values_per_point = points.shape[1]
+    else:
+        values_per_point = KITTI_VALUES_PER_POINT
+        intensity = np.asarray(intensity, dtype=np.float32)
+        if intensity.ndim > 0 and intensity.shape != (len(points),):
+            raise ValueError("Velodyne intensity must be a single value or a (" + str(len(points)) + ",) array, not " + str(intensity.shape))
+
+    write_path = file_path + ".tmp" if atomic else file_path
+    try:
+        with open(write_path, "wb") as f:
+            if intensity is None and points.dtype == np.float32 and points.flags['C_CONTIGUOUS']:
+                # already in the file layout
+                points.tofile(f)
+            else:
+                # block reused to interleave the values of each group of points
+                block = np.empty((min(len(points), WRITE_BLOCK_POINTS), values_per_point), dtype=np.float32)
+                for start in range(0, len(points), WRITE_BLOCK_POINTS):
+                    n = min(WRITE_BLOCK_POINTS, len(points) - start)
+                    if intensity is None:
+                        block[0:n] = points[start:start + n]
+                    else:
+                        block[0:n, 0:3] = points[start:start + n, 0:3]
+                        block[0:n, 3] = intensity if intensity.ndim == 0 else intensity[start:start + n]
+                    f.write(block[0:n].tobytes())
+
+        if atomic:
+            os.replace(write_path, file_path)
+    except BaseException:
+        if atomic and os.path.exists(write_path):
+            # no partial file is left next to the complete ones (ex: disk full)
+            os.remove(write_path)
+        raise
+
+def getXyz(points):
+    '''
+    Returns:
+        - (N, 3) view with the positions of the points (no copy)
+    '''
+    return points[:, 0:3]
+
+def getIntensity(points):
+    '''
+    Returns:
+        - (N,) view with the intensity of the points (no copy)
+    '''
+    return points[:, 3]
+
+class VelodyneDirectory:
+    '''
+    Lazily indexed collection of the velodyne files of a directory (ex: training/velodyne/).
+    Files are only memory-mapped when they are accessed, by position or by frame id (ex: "000042").
+    '''
+
+    def __init__(self, directory_path, extension = ".bin", include_luminance = True):
+        self.directory_path = directory_path
+        self.include_luminance = include_luminance
+
+        # sorted list of frame ids (file names without extension)
+        self.frame_ids = sorted(os.path.splitext(fn)[0] for fn in os.listdir(directory_path) if fn.endswith(extension))
+        self.extension = extension
+        self.index_per_frame_id = {frame_id: i for i, frame_id in enumerate(self.frame_ids)}
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def __getitem__(self, key):
+        '''
+        Arguments:
+            - key: position of the file in the sorted list, or frame id string
+        Returns:
+            - memory-mapped points of the file (see loadKittiVelodyneFile)
+        '''
+        if isinstance(key, str):
+            key = self.index_per_frame_id[key]
+
+        return loadKittiVelodyneFile(self.getPath(key), self.include_luminance)
+
+    def __iter__(self):
+        for i in range(0, len(self.frame_ids)):
+            yield self.frame_ids[i], self[i]
+
+    def getPath(self, index):
+        return os.path.join(self.directory_path, self.frame_ids[index] + self.extension)
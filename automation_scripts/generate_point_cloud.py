@@ -2,88 +2,145 @@
 import os
 import subprocess
 import shutil
+import shlex
 
-def generate_point_cloud():
+# command of the pseudo_lidar_V2 repo that generates the point clouds from the depth maps; {calib_dir}, {depth_dir} and {save_dir} are replaced
+POINT_CLOUD_COMMAND = "python ./src/preprocess/generate_lidar_from_depth.py --calib_dir {calib_dir} --depth_dir {depth_dir} --save_dir {save_dir}"
+
+def formatCommand(command, **values):
+    '''
+    Splits a command into its arguments and replaces the {name} placeholders of each argument, so the values
+    (ex: paths with spaces) are always a single argument.
+    '''
+    return [arg.format(**values) for arg in shlex.split(command)]
+
+def generate_point_cloud(depth_dir = "./results/sdn_kitti_train_set/depth_maps/trainval/", save_dir = "./results/sdn_kitti_train_set/pseudo_lidar_trainval/",
+        calib_dir = "./kitti/training/calib/", cwd = None, command = POINT_CLOUD_COMMAND):
+    '''
+    Generates the point cloud (.bin) of every depth map of depth_dir.
+    Arguments:
+        - cwd: directory where the command runs (by default the current directory, the pseudo_lidar_V2 repo)
+        - command: command that generates the point clouds (see POINT_CLOUD_COMMAND)
+    Returns:
+        - True if the command succeeded
+    '''
     print("Generating point cloud from depth map...")
-    command = "python ./src/preprocess/generate_lidar_from_depth.py --calib_dir ./kitti/training/calib/ --depth_dir ./results/sdn_kitti_train_set/depth_maps/trainval/ --save_dir ./results/sdn_kitti_train_set/pseudo_lidar_trainval/"
-    result = subprocess.run(command.split(' '), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    result = subprocess.run(formatCommand(command, calib_dir = calib_dir, depth_dir = depth_dir, save_dir = save_dir), cwd = cwd,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     #Print the stdout and stderr
     print(result.stdout)
     print(result.stderr)
     print("Done.")
+    return result.returncode == 0
 
 from pathlib import Path
 import numpy as np
 import os.path
 import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+# .PLY writer (copy of Data processing scripts/GTA_data_samples_processing/PlyFile.py)
+from PlyFile import createVertexArray, writePly
+# memory-mapped velodyne reader (copy of Data processing scripts/GTA_data_samples_processing/VelodyneFile.py)
+from VelodyneFile import loadKittiVelodyneFile
+
+def savePlyFile(filepath, tuple_list, attributes = None, color_for_every_point = (0, 255, 0), binary = True):
+    '''
+    For testing in the Main.py file
+    Save list of points (possibly with attributes such as color) into a .PLY formated file
+    Arguments:
+        - tuple_list: list (or array) of points and their attributes
+        - attributes: to indicate what type of attributes are included in the points:
+            - c: each point has position + color (r, g, b)
+        - color_for_every_point: color given to the points when attributes is "c" but the points dont have color
+        - binary: write a binary_little_endian .PLY instead of an ascii one
+    '''
+    if len(tuple_list) == 0:
+        points = np.zeros((0, 3))
+    else:
+        points = np.asarray(tuple_list).reshape(len(tuple_list), -1)
+
+    colors = None
+    if attributes == "c":
+        # if the points dont have color, but the attributes is set to "c"
+        colors = points[:, 3:6] if points.shape[1] >= 6 else color_for_every_point
+
+    writePly(filepath, createVertexArray(points[:, 0:3], colors), binary)
 
-def loadKittiVelodyneFile(file_path, include_luminance = False):
+def linkOrCopyFile(filePath, destPath):
     '''
-    Loads a kitti velodyne file (ex: 000000.bin) into a list of tuples, where each tuple has (x, y, z) or (x, y, z, l)
-    Right now it discards the 4th vaule of each point, i.e. the luminance
-    Argument:
-        - include_luminance: if the function should also store the pont intensisty value in the list of points
+    Places a file at destPath without copying its content: a hardlink is created, or the file is copied if hardlinks
+    are not supported (ex: different filesystems).
     '''
-    # Source: https://github.com/hunse/kitti/blob/master/kitti/velodyne.py
-    points = np.fromfile(file_path, dtype=np.float32).reshape(-1, 4)
-    points = points[:, :3]  # exclude luminance
+    if os.path.exists(destPath):
+        if os.path.samefile(filePath, destPath):
+            return
+        os.remove(destPath)
 
-    point_tuple_list = []
-    for i in range(len(points)):
-        point_tuple_list.append((points[i][0], points[i][1], points[i][2],))
+    try:
+        os.link(filePath, destPath)
+    except OSError:
+        shutil.copyfile(filePath, destPath)
 
-    return point_tuple_list
+def getPointCloudNames(pointCloudDir):
+    '''
+    Returns:
+        - names (without the .bin extension) of the point clouds of a directory, ex: 007481
+    '''
+    return sorted(os.path.splitext(fn)[0] for fn in os.listdir(pointCloudDir) if fn.endswith(".bin"))
 
-def savePlyFile(filepath, tuple_list, attributes = None, color_for_every_point = (0, 255, 0)):
+def convertPointCloud(job):
     '''
-    For testing in the Main.py file
-    Save list of points (possibly with attributes such as color) into a .PLY formated file
+    Converts a pseudo-lidar point cloud (.bin) into a binary .ply file and places its depth map (.npy) next to it.
     Arguments:
-        - tuple_list: list of points and their attributes
-        - attributes: to indicate what type of attributes are included in the points:
-            - c: each point has position + color (r, g, b)
+        - job: (.bin path, .ply path, depth map path or None, depth map destination path)
+    Returns:
+        - number of points, or the error message if the point cloud could not be converted
     '''
-    with open(filepath, "w") as the_file:
-        header_lines = ["ply", "format ascii 1.0"]
-        header_lines.append("element vertex " + str(len(tuple_list)))
-        header_lines.append("property float x")
-        header_lines.append("property float y")
-        header_lines.append("property float z")
-
-        # if point have color
-        if attributes == "c":
-            header_lines.append("property uchar red")
-            header_lines.append("property uchar green")
-            header_lines.append("property uchar blue")
-
-        header_lines.append("end_header")
-
-        for i in range(0, len(header_lines)):
-            the_file.write(header_lines[i] + "\n")
-
-        for i in range(0, len(tuple_list)):
-            if attributes == "c" and len(tuple_list[i]) <= 3:    # if the points dont have color, but the attributes is set to "c"
-                new_tuple = (tuple_list[i][0], tuple_list[i][1], tuple_list[i][2], color_for_every_point[0], color_for_every_point[1], color_for_every_point[2])
-                the_file.write(tupleToStr(new_tuple) + "\n")
-            else:
-                the_file.write(tupleToStr(tuple_list[i]) + "\n")
-
-def tupleToStr(tuple):
+    binPath, plyPath, depthPath, depthDestPath = job
+    try:
+        # (N, 3) view of the memory-mapped file; it is only read when the vertices are built
+        xyz = loadKittiVelodyneFile(binPath)
+        writePly(plyPath, createVertexArray(xyz))
+
+        if depthPath is not None:
+            linkOrCopyFile(depthPath, depthDestPath)
+    except Exception as e:
+        return binPath + ": " + str(e)
+    return len(xyz)
+
+def convertPointClouds(jobs, nProcesses = None, executor = None):
     '''
-    Converts a tuple of N size into a string, where each element is separated by a space.
+    Converts point clouds in parallel (see convertPointCloud).
     Arguments:
-    - tuple: tuple to be converted into string
+        - jobs: list of convertPointCloud jobs
+        - nProcesses: number of point clouds converted at the same time (None = number of CPUs)
+        - executor: optional process pool to run the conversions in, instead of creating one
     Returns:
-        - string with the tuple values
+        - number of converted point clouds
     '''
-    tuple_string = ""
-    for i in range(0, len(tuple)):
-        if i == (len(tuple)-1):
-            tuple_string += str(tuple[i])
+    print("Generating .ply from .bin...")
+    start = time.perf_counter()
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=nProcesses) as executor:
+            results = list(executor.map(convertPointCloud, jobs))
+    else:
+        results = list(executor.map(convertPointCloud, jobs))
+    elapsed = time.perf_counter() - start
+
+    nConverted = 0
+    nPoints = 0
+    for result in results:
+        if isinstance(result, str):
+            print("Could not convert " + result)
         else:
-            tuple_string += str(tuple[i]) + " "
+            nConverted += 1
+            nPoints += result
 
-    return tuple_string
+    print("Converted " + str(nConverted) + " of " + str(len(jobs)) + " point clouds (" + str(nPoints) + " points) in " + "%.2f" % elapsed
+        + " s (" + "%.1f" % (nConverted / max(elapsed, 1e-9)) + " frames/s)")
+    print("Done.")
+    return nConverted
 
 # os.chdir("pseudo_lidar_V2")
 # generate_point_cloud()
@@ -1,82 +1,236 @@
-
+#
+# Generates the pseudo-LiDAR point clouds of every stereo pair of the GTA dataset with the pseudo_lidar_V2 repo.
+# The samples are processed in chunks, as a pipeline: while the depth maps and point clouds of a chunk are generated
+# (downstream), the images of the next chunk are converted to the kitti size by a pool of threads and written straight
+# into the kitti directories of pseudo_lidar_V2.
+#
+# Usage: python mass_generate.py [--chunk-size N] [--threads N] [--processes N] [--depth-command CMD] [--point-cloud-command CMD]
+# The downstream commands can be replaced (ex: by a local stand-in when testing the pipeline), see DEPTH_COMMAND and
+# generate_point_cloud.POINT_CLOUD_COMMAND for their placeholders.
+#
 import os
 import shutil
 import subprocess
-import glob
+import argparse
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from zipfile import ZipFile
 
-if os.path.exists("GTADataset.zip"):
-    # Create a ZipFile Object and load sample.zip in it
-    with ZipFile('GTADataset.zip', 'r') as zipObj:
-       # Extract all the contents of zip file in different directory
-       zipObj.extractall('/content/')
-    # os.remove("GTADataset.zip")
-
-data_dir = "GTADataset"
-# n = 7480
-# i = 1
-for subdir in os.listdir(data_dir):
-    # ni = n + i
-    # photo_name = '00' + str(ni)
-    photo_name = subdir
-    path = os.path.join(data_dir, subdir)
-
-    from GtaView import GtaView
-
-    if os.path.exists("007481.txt"):
-        shutil.copy("007481.txt", "pseudo_lidar_V2/kitti/training/calib/" + photo_name + ".txt")
-    if os.path.exists(os.path.join(path, "left.png")):
-        view = GtaView(path, 'left.png')
-        view.transformImageForKittiDataset(kittiImageOutputDir = '/tmp/')
-        shutil.copy(os.path.join('/tmp/', "left.png"), "pseudo_lidar_V2/kitti/training/image_2/" + photo_name + ".png")
-        os.remove("/tmp/left.png")
-    if os.path.exists(os.path.join(path, "right.png")):
-        view = GtaView(path, 'right.png')
-        view.transformImageForKittiDataset(kittiImageOutputDir = '/tmp/')
-        shutil.copy(os.path.join('/tmp/', "right.png"), "pseudo_lidar_V2/kitti/training/image_3/" + photo_name + ".png")
-        os.remove("/tmp/right.png")
-    # i += 1
-    with open("subval2.txt", "a") as sv, open("train2.txt", "a") as t:
-        sv.write(photo_name + "\n")
-        t.write(photo_name + "\n")
-
-if not os.path.exists("test2.txt"):
-    os.mknod("test2.txt")
-
-if os.path.exists("sdn_kitti_train.config"):
-    shutil.move("sdn_kitti_train.config", "pseudo_lidar_V2/src/configs/sdn_kitti_train.config")
-if not os.path.exists("sdn_kitti_test.config"):
-    shutil.copy("pseudo_lidar_V2/src/configs/sdn_kitti_train.config", "pseudo_lidar_V2/src/configs/sdn_kitti_test.config")
-
-for split_file in glob.glob("*.txt"):
-    shutil.move(os.path.join("/content", split_file), os.path.join("/content/pseudo_lidar_V2/split/", split_file))
-
-os.chdir("pseudo_lidar_V2")
-command = "python ./src/main.py --config ./src/configs/sdn_kitti_train.config --resume ./results/sdn_kitti_train_set/sdn_kitti_object_trainval.pth --dataset kitti --data_list ./split/train2.txt --generate_depth_map --data_tag trainval"
-result = subprocess.run(command.split(' '), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-#Print the stdout and stderr
-print(result.stdout)
-print(result.stderr)
-print("Done.")
-
-from generate_point_cloud import generate_point_cloud, loadKittiVelodyneFile, savePlyFile
-
-# generate point clouds for all available images (depth maps)
-generate_point_cloud()
-
-print("Generating .ply from .bin...")
-for pc in os.listdir('/content/pseudo_lidar_V2/results/sdn_kitti_train_set/pseudo_lidar_trainval/'):
-    # '007481.bin'
-    pc_name = pc.split('/')[-1].strip('.bin')
-    # pc_number = int(pc_name) - 7480
-    pc_number = pc_name
-    ptl = loadKittiVelodyneFile(os.path.join('/content/pseudo_lidar_V2/results/sdn_kitti_train_set/pseudo_lidar_trainval/', pc))
-    savePlyFile('/content/GTADataset/' + str(pc_number).zfill(2) + "/" + pc_name + '.ply', ptl)
-    shutil.copy("/content/pseudo_lidar_V2/results/sdn_kitti_train_set/depth_maps/trainval/" + pc_name + ".npy", "/content/GTADataset/" + str(pc_number).zfill(2) + "/" + pc_name + ".npy")
-print("Done.")
-
-print("Generating zip file...")
-command = "zip -r /content/GTADataset_res.zip /content/GTADataset/"
-subprocess.run(command.split(" "))
-print("Done.")
+from GtaView import GtaView
+from generate_point_cloud import generate_point_cloud, convertPointClouds, formatCommand, POINT_CLOUD_COMMAND
+
+# directory where the scripts run (/content in colab)
+ROOT_DIR = os.getcwd()
+DATA_DIR = os.path.join(ROOT_DIR, "GTADataset")
+PSEUDO_LIDAR_DIR = os.path.join(ROOT_DIR, "pseudo_lidar_V2")
+KITTI_TRAINING_DIR = os.path.join(PSEUDO_LIDAR_DIR, "kitti/training")
+SPLIT_DIR = os.path.join(PSEUDO_LIDAR_DIR, "split")
+RESULTS_DIR = os.path.join(PSEUDO_LIDAR_DIR, "results/sdn_kitti_train_set")
+# calib file shared by every sample
+CALIB_FILE = os.path.join(ROOT_DIR, "007481.txt")
+
+# kitti directory of each image of a stereo pair
+STEREO_IMAGES = (("left.png", "image_2"), ("right.png", "image_3"))
+
+# depth generation of the pseudo_lidar_V2 repo; {data_list} and {data_tag} are replaced (the depth maps are saved in
+# results/sdn_kitti_train_set/depth_maps/{data_tag}/)
+DEPTH_COMMAND = ("python ./src/main.py --config ./src/configs/sdn_kitti_train.config --resume ./results/sdn_kitti_train_set/sdn_kitti_object_trainval.pth"
+    + " --dataset kitti --data_list {data_list} --generate_depth_map --data_tag {data_tag}")
+
+def convertSample(sampleName):
+    '''
+    Converts the stereo pair of a sample to the kitti size, writing the images straight into the kitti directories,
+    and copies the calib file.
+    Returns:
+        - None, or the error message if the sample could not be converted
+    '''
+    path = os.path.join(DATA_DIR, sampleName)
+    # both images are checked before writing any, so no image without its pair is left in the kitti directories
+    for imageFn, kittiDir in STEREO_IMAGES:
+        if not os.path.exists(os.path.join(path, imageFn)):
+            return "missing " + imageFn
+
+    try:
+        for imageFn, kittiDir in STEREO_IMAGES:
+            with GtaView(path, imageFn) as view:
+                view.saveImage(view.kittiImage, os.path.join(KITTI_TRAINING_DIR, kittiDir), sampleName + ".png")
+
+        if os.path.exists(CALIB_FILE):
+            shutil.copyfile(CALIB_FILE, os.path.join(KITTI_TRAINING_DIR, "calib", sampleName + ".txt"))
+    except Exception as e:
+        # an unreadable right image would otherwise leave the left one behind
+        for imageFn, kittiDir in STEREO_IMAGES:
+            kittiImagePath = os.path.join(KITTI_TRAINING_DIR, kittiDir, sampleName + ".png")
+            if os.path.exists(kittiImagePath):
+                os.remove(kittiImagePath)
+        return str(e)
+    return None
+
+def convertChunk(executor, sampleNames):
+    '''
+    Converts the samples of a chunk in the threads of the executor.
+    Returns:
+        - names of the converted samples
+    '''
+    errors = list(executor.map(convertSample, sampleNames))
+    for sampleName, error in zip(sampleNames, errors):
+        if error is not None:
+            print("Could not convert " + sampleName + ": " + error)
+    return [sampleName for sampleName, error in zip(sampleNames, errors) if error is None]
+
+def saveSplitFile(filename, sampleNames):
+    '''
+    Writes a split file of pseudo_lidar_V2 (one sample name per line) at once.
+    Returns:
+        - path of the file, relative to the pseudo_lidar_V2 repo (as used by its commands)
+    '''
+    with open(os.path.join(SPLIT_DIR, filename), "w") as f:
+        f.write("".join(sampleName + "\n" for sampleName in sampleNames))
+    return "./split/" + filename
+
+def getPointCloudJobs(sampleNames, pointCloudDir, depthDir):
+    '''
+    Returns:
+        - convertPointCloud jobs that save the point cloud (.ply) and the depth map (.npy) of each sample into its
+          directory of the dataset
+    '''
+    jobs = []
+    for pc_name in sampleNames:
+        binPath = os.path.join(pointCloudDir, pc_name + ".bin")
+        if not os.path.exists(binPath):
+            print("No point cloud for " + pc_name)
+            continue
+        depthPath = os.path.join(depthDir, pc_name + ".npy")
+        sampleDir = os.path.join(DATA_DIR, pc_name.zfill(2))
+        jobs.append((binPath, os.path.join(sampleDir, pc_name + ".ply"), depthPath if os.path.exists(depthPath) else None,
+            os.path.join(sampleDir, pc_name + ".npy")))
+    return jobs
+
+def runDownstream(chunkIndex, sampleNames, depthCommand, pointCloudCommand, plyExecutor):
+    '''
+    Generates the depth maps, point clouds and .ply files of the samples of a chunk. The depth maps of each chunk are
+    saved in their own directory, so the point clouds are only generated for the depth maps of the chunk.
+    Returns:
+        - seconds spent
+    '''
+    start = time.perf_counter()
+    dataTag = "trainval_" + str(chunkIndex).zfill(3)
+    dataList = saveSplitFile("train2_" + str(chunkIndex).zfill(3) + ".txt", sampleNames)
+
+    print("Generating depth maps of chunk " + str(chunkIndex) + " (" + str(len(sampleNames)) + " samples)...")
+    result = subprocess.run(formatCommand(depthCommand, data_list = dataList, data_tag = dataTag), cwd = PSEUDO_LIDAR_DIR,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    #Print the stdout and stderr
+    print(result.stdout)
+    print(result.stderr)
+    print("Done.")
+    if result.returncode != 0:
+        raise RuntimeError("depth generation of chunk " + str(chunkIndex) + " failed with code " + str(result.returncode))
+
+    depthDir = os.path.join(RESULTS_DIR, "depth_maps", dataTag)
+    pointCloudDir = os.path.join(RESULTS_DIR, "pseudo_lidar_trainval")
+    if not generate_point_cloud(depth_dir = depthDir, save_dir = pointCloudDir, calib_dir = os.path.join(KITTI_TRAINING_DIR, "calib"),
+            cwd = PSEUDO_LIDAR_DIR, command = pointCloudCommand):
+        raise RuntimeError("point cloud generation of chunk " + str(chunkIndex) + " failed")
+
+    convertPointClouds(getPointCloudJobs(sampleNames, pointCloudDir, depthDir), executor = plyExecutor)
+    return time.perf_counter() - start
+
+def prepareDirectories():
+    '''
+    Extracts the dataset and sets up the directories and config files of pseudo_lidar_V2.
+    '''
+    if os.path.exists("GTADataset.zip"):
+        # Create a ZipFile Object and load sample.zip in it
+        with ZipFile('GTADataset.zip', 'r') as zipObj:
+           # Extract all the contents of zip file in different directory
+           zipObj.extractall(ROOT_DIR)
+        # os.remove("GTADataset.zip")
+
+    for _, kittiDir in STEREO_IMAGES:
+        os.makedirs(os.path.join(KITTI_TRAINING_DIR, kittiDir), exist_ok=True)
+    os.makedirs(os.path.join(KITTI_TRAINING_DIR, "calib"), exist_ok=True)
+    os.makedirs(SPLIT_DIR, exist_ok=True)
+
+    configsDir = os.path.join(PSEUDO_LIDAR_DIR, "src/configs")
+    if os.path.exists("sdn_kitti_train.config"):
+        shutil.move("sdn_kitti_train.config", os.path.join(configsDir, "sdn_kitti_train.config"))
+    if not os.path.exists(os.path.join(configsDir, "sdn_kitti_test.config")):
+        shutil.copy(os.path.join(configsDir, "sdn_kitti_train.config"), os.path.join(configsDir, "sdn_kitti_test.config"))
+
+def massGenerate(chunkSize = 500, nThreads = None, nProcesses = None, depthCommand = DEPTH_COMMAND, pointCloudCommand = POINT_CLOUD_COMMAND):
+    '''
+    Runs the pipeline over every sample of the dataset: the conversion of chunk k+1 runs while the downstream
+    commands run for chunk k (in a single thread, so the chunks reach the downstream commands one at a time).
+    Arguments:
+        - chunkSize: number of samples per chunk
+        - nThreads: number of images converted at the same time (None = number of CPUs)
+        - nProcesses: number of point clouds converted to .ply at the same time (None = number of CPUs)
+    Returns:
+        - names of the samples whose point clouds were generated
+    '''
+    if chunkSize <= 0:
+        raise ValueError("the chunk size must be positive, not " + str(chunkSize))
+
+    prepareDirectories()
+
+    sampleNames = sorted(fn for fn in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, fn)))
+    chunks = [sampleNames[i:i + chunkSize] for i in range(0, len(sampleNames), chunkSize)]
+
+    start = time.perf_counter()
+    convertSeconds = 0.0
+    convertedNames = []
+    downstreamFutures = []
+    # the .ply processes are started from the downstream thread while the images are converted, so they are spawned
+    # instead of forked from a process with running threads
+    with ThreadPoolExecutor(max_workers=nThreads) as convertExecutor, ThreadPoolExecutor(max_workers=1) as downstreamExecutor, \
+            ProcessPoolExecutor(max_workers=nProcesses, mp_context=multiprocessing.get_context("spawn")) as plyExecutor:
+        for chunkIndex, chunk in enumerate(chunks):
+            convertStart = time.perf_counter()
+            chunkNames = convertChunk(convertExecutor, chunk)
+            convertSeconds += time.perf_counter() - convertStart
+            print("Converted chunk " + str(chunkIndex) + ": " + str(len(chunkNames)) + " of " + str(len(chunk)) + " samples")
+
+            convertedNames += chunkNames
+            if len(chunkNames) > 0:
+                downstreamFutures.append((chunkIndex, chunkNames, downstreamExecutor.submit(runDownstream, chunkIndex, chunkNames, depthCommand, pointCloudCommand, plyExecutor)))
+
+        # split files of the whole dataset, written once
+        saveSplitFile("train2.txt", convertedNames)
+        saveSplitFile("subval2.txt", convertedNames)
+        if not os.path.exists(os.path.join(SPLIT_DIR, "test2.txt")):
+            saveSplitFile("test2.txt", [])
+
+        generatedNames = []
+        downstreamSeconds = 0.0
+        for chunkIndex, chunkNames, future in downstreamFutures:
+            try:
+                downstreamSeconds += future.result()
+                generatedNames += chunkNames
+            except Exception as e:
+                print("Chunk " + str(chunkIndex) + ": " + str(e))
+
+    elapsed = time.perf_counter() - start
+    print("Generated " + str(len(generatedNames)) + " of " + str(len(sampleNames)) + " samples in " + "%.1f" % elapsed + " s (conversion "
+        + "%.1f" % convertSeconds + " s, depth and point clouds " + "%.1f" % downstreamSeconds + " s)")
+    return generatedNames
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates the pseudo-LiDAR point clouds of the GTA dataset")
+    parser.add_argument("--chunk-size", type=int, default=500, help="number of samples per chunk")
+    parser.add_argument("--threads", type=int, default=None, help="number of images converted at the same time")
+    parser.add_argument("--processes", type=int, default=None, help="number of point clouds converted to .ply at the same time")
+    parser.add_argument("--depth-command", default=DEPTH_COMMAND, help="depth generation command, with {data_list} and {data_tag}")
+    parser.add_argument("--point-cloud-command", default=POINT_CLOUD_COMMAND, help="point cloud generation command, with {calib_dir}, {depth_dir} and {save_dir}")
+    args = parser.parse_args()
+    if args.chunk_size <= 0:
+        parser.error("--chunk-size must be positive")
+
+    massGenerate(args.chunk_size, args.threads, args.processes, args.depth_command, args.point_cloud_command)
+
+    print("Generating zip file...")
+    command = "zip -r " + os.path.join(ROOT_DIR, "GTADataset_res.zip") + " " + DATA_DIR + "/"
+    subprocess.run(command.split(" "))
+    print("Done.")